@@ -0,0 +1,47 @@
+from typing import Any, Dict, List, Optional
+
+# Chunk records are stored next to their parent as "<parent id>#<chunk number>"
+CHUNK_ID_SEPARATOR = "#"
+
+
+def split_embedding_text(text_splitter: Any, text: str) -> List[str]:
+    """
+    Split an embedding text into the chunks embedded for it. Texts within the splitter's chunk
+    size come back as a single chunk.
+    """
+    if text_splitter is None:
+        return [text]
+    return [chunk for chunk in text_splitter.split_text(text) if chunk.strip()] or [text]
+
+
+def chunk_id(parent_id: str, chunk: int) -> str:
+    return f"{parent_id}{CHUNK_ID_SEPARATOR}{chunk}"
+
+
+def parent_id(record_id: str) -> str:
+    return record_id.split(CHUNK_ID_SEPARATOR, 1)[0]
+
+
+def stale_chunk_ids(parent: str, old_chunks: int, new_chunks: int) -> List[str]:
+    """
+    IDs of the chunk records left over when a manifest is updated with fewer chunks than before.
+    """
+    return [chunk_id(parent, chunk) for chunk in range(max(new_chunks, 1), old_chunks)]
+
+
+def chunk_metadata(metadata: Dict[str, Any], parent: str, chunk: int) -> Dict[str, Any]:
+    # Chunks carry the metadata of their parent, so search filters apply to them as well
+    return {**metadata, "parent_id": parent, "chunk": chunk}
+
+
+def collapse_chunk_hits(ids: List[str], distances: Optional[List[float]], scoring: str) -> List[str]:
+    """
+    Collapse ranked chunk hits into unique parent IDs. With max scoring a parent ranks by its best
+    chunk, with mean scoring by the mean distance of its chunks among the hits.
+    """
+    if scoring == "mean" and distances is not None:
+        hits: Dict[str, List[float]] = {}
+        for record_id, distance in zip(ids, distances):
+            hits.setdefault(parent_id(record_id), []).append(distance)
+        return sorted(hits, key=lambda parent: sum(hits[parent]) / len(hits[parent]))
+    return list(dict.fromkeys(parent_id(record_id) for record_id in ids))
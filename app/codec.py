@@ -0,0 +1,72 @@
+import json
+from json import JSONDecodeError
+from typing import Any, Iterator, Union
+
+import yaml
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+# YAML goes through libyaml and JSON through orjson when they are installed, with the pure-Python
+# implementations as fallback
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+    YAML_ACCELERATED = True
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+    YAML_ACCELERATED = False
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_ACCELERATED = orjson is not None
+
+__all__ = ["JSONDecodeError", "JSONResponse", "json_dumps", "json_dumps_bytes", "json_loads", "yaml_dump",
+           "yaml_load", "yaml_load_all"]
+
+
+def yaml_load(stream: Union[str, bytes]) -> Any:
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def yaml_load_all(stream: Union[str, bytes]) -> Iterator[Any]:
+    return yaml.load_all(stream, Loader=SafeLoader)
+
+
+def yaml_dump(data: Any, sort_keys: bool = False) -> str:
+    return yaml.dump(data, Dumper=SafeDumper, sort_keys=sort_keys)
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps_bytes(data: Any, sort_keys: bool = False) -> bytes:
+    """
+    Encode compact UTF-8 JSON. Values orjson rejects, such as integers beyond 64 bits, fall back
+    to the standard library encoder.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(data, option=option)
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys,
+                      default=str).encode("utf-8")
+
+
+def json_dumps(data: Any, sort_keys: bool = False) -> str:
+    return json_dumps_bytes(data, sort_keys).decode("utf-8")
+
+
+class JSONResponse(StarletteJSONResponse):
+    """
+    JSONResponse rendered with json_dumps_bytes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps_bytes(content)
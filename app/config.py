@@ -0,0 +1,72 @@
+import os
+from typing import Dict, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+ENV_PREFIX = "AGENTICDB_"
+
+
+class Settings(BaseModel):
+    """
+    Runtime configuration for the Agentic DB server. Every field can be overridden with an
+    environment variable named after the field, e.g. AGENTICDB_INGEST_BATCH_SIZE.
+    """
+
+    ingest_batch_size: int = Field(500, gt=0, description="Maximum number of documents sent to Chroma in a single add call")
+    executor_workers: int = Field(8, gt=0, description="Number of threads running blocking storage and embedding calls")
+    host: str = Field("0.0.0.0", description="Address the API server listens on")
+    port: int = Field(8000, gt=0, description="Port the API server listens on")
+    workers: int = Field(1, gt=0, description="Number of server processes, more than one needs persistent or server storage")
+    storage_mode: Literal["memory", "persistent", "server"] = Field("memory", description="Keep collections in memory, on disk or in a Chroma server")
+    data_dir: str = Field("./data", description="Directory holding the persistent store, and the ratings and shared state in server mode")
+    chroma_host: str = Field("127.0.0.1", description="Host of the Chroma server in server mode")
+    chroma_port: int = Field(8001, gt=0, description="Port of the Chroma server in server mode")
+    query_cache_size: int = Field(1024, ge=0, description="Number of query embeddings kept in memory, 0 disables the cache")
+    query_cache_ttl_seconds: float = Field(3600, ge=0, description="Lifetime of a cached query embedding, 0 keeps entries until evicted")
+    result_cache_size: int = Field(1024, ge=0, description="Number of serialized search responses kept in memory, 0 disables the cache")
+    result_cache_ttl_seconds: float = Field(300, ge=0, description="Lifetime of a cached search response, 0 keeps entries until evicted or invalidated")
+    search_candidates: int = Field(100, gt=0, description="Number of ranked results kept from the first page of a search for later pages")
+    cursor_cache_size: int = Field(1024, ge=0, description="Number of searches whose ranked results are kept for paging, 0 disables paging")
+    cursor_ttl_seconds: float = Field(600, ge=0, description="Lifetime of a search cursor, 0 keeps cursors until evicted")
+    ratings_flush_interval_seconds: float = Field(1.0, gt=0, description="Interval between flushes of buffered votes to the ratings store")
+    ratings_flush_threshold: int = Field(1000, gt=0, description="Number of ratings with buffered votes that triggers an immediate flush")
+    chunk_scoring: Literal["max", "mean"] = Field("max", description="Rank chunked manifests by their best chunk or by the mean of their chunk hits")
+    embedding_backend: Literal["local", "openai"] = Field("local", description="Embed with Chroma's local model or an OpenAI-compatible endpoint")
+    embedding_model: str = Field("text-embedding-3-small", description="Model requested from the OpenAI-compatible endpoint")
+    embedding_api_base: Optional[str] = Field(None, description="Base URL of the OpenAI-compatible endpoint, defaults to the OpenAI API")
+    embedding_api_key: Optional[str] = Field(None, description="API key of the OpenAI-compatible endpoint, defaults to OPENAI_API_KEY")
+    embedding_batch_size: int = Field(2048, gt=0, description="Maximum number of texts sent in one remote embedding request")
+    embedding_concurrency: int = Field(4, gt=0, description="Maximum number of remote embedding requests in flight")
+    embedding_max_retries: int = Field(5, ge=0, description="Retries of a remote embedding request that hit the rate limit")
+    embedding_retry_base_seconds: float = Field(0.5, ge=0, description="Delay before the first retry, doubled on every further retry")
+    embedding_cache_size: int = Field(100_000, ge=0, description="Number of embeddings kept in the on-disk cache per vector size, 0 disables the cache")
+    embedding_cache_dir: Optional[str] = Field(None, description="Directory of the on-disk embedding cache, defaults to the data directory in persistent mode")
+    integrations: str = Field("", description="Comma-separated optional LangServe routes to mount: joke, cascade")
+    embedding_text_mode: Literal["compact", "full"] = Field("compact", description="Embed a compact projection of each manifest or the whole manifest")
+    log_level: str = Field("INFO", description="Level of the records written to the log")
+    log_format: Literal["text", "json"] = Field("text", description="Write log records as text lines or JSON objects")
+    log_sample_rates: str = Field("", description="Comma-separated route=rate pairs, the share of requests to a route whose records are logged")
+    log_sample_default: float = Field(1.0, ge=0, le=1, description="Share of requests to other routes whose records are logged")
+    timing_header: bool = Field(False, description="Add a Server-Timing header to the responses of requests sent with X-Timing: 1")
+    trace_sample_rate: float = Field(0.0, ge=0, le=1, description="Share of requests whose spans are exported")
+    trace_export_path: Optional[str] = Field(None, description="File receiving the spans of traced requests as OTLP JSON lines")
+    trace_otlp_endpoint: Optional[str] = Field(None, description="Base URL of an OTLP/HTTP collector receiving the spans of traced requests")
+    admin_token: Optional[str] = Field(None, description="Bearer token required by the admin endpoints, which are disabled while it is unset")
+
+
+def load_settings() -> Settings:
+    values = {}
+    for name in Settings.model_fields:
+        env_value = os.getenv(f"{ENV_PREFIX}{name.upper()}")
+        if env_value is not None:
+            values[name] = env_value
+    return Settings(**values)
+
+
+def settings_environment(settings: Settings) -> Dict[str, str]:
+    """
+    Environment variables that load_settings turns back into the given settings, e.g. for worker
+    processes.
+    """
+    return {f"{ENV_PREFIX}{name.upper()}": str(value) for name, value in settings.model_dump().items()
+            if value is not None}
@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.codec import json_dumps, json_loads, yaml_dump, yaml_load
+from app.models import agent
+
+
+def canonical_document(document: str) -> str:
+    """
+    Return a stored document as canonical JSON. Records written before documents were stored as
+    JSON may hold the YAML text they were ingested as; yaml.dump never emits those starting with "{".
+    """
+    if document.startswith("{"):
+        return document
+    return json_dumps(yaml_load(document))
+
+
+def embedding_text(manifest: Dict[str, Any], mode: str = "compact") -> str:
+    """
+    Text embedded for a manifest, independent of the format it was ingested in. The compact mode
+    embeds a semantic projection of the manifest, the full mode the whole manifest as YAML. A
+    manifest without any of the projected fields is embedded in full.
+    """
+    if mode == "compact":
+        text = agent.embedding_text(manifest)
+        if text:
+            return text
+    return yaml_dump(manifest)
+
+
+def document_ratings_id(document: str, metadata: Optional[Dict[str, Any]]) -> str:
+    """
+    Ratings ID of a stored document, read from its metadata without parsing the document.
+    """
+    if metadata and "ratings_id" in metadata:
+        return metadata["ratings_id"]
+    return str(json_loads(document)["metadata"].get("ratings_id"))
+
+
+def json_with_ratings(document: str, ratings: Dict[str, Any]) -> str:
+    """
+    Splice the ratings into a canonical JSON document as its last key, without parsing it.
+    """
+    separator = "," if document != "{}" else ""
+    return document[:-1] + separator + '"ratings":' + json_dumps(ratings) + "}"
+
+
+def manifest_with_ratings(document: str, ratings: Dict[str, Any]) -> Dict[str, Any]:
+    manifest = json_loads(document)
+    manifest["ratings"] = ratings
+    return manifest
+
+
+def json_array(results: List[Tuple[str, Dict[str, Any]]]) -> str:
+    return "[" + ",".join(json_with_ratings(document, ratings) for document, ratings in results) + "]"
+
+
+def yaml_documents(results: List[Tuple[str, Dict[str, Any]]]) -> str:
+    return ("---\n" + "\n---\n".join(yaml_dump(manifest_with_ratings(document, ratings))
+                                       for document, ratings in results)).rstrip()
+
+
+def ndjson_line(document: str, ratings: Dict[str, Any]) -> str:
+    return json_with_ratings(document, ratings) + "\n"
+
+
+def yaml_document(document: str, ratings: Dict[str, Any]) -> str:
+    return "---\n" + yaml_dump(manifest_with_ratings(document, ratings))
@@ -0,0 +1,237 @@
+import hashlib
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+from app.config import Settings
+from app.embeddings import embedding_model_name
+
+# Rows added to a vector file whenever it runs out of slots
+INITIAL_CAPACITY = 1024
+
+
+class EmbeddingCache:
+    """
+    Embeddings kept on disk and keyed by (model name, sha256 of the text). Vectors are stored as
+    float32 rows of a memory-mapped file per vector size, and a SQLite index maps every key to its
+    row. The least recently used entries are evicted once a vector size holds max_entries vectors,
+    and their rows are reused. Lookups only read the index: hits are remembered in memory and
+    written to it before the next eviction or when the cache is closed.
+    """
+
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._vectors: Dict[int, np.memmap] = {}
+        self._clock = itertools.count()
+        # Last use of the entries read since recency was last written to the index, by (model, hash)
+        self._recent: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False,
+                                           isolation_level=None, timeout=30)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " text_hash TEXT NOT NULL,"
+                " dimensions INTEGER NOT NULL,"
+                " slot INTEGER NOT NULL,"
+                " last_used INTEGER NOT NULL,"
+                " PRIMARY KEY (model, text_hash))"
+            )
+            self._connection.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS embeddings_slot ON embeddings (dimensions, slot)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (dimensions, last_used)")
+            last_used = self._connection.execute("SELECT MAX(last_used) FROM embeddings").fetchone()[0]
+            self._clock = itertools.count((last_used or 0) + 1)
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _vector_file(self, dimensions: int, rows: int = 0) -> np.memmap:
+        """
+        Return the vector file of the given size with room for at least the given number of rows,
+        growing it by doubling.
+        """
+        vectors = self._vectors.get(dimensions)
+        if vectors is not None and vectors.shape[0] >= rows:
+            return vectors
+        path = os.path.join(self.directory, f"vectors-{dimensions}.f32")
+        existing_rows = os.path.getsize(path) // (4 * dimensions) if os.path.exists(path) else 0
+        capacity = max(existing_rows, INITIAL_CAPACITY)
+        while capacity < rows:
+            capacity *= 2
+        if vectors is not None:
+            vectors.flush()
+        with open(path, "ab") as file:
+            file.truncate(capacity * 4 * dimensions)
+        vectors = self._vectors[dimensions] = np.memmap(path, dtype=np.float32, mode="r+",
+                                                        shape=(capacity, dimensions))
+        return vectors
+
+    def get_many(self, model: str, hashes: List[str]) -> List[Optional[List[float]]]:
+        """
+        Return the cached embedding of every text hash, or None for the misses.
+        """
+        found: Dict[str, tuple] = {}
+        with self._lock:
+            for start in range(0, len(hashes), 900):
+                chunk = hashes[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                for text_hash, dimensions, slot in self._connection.execute(
+                        f"SELECT text_hash, dimensions, slot FROM embeddings"
+                        f" WHERE model = ? AND text_hash IN ({placeholders})", [model, *chunk]):
+                    found[text_hash] = (dimensions, slot)
+            if found:
+                tick = next(self._clock)
+                for text_hash in found:
+                    self._recent[(model, text_hash)] = tick
+            embeddings = []
+            for text_hash in hashes:
+                entry = found.get(text_hash)
+                # Another process may have grown the file since it was mapped
+                embeddings.append(self._vector_file(entry[0], entry[1] + 1)[entry[1]].tolist() if entry else None)
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return embeddings
+
+    def put_many(self, model: str, hashes: List[str], embeddings: Embeddings) -> None:
+        """
+        Store embeddings, evicting the least recently used entries of the same vector size when
+        the cache is full.
+        """
+        entries = dict(zip(hashes, embeddings))
+        if self.max_entries <= 0 or not entries:
+            return
+        with self._lock:
+            tick = next(self._clock)
+            # Takes the write lock up front, as worker processes sharing the cache allocate slots too
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Evictions must see the entries read since the last write
+                self._write_recency()
+                for text_hash, embedding in list(entries.items())[-self.max_entries:]:
+                    vector = np.asarray(embedding, dtype=np.float32)
+                    dimensions = vector.shape[0]
+                    row = self._connection.execute(
+                        "SELECT slot FROM embeddings WHERE model = ? AND text_hash = ?", (model, text_hash)).fetchone()
+                    if row is None:
+                        row = self._free_slot(dimensions)
+                        self._connection.execute(
+                            "INSERT INTO embeddings (model, text_hash, dimensions, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                            (model, text_hash, dimensions, row[0], tick))
+                    # Other processes map the same pages, so the rows are visible to them without a flush
+                    self._vector_file(dimensions, row[0] + 1)[row[0]] = vector
+                self._connection.execute("COMMIT")
+                self._recent.clear()
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _write_recency(self) -> None:
+        if self._recent:
+            self._connection.executemany(
+                "UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE model = ? AND text_hash = ?",
+                [(tick, model, text_hash) for (model, text_hash), tick in self._recent.items()])
+
+    def _free_slot(self, dimensions: int) -> tuple:
+        count = self._connection.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE dimensions = ?", (dimensions,)).fetchone()[0]
+        if count < self.max_entries:
+            # Slots are only freed by eviction, which reuses them right away, so the used slots are
+            # always the first ones
+            return (count,)
+        oldest = self._connection.execute(
+            "SELECT model, text_hash, slot FROM embeddings WHERE dimensions = ? ORDER BY last_used, slot LIMIT 1",
+            (dimensions,)).fetchone()
+        self._connection.execute("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", oldest[:2])
+        return (oldest[2],)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self),
+            "max_size": self.max_entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                if self._recent:
+                    with self._connection:
+                        self._connection.execute("BEGIN IMMEDIATE")
+                        self._write_recency()
+                self._recent.clear()
+            except sqlite3.Error as e:
+                # Only the eviction order suffers
+                logging.warning("Failed to save embedding cache recency: %s", e)
+            for vectors in self._vectors.values():
+                vectors.flush()
+            self._vectors.clear()
+            self._connection.close()
+
+
+def embedding_cache_directory(settings: Settings) -> Optional[str]:
+    """
+    Directory of the embedding cache. Without an explicit directory the cache lives in the data
+    directory of the persistent or server store and is disabled for the in-memory store.
+    """
+    if settings.embedding_cache_size <= 0:
+        return None
+    if settings.embedding_cache_dir:
+        return os.path.abspath(settings.embedding_cache_dir)
+    if settings.storage_mode != "memory":
+        return os.path.join(os.path.abspath(settings.data_dir), "embedding-cache")
+    return None
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embedding function answering from an EmbeddingCache and embedding only the misses, in one
+    call to the wrapped function.
+    """
+
+    def __init__(self, embedding_function: Any, cache: EmbeddingCache):
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.model_name = embedding_model_name(embedding_function)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        hashes = [self.cache.text_hash(text) for text in input]
+        embeddings = self.cache.get_many(self.model_name, hashes)
+        misses = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if misses:
+            computed = self.embedding_function([input[index] for index in misses])
+            for index, embedding in zip(misses, computed):
+                # Rounded like the cached copy, so hits and misses return the same vectors
+                embeddings[index] = np.asarray(embedding, dtype=np.float32).tolist()
+            try:
+                self.cache.put_many(self.model_name, [hashes[index] for index in misses], computed)
+            except sqlite3.Error as e:
+                # The embeddings are still returned, they are only computed again next time
+                logging.warning("Failed to cache embeddings: %s", e)
+        return embeddings
+
+    def close(self) -> None:
+        self.cache.close()
+        if hasattr(self.embedding_function, "close"):
+            self.embedding_function.close()
@@ -0,0 +1,137 @@
+import logging
+import os
+import random
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+from app.config import Settings
+from app.metrics import EMBED_SECONDS
+
+
+class EmbeddingRateLimitError(Exception):
+    """
+    Raised when an embedding request still hits the provider's rate limit after all retries.
+    retry_after is the provider's Retry-After header, if it sent one.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def get_default_embedding_function() -> Any:
+    """
+    Chroma's local ONNX all-MiniLM-L6-v2 model, used when no other embedding function is configured.
+    """
+    from chromadb.utils import embedding_functions
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+class RemoteEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embeds texts with an OpenAI-compatible embeddings endpoint. Inputs are split into requests of
+    at most batch_size texts, which are sent with at most concurrency requests in flight. Requests
+    hitting the rate limit are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, model_name: str, api_key: Optional[str] = None, api_base: Optional[str] = None,
+                 batch_size: int = 2048, concurrency: int = 4, max_retries: int = 5,
+                 retry_base_seconds: float = 0.5):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        # The OpenAI client is only imported when the remote backend is configured
+        import openai
+        # Retries are handled here, so that they are counted and backed off in one place
+        self._client = openai.OpenAI(api_key=api_key, base_url=api_base, max_retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="agenticdb-embedding")
+
+    def __call__(self, input: Documents) -> Embeddings:
+        batches = [list(input[start:start + self.batch_size]) for start in range(0, len(input), self.batch_size)]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+        embeddings: Embeddings = []
+        for batch_embeddings in self._executor.map(self._embed_batch, batches):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _embed_batch(self, texts: List[str]) -> Embeddings:
+        import openai
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._client.embeddings.create(model=self.model_name, input=texts)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except openai.RateLimitError as e:
+                if attempt == self.max_retries:
+                    retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+                    raise EmbeddingRateLimitError(str(e), retry_after) from e
+                delay = self.retry_base_seconds * 2 ** attempt * (0.5 + random.random())
+                logging.warning("Embedding rate limit hit, retrying in %.2fs", delay)
+                time.sleep(delay)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._client.close()
+
+
+def retry_after_headers(error: EmbeddingRateLimitError) -> Optional[dict]:
+    """
+    Pass the provider's Retry-After header on to clients whose request ran out of retries.
+    """
+    return {"Retry-After": error.retry_after} if error.retry_after else None
+
+
+def create_embedding_function(settings: Settings) -> Any:
+    """
+    Create the embedding function of the configured backend.
+    """
+    if settings.embedding_backend == "openai":
+        return RemoteEmbeddingFunction(settings.embedding_model,
+                                       api_key=settings.embedding_api_key or os.environ.get("OPENAI_API_KEY"),
+                                       api_base=settings.embedding_api_base,
+                                       batch_size=settings.embedding_batch_size,
+                                       concurrency=settings.embedding_concurrency,
+                                       max_retries=settings.embedding_max_retries,
+                                       retry_base_seconds=settings.embedding_retry_base_seconds)
+    return get_default_embedding_function()
+
+
+def embedding_model_name(embedding_function: Any) -> str:
+    for attribute in ("MODEL_NAME", "_model_name", "model_name"):
+        name = getattr(embedding_function, attribute, None)
+        if isinstance(name, str):
+            return name
+    # Wrappers such as the embedding cache delegate to the function doing the work
+    inner = getattr(embedding_function, "embedding_function", None)
+    if inner is not None:
+        return embedding_model_name(inner)
+    return type(embedding_function).__name__
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a query used both as the cache key and as the text that gets embedded, so
+    queries differing only in whitespace or Unicode composition share one embedding.
+    """
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+async def embed_query(app_state: Any, query: str) -> List[float]:
+    """
+    Embed a search query, reusing the cached embedding for repeated queries. Misses are embedded
+    on the storage executor.
+    """
+    text = normalize_query(query)
+    key = (embedding_model_name(app_state.embedding_function), text)
+    embedding = app_state.query_embedding_cache.get(key)
+    if embedding is None:
+        with EMBED_SECONDS.time():
+            embeddings = await app_state.run(app_state.embedding_function, [text])
+        embedding = embeddings[0]
+        app_state.query_embedding_cache.put(key, embedding)
+    return embedding
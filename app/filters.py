@@ -0,0 +1,56 @@
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, Field
+
+# Filterable field -> (manifest section, key) it is copied from at ingest time
+FILTER_FIELDS = {
+    "namespace": ("metadata", "namespace"),
+    "category": ("spec", "category"),
+    "lifecycle": ("spec", "lifecycle"),
+    "access_level": ("spec", "access_level"),
+    "owner": ("spec", "owner"),
+}
+
+
+class SearchFilters(BaseModel):
+    """
+    Exact-match filters on manifest fields, applied by Chroma inside the similarity search.
+    """
+
+    namespace: Optional[str] = Field(None, description="Namespace the manifest belongs to")
+    category: Optional[str] = Field(None, description="Category of the agent or application")
+    lifecycle: Optional[str] = Field(None, description="Lifecycle stage, e.g. stable or experimental")
+    access_level: Optional[str] = Field(None, description="Access level, e.g. PUBLIC or PRIVATE")
+    owner: Optional[str] = Field(None, description="Email of the owner")
+
+    def active(self) -> Dict[str, str]:
+        return {name: value for name, value in self.model_dump().items() if value is not None}
+
+    def where(self) -> Optional[Dict[str, Any]]:
+        """
+        Build the Chroma where clause, or None when no filter is set.
+        """
+        conditions = [{name: value} for name, value in self.active().items()]
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+
+    def cache_key(self) -> tuple:
+        return tuple(sorted(self.active().items()))
+
+
+def filter_metadata(manifest: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Copy the filterable fields of a parsed manifest into flat Chroma metadata. Missing or
+    non-scalar values are left out.
+    """
+    metadata = {}
+    for name, (section, key) in FILTER_FIELDS.items():
+        fields = manifest.get(section)
+        value = fields.get(key) if isinstance(fields, dict) else None
+        if isinstance(value, (str, int, float, bool)):
+            metadata[name] = str(value)
+    return metadata
+
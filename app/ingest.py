@@ -0,0 +1,155 @@
+import datetime
+import hashlib
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.chunking import chunk_id, chunk_metadata, parent_id, split_embedding_text, stale_chunk_ids
+from app.codec import json_dumps_bytes
+from app.embeddings import embedding_model_name
+from app.metrics import DOCUMENTS_INGESTED, EMBED_SECONDS, STORAGE_WRITE_SECONDS
+
+# Namespace of the IDs derived from the namespace and name of a manifest
+REGISTRY_NAMESPACE = uuid.UUID("6f1c1f4e-55a4-4a8e-9c53-1a0ab3e3b7d2")
+
+# Statuses returned by write_batch for records that were written to the collection
+WRITTEN_STATUSES = ("created", "updated")
+
+
+class IngestRecord(BaseModel):
+    """
+    A single manifest ready to be written to its collection together with its ratings.
+    """
+
+    index: int = Field(..., description="Position of the document in the request")
+    id: str = Field(..., description="ID of the agent or application")
+    ratings_id: str = Field(..., description="ID of the ratings entry")
+    document: str = Field(..., description="Manifest as canonical JSON")
+    embedding_text: str = Field(..., description="Text the manifest embedding is computed from")
+    metadata: Dict[str, Any] = Field(..., description="Chroma metadata for the manifest")
+
+
+def utc_timestamp() -> str:
+    return datetime.datetime.now(datetime.UTC).isoformat(timespec='milliseconds') + 'Z'
+
+
+def registration_ids(manifest: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Return the record and ratings IDs of a manifest. They are derived from its namespace and name,
+    so registering the same agent again maps to the same record. Manifests without a name get
+    random IDs.
+    """
+    name = manifest["metadata"].get("name")
+    if name is None:
+        return str(uuid.uuid4()), str(uuid.uuid4())
+    record_id = uuid.uuid5(REGISTRY_NAMESPACE, f"{manifest['metadata'].get('namespace') or ''}/{name}")
+    return str(record_id), str(uuid.uuid5(record_id, "ratings"))
+
+
+def content_hash(manifest: Dict[str, Any]) -> str:
+    # Keys are sorted, so the hash does not depend on the key order of the ingested document
+    return hashlib.sha256(json_dumps_bytes(manifest, sort_keys=True)).hexdigest()
+
+
+def embedding_hash(model_name: str, text: str) -> str:
+    # A manifest embedded from another text or by another model has to be embedded again
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def validate_document(document: Any) -> Optional[str]:
+    """
+    Return the reason a parsed document cannot be ingested, or None if it is valid.
+    """
+    if not isinstance(document, dict):
+        return "Document is not a mapping"
+    if not isinstance(document.get("metadata"), dict):
+        return "Metadata not found in content"
+    if document.get("spec") is not None and not isinstance(document["spec"], dict):
+        return "Spec is not a mapping"
+    return None
+
+
+def effective_batch_size(db_client: Any, batch_size: int) -> int:
+    """
+    Clamp the requested batch size to the largest batch the Chroma client accepts.
+    """
+    try:
+        return max(1, min(batch_size, db_client.get_max_batch_size()))
+    except AttributeError:
+        return max(1, batch_size)
+
+
+def iter_batches(records: List[IngestRecord], batch_size: int) -> Iterator[List[IngestRecord]]:
+    for start in range(0, len(records), batch_size):
+        yield records[start:start + batch_size]
+
+
+def write_batch(collection: Any, ratings_db: Any, records: List[IngestRecord], parent_key: str,
+                embedding_function: Callable, text_splitter: Any = None) -> List[str]:
+    """
+    Upsert a batch of manifests, embedding only new and changed ones, and return the status of
+    every record: created, updated, unchanged, or duplicate when a later record has the same ID.
+    """
+    latest = {record.id: record for record in records}
+    existing = collection.get(ids=list(latest), include=["metadatas"])
+    existing_metadata = dict(zip(existing["ids"], existing["metadatas"]))
+
+    model_name = embedding_model_name(embedding_function)
+    statuses: Dict[str, str] = {}
+    writes: List[IngestRecord] = []
+    for record_id, record in latest.items():
+        record.metadata["embedding_hash"] = embedding_hash(model_name, record.embedding_text)
+        metadata = existing_metadata.get(record_id)
+        if metadata is None:
+            statuses[record_id] = "created"
+        elif ("content_hash" in metadata and metadata["content_hash"] == record.metadata.get("content_hash")
+              and metadata.get("embedding_hash") == record.metadata["embedding_hash"]):
+            statuses[record_id] = "unchanged"
+            continue
+        else:
+            statuses[record_id] = "updated"
+            record.metadata["version"] = int(metadata.get("version", 1)) + 1
+        writes.append(record)
+
+    ids, texts, documents, metadatas, stale_ids = [], [], [], [], []
+    for record in writes:
+        chunks = split_embedding_text(text_splitter, record.embedding_text)
+        record.metadata["chunks"] = len(chunks)
+        ids.append(record.id)
+        texts.append(chunks[0])
+        documents.append(record.document)
+        metadatas.append(record.metadata)
+        for chunk, text in enumerate(chunks[1:], 1):
+            ids.append(chunk_id(record.id, chunk))
+            texts.append(text)
+            documents.append(text)
+            metadatas.append(chunk_metadata(record.metadata, record.id, chunk))
+        if record.id in existing_metadata:
+            stale_ids.extend(stale_chunk_ids(record.id, int(existing_metadata[record.id].get("chunks", 1)),
+                                             len(chunks)))
+
+    if ids:
+        with EMBED_SECONDS.time():
+            embeddings = embedding_function(texts)
+        with STORAGE_WRITE_SECONDS.time():
+            collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    if stale_ids:
+        with STORAGE_WRITE_SECONDS.time():
+            collection.delete(ids=stale_ids)
+    created = [record for record in writes if statuses[record.id] == "created"]
+    if created:
+        try:
+            # Every record of a request is stamped with the same timestamp
+            with STORAGE_WRITE_SECONDS.time():
+                ratings_db.add(ids=[record.ratings_id for record in created], parent_key=parent_key,
+                               parent_ids=[record.id for record in created],
+                               timestamp=created[0].metadata.get("timestamp"))
+        except Exception:
+            created_ids = {record.id for record in created}
+            collection.delete(ids=[record_id for record_id in ids if parent_id(record_id) in created_ids])
+            raise
+    for status, count in Counter(statuses.values()).items():
+        DOCUMENTS_INGESTED.labels(collection.name, status).inc(count)
+    return [statuses[record.id] if latest[record.id] is record else "duplicate" for record in records]
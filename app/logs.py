@@ -0,0 +1,170 @@
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from app.codec import json_dumps
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# The ASGI scope of the request being handled, so that log records know their route
+REQUEST_SCOPE: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_scope", default=None)
+
+# Key of the sampling decision cached in the ASGI scope
+SAMPLED_KEY = "agenticdb.log_sampled"
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+_previous_level: Optional[int] = None
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """
+    Parse comma-separated route=rate pairs, e.g. "/agents=0.01,/ratings=0.1".
+    """
+    rates = {}
+    for pair in [pair.strip() for pair in value.split(",") if pair.strip()]:
+        route, _, rate = pair.rpartition("=")
+        if not route or not 0 <= float(rate) <= 1:
+            raise ValueError(f"Invalid log sample rate: {pair}")
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+class RouteSamplingFilter(logging.Filter):
+    """
+    Keep the records of a sampled share of the requests to each route template. The decision is
+    made once per request, so a kept request keeps all its lines. Warnings and errors, and records
+    logged outside a request, are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float], default_rate: float = 1.0):
+        super().__init__()
+        self.rates = rates
+        self.default_rate = default_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        scope = REQUEST_SCOPE.get()
+        if scope is None:
+            return True
+        route = scope.get("route")
+        record.route = route.path if route is not None else scope.get("path")
+        if record.levelno >= logging.WARNING:
+            return True
+        sampled = scope.get(SAMPLED_KEY)
+        if sampled is None:
+            rate = self.rates.get(record.route, self.default_rate)
+            sampled = rate >= 1 or random.random() < rate
+            # Before routing the template is unknown, so the decision is only kept once it is
+            if route is not None:
+                scope[SAMPLED_KEY] = sampled
+        return sampled
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves the message unformatted, so that %-style arguments are only formatted
+    by the listener thread. Only tracebacks are rendered up front, as their frames would be gone.
+    """
+
+    def __init__(self, log_queue: Any):
+        super().__init__(log_queue)
+        self._formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as text lines or JSON objects. The route of the request and the fields passed
+    with extra={"fields": {...}} are appended as key=value pairs or included as JSON keys.
+    """
+
+    def __init__(self, log_format: str = "text"):
+        super().__init__(TEXT_FORMAT)
+        self.log_format = log_format
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = dict(getattr(record, "fields", None) or {})
+        route = getattr(record, "route", None)
+        if route is not None:
+            fields = {"route": route, **fields}
+        if self.log_format == "json":
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields,
+            }
+            if record.exc_text or record.exc_info:
+                entry["exception"] = record.exc_text or self.formatException(record.exc_info)
+            return json_dumps(entry)
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class RequestLogContextMiddleware:
+    """
+    ASGI middleware making the scope of the current request available to the logging filter.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = REQUEST_SCOPE.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            REQUEST_SCOPE.reset(token)
+
+
+def configure_logging(settings: Any) -> bool:
+    """
+    Route the records of the root logger through a queue to a stream handler on a listener thread,
+    so that logging on the event loop never waits for formatting or I/O. Returns False when logging
+    was already configured, e.g. by the server entry point.
+    """
+    global _listener, _handler, _previous_level
+    if _listener is not None:
+        return False
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(StructuredFormatter(settings.log_format))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _handler = LazyQueueHandler(log_queue)
+    _handler.addFilter(RouteSamplingFilter(parse_sample_rates(settings.log_sample_rates),
+                                           settings.log_sample_default))
+    root = logging.getLogger()
+    _previous_level = root.level
+    root.setLevel(settings.log_level)
+    root.addHandler(_handler)
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    return True
+
+
+def shutdown_logging() -> None:
+    """
+    Write the queued records and restore the root logger.
+    """
+    global _listener, _handler, _previous_level
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_handler)
+    root.setLevel(_previous_level)
+    _listener.stop()
+    _listener = _handler = _previous_level = None
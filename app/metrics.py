@@ -0,0 +1,282 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.tracing import span
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Sharded:
+    """
+    Values kept in one list per thread, summed when they are exposed. Each thread only ever writes
+    its own list, so recording takes no lock. The lock is only taken when a thread records its first
+    value and when the values are read.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> List[float]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = [0] * self._size
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(values) for values in zip(*shards)] if shards else [0] * self._size
+
+
+class Counter(_Sharded):
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1) -> None:
+        self._shard()[0] += amount
+
+    def value(self) -> float:
+        return self.totals()[0]
+
+
+class Histogram(_Sharded):
+    """
+    Observations counted per bucket, plus their sum. The last two slots of a shard hold the +Inf
+    bucket and the sum.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(len(buckets) + 2)
+        self.buckets = buckets
+
+    def observe(self, value: float) -> None:
+        values = self._shard()
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+
+class Timer:
+    """
+    Context manager observing the seconds spent in its block.
+    """
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class StageHistogram(Histogram):
+    """
+    Histogram of a request stage. Its timed blocks are also recorded as spans of the traced request.
+    """
+
+    def __init__(self, stage: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(buckets)
+        self.stage = stage
+
+    def time(self) -> "StageTimer":
+        return StageTimer(self)
+
+
+class StageTimer(Timer):
+
+    __slots__ = ("span",)
+
+    def __enter__(self) -> "StageTimer":
+        self.span = span(self.histogram.stage).__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+        self.span.__exit__(*exc_info)
+
+
+class Family:
+    """
+    A metric with labels. Children are created once per label values by calling the factory with
+    them, and are meant to be looked up outside the hot path, e.g. at import time.
+    """
+
+    def __init__(self, name: str, help_text: str, metric_type: str, label_names: Tuple[str, ...], factory: Any):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = label_names
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory(*values))
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class Registry:
+
+    def __init__(self):
+        self.families: List[Family] = []
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Family:
+        return self._register(Family(name, help_text, "counter", label_names, lambda *values: Counter()))
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                  factory: Optional[Callable[..., Histogram]] = None) -> Family:
+        return self._register(Family(name, help_text, "histogram", label_names,
+                                     factory or (lambda *values: Histogram(buckets))))
+
+    def _register(self, family: Family) -> Family:
+        self.families.append(family)
+        return family
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for family in self.families:
+            lines.extend(family_lines(family))
+        return "\n".join(lines) + "\n"
+
+
+def label_text(names: Iterable[str], values: Iterable[Any]) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(name + '="' + escaped + '"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def family_lines(family: Family) -> List[str]:
+    lines = ["# HELP " + family.name + " " + family.help_text, "# TYPE " + family.name + " " + family.metric_type]
+    for values, child in family.children():
+        if family.metric_type == "histogram":
+            totals = child.totals()
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float("inf"),), totals[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(family.name + "_bucket" + label_text(family.label_names + ("le",), values + (le,)) + " " +
+                             format_value(cumulative))
+            lines.append(family.name + "_sum" + label_text(family.label_names, values) + " " + format_value(totals[-1]))
+            lines.append(family.name + "_count" + label_text(family.label_names, values) + " " +
+                         format_value(cumulative))
+        else:
+            lines.append(family.name + label_text(family.label_names, values) + " " + format_value(child.value()))
+    return lines
+
+
+def sample_lines(name: str, help_text: str, metric_type: str, label_names: Tuple[str, ...],
+                 samples: List[Tuple[Tuple[Any, ...], float]]) -> List[str]:
+    """
+    Exposition lines of a metric whose values are read when the metrics are scraped.
+    """
+    lines = ["# HELP " + name + " " + help_text, "# TYPE " + name + " " + metric_type]
+    for values, value in samples:
+        lines.append(name + label_text(label_names, values) + " " + format_value(value))
+    return lines
+
+
+def state_metric_lines(app_state: Any) -> List[str]:
+    """
+    Collection sizes and cache counters, read from the app state when the metrics are scraped.
+    """
+    sizes = [((name,), collection.count()) for name, collection in
+             (("agents", app_state.agents_db), ("applications", app_state.applications_db),
+              ("ratings", app_state.ratings_db)) if collection is not None]
+    caches = [(name, cache.stats()) for name, cache in
+              (("query_embeddings", app_state.query_embedding_cache), ("results", app_state.result_cache),
+               ("cursors", app_state.cursor_cache), ("embeddings", app_state.embedding_cache)) if cache is not None]
+    lines = sample_lines("agenticdb_collection_records", "Records stored per collection", "gauge",
+                         ("collection",), sizes)
+    for suffix, help_text, metric_type, key in (
+            ("hits_total", "Cache hits", "counter", "hits"),
+            ("misses_total", "Cache misses", "counter", "misses"),
+            ("hit_ratio", "Share of cache lookups that hit", "gauge", "hit_rate"),
+            ("entries", "Entries held per cache", "gauge", "size")):
+        lines.extend(sample_lines("agenticdb_cache_" + suffix, help_text, metric_type, ("cache",),
+                                  [((name,), stats[key]) for name, stats in caches]))
+    return lines
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram("agenticdb_request_duration_seconds", "Latency of HTTP requests by route",
+                                     ("method", "route"))
+REQUESTS = REGISTRY.counter("agenticdb_requests_total", "HTTP requests by route and status",
+                            ("method", "route", "status"))
+STAGE_SECONDS = REGISTRY.histogram("agenticdb_stage_duration_seconds",
+                                   "Latency of the internal stages of a request", ("stage",), factory=StageHistogram)
+DOCUMENTS_INGESTED = REGISTRY.counter("agenticdb_documents_ingested_total",
+                                      "Documents ingested by collection and outcome", ("collection", "status"))
+
+# Stage histograms are looked up once, so timing a stage costs no dictionary lookup
+PARSE_SECONDS = STAGE_SECONDS.labels("parse")
+EMBED_SECONDS = STAGE_SECONDS.labels("embed")
+VECTOR_QUERY_SECONDS = STAGE_SECONDS.labels("vector_query")
+RATINGS_JOIN_SECONDS = STAGE_SECONDS.labels("ratings_join")
+SERIALIZE_SECONDS = STAGE_SECONDS.labels("serialize")
+STORAGE_WRITE_SECONDS = STAGE_SECONDS.labels("storage_write")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and status of every HTTP request by route template, so
+    that /agents/{id}-style paths share one series. Streaming responses are timed until their
+    last chunk is sent.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], path).observe(time.perf_counter() - start)
+            REQUESTS.labels(scope["method"], path, str(status[0])).inc()
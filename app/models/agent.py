@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 
 class Metadata(BaseModel):
@@ -189,3 +189,26 @@ class Agent(BaseModel):
                 }
             }
         }
+
+
+def embedding_text(manifest: Dict[str, Any]) -> str:
+    """
+    Compact text embedded for an agent manifest: its name, description and category followed by
+    the names and descriptions of its parameters, laid out as in the Agent model. URLs, owners,
+    IDs and schema boilerplate are left out. Missing fields are skipped, so partial manifests can
+    still be embedded.
+    """
+    metadata = manifest.get("metadata")
+    metadata = metadata if isinstance(metadata, dict) else {}
+    spec = manifest.get("spec")
+    spec = spec if isinstance(spec, dict) else {}
+    lines: List[str] = [str(metadata[field]).strip() for field in ("name", "description") if metadata.get(field)]
+    if spec.get("category"):
+        lines.append(f"Category: {spec['category']}")
+    parameters = spec.get("parameters") or {}
+    properties = parameters.get("properties") if isinstance(parameters, dict) else None
+    if isinstance(properties, dict):
+        for name, prop in properties.items():
+            description = prop.get("description") if isinstance(prop, dict) else None
+            lines.append(f"{name}: {description}" if description else str(name))
+    return "\n".join(lines)
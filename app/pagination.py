@@ -0,0 +1,183 @@
+import logging
+import secrets
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.chunking import collapse_chunk_hits
+from app.documents import canonical_document, document_ratings_id
+from app.embeddings import embed_query, normalize_query
+from app.filters import SearchFilters
+from app.metrics import RATINGS_JOIN_SECONDS, SERIALIZE_SECONDS, VECTOR_QUERY_SECONDS
+from app.routes.ratings import fetch_ratings
+from app.storage import COLLECTIONS
+from app.tracing import span
+
+MAX_SEARCH_LIMIT = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(search_id: str, offset: int) -> str:
+    return f"{search_id}.{offset}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        search_id, offset = cursor.rsplit(".", 1)
+        return search_id, int(offset)
+    except ValueError:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid cursor")
+
+
+def fetch_documents(collection: Any, ids: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Fetch the canonical JSON documents and metadata for the given IDs in one call, in the order of
+    the IDs. IDs deleted since they were ranked are skipped.
+    """
+    if not ids:
+        return []
+    results = collection.get(ids=ids, include=["documents", "metadatas"])
+    documents_by_id = {record_id: (canonical_document(document), metadata)
+                       for record_id, document, metadata in zip(results["ids"], results["documents"],
+                                                                results["metadatas"])}
+    return [documents_by_id[record_id] for record_id in ids if record_id in documents_by_id]
+
+
+def rank_candidates(collection: Any, query_embedding: List[float], where: Optional[dict], candidates: int,
+                    scoring: str) -> List[str]:
+    """
+    Rank up to the given number of manifest IDs. Chunk hits are collapsed into their manifests,
+    and while that leaves fewer than wanted the search is repeated with twice as many results.
+    """
+    n_results = candidates
+    while True:
+        with VECTOR_QUERY_SECONDS.time():
+            results = collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where,
+                                       include=["distances"])
+        ids = results["ids"][0]
+        ranked_ids = collapse_chunk_hits(ids, results["distances"][0], scoring)
+        if len(ranked_ids) >= candidates or len(ids) < n_results:
+            return ranked_ids[:candidates]
+        n_results *= 2
+
+
+async def rank_page(app_state: Any, collection_name: str, query: Optional[str], filters: SearchFilters, limit: int,
+                    cursor: Optional[str]) -> Tuple[List[str], Optional[str]]:
+    """
+    Return the IDs of one page of search results together with the cursor of the next page, if
+    any. The first page ranks up to settings.search_candidates IDs and keeps them in the cursor
+    cache, so later pages only fetch their documents and never embed or search again.
+    """
+    collection = getattr(app_state, COLLECTIONS[collection_name])
+    if cursor is None:
+        query_embedding = await embed_query(app_state, query)
+        candidate_ids = await app_state.run(rank_candidates, collection, query_embedding, filters.where(),
+                                            max(limit, app_state.settings.search_candidates),
+                                            app_state.settings.chunk_scoring)
+        search_id, offset = None, 0
+        if len(candidate_ids) > limit:
+            search_id = secrets.token_urlsafe(16)
+            await app_state.put_cursor(search_id, (collection_name, candidate_ids))
+    else:
+        search_id, offset = decode_cursor(cursor)
+        entry = await app_state.get_cursor(search_id)
+        if entry is None or entry[0] != collection_name or offset < 0:
+            logging.error("Unknown or expired cursor for %s", collection_name)
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid or expired cursor")
+        candidate_ids = entry[1]
+
+    page_ids = candidate_ids[offset:offset + limit]
+    next_offset = offset + limit
+    next_cursor = encode_cursor(search_id, next_offset) if search_id and next_offset < len(candidate_ids) else None
+    return page_ids, next_cursor
+
+
+async def search_page(app_state: Any, collection_name: str, query: Optional[str], filters: SearchFilters, limit: int,
+                      cursor: Optional[str]) -> Tuple[List[Tuple[str, Dict[str, Any]]], Optional[str]]:
+    """
+    Return one page of search results as canonical JSON documents with their metadata, together
+    with the cursor of the next page, if any.
+    """
+    page_ids, next_cursor = await rank_page(app_state, collection_name, query, filters, limit, cursor)
+    collection = getattr(app_state, COLLECTIONS[collection_name])
+    documents = await app_state.run(fetch_documents, collection, page_ids)
+    return documents, next_cursor
+
+
+async def cached_search_response(app_state: Any, cache_key: tuple) -> Optional[Response]:
+    """
+    Return the cached first page of a search, or None if it is not cached or its cursor expired.
+    """
+    cached_response = app_state.result_cache.get(cache_key)
+    if cached_response is None:
+        return None
+    content, media_type, next_cursor = cached_response
+    if next_cursor is not None and await app_state.get_cursor(decode_cursor(next_cursor)[0]) is None:
+        return None
+    response = Response(content=content, media_type=media_type)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+
+def finish_search_response(app_state: Any, cache_key: Optional[tuple], response: Response,
+                           next_cursor: Optional[str]) -> Response:
+    """
+    Attach the next page cursor to a search response and cache it if it is a first page.
+    """
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if cache_key is not None:
+        app_state.result_cache.put(cache_key, (response.body, response.media_type, next_cursor))
+    return response
+
+
+async def attach_ratings(app_state: Any, results: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Pair each fetched document with its ratings, loaded in one batch. The ratings IDs are read from
+    the metadata, so the documents are not parsed.
+    """
+    ratings_ids = [document_ratings_id(document, metadata) for document, metadata in results]
+    with RATINGS_JOIN_SECONDS.time():
+        ratings_by_id = await app_state.run(fetch_ratings, app_state, ratings_ids)
+    return [(document, ratings_by_id[ratings_id]) for (document, _), ratings_id in zip(results, ratings_ids)]
+
+
+async def search_response(app_state: Any, collection_name: str, query: Optional[str], filters: SearchFilters,
+                          limit: int, cursor: Optional[str], serialize: Callable[[List[Tuple[str, Dict[str, Any]]]], str],
+                          media_type: str) -> Response:
+    """
+    Search one page of results, join their ratings and serialize them, answering first pages from
+    the result cache when possible.
+    """
+    # Only first pages are cached, later pages are served from the cursor cache
+    cache_key = None
+    if cursor is None:
+        # Generations are read before searching, so results racing with a write are never served again
+        cache_key = await app_state.result_cache_key(collection_name, normalize_query(query), filters.cache_key(),
+                                                     limit, media_type)
+        cached_response = await cached_search_response(app_state, cache_key)
+        if cached_response is not None:
+            return cached_response
+
+    try:
+        # Chroma applies the metadata filter inside the search, so every result matches it
+        with span("search", collection=collection_name, limit=limit):
+            results, next_cursor = await search_page(app_state, collection_name, query, filters, limit, cursor)
+        logging.info("Similarity search query executed successfully for %s", collection_name,
+                     extra={"fields": {"results": len(results), "limit": limit}})
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        logging.error("Failed to execute similarity search query for %s: %s", collection_name, e)
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                            detail=f"Failed to execute similarity search query for {collection_name}")
+
+    # Stored documents are canonical JSON: JSON responses splice the ratings in without parsing and
+    # YAML responses parse each document once to dump it
+    results = await attach_ratings(app_state, results)
+    with SERIALIZE_SECONDS.time():
+        response = Response(content=serialize(results), media_type=media_type)
+    return finish_search_response(app_state, cache_key, response, next_cursor)
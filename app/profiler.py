@@ -0,0 +1,135 @@
+import collections
+import os
+import sys
+import threading
+import tracemalloc
+from typing import Counter, Dict, List, Optional
+
+# Innermost frames of threads that are waiting for work, left out of CPU profiles unless asked for
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+# Held while a profile is taken, so that profiles do not overlap
+PROFILE_LOCK = threading.Lock()
+
+
+def short_filename(filename: str) -> str:
+    """
+    Path of a source file relative to the import path entry containing it.
+    """
+    best = ""
+    for entry in sys.path:
+        # An empty entry stands for the working directory
+        entry = entry or os.getcwd()
+        if filename.startswith(entry + os.sep) and len(entry) > len(best):
+            best = entry
+    return filename[len(best) + 1:] if best else filename
+
+
+def source_location(filename: str, lineno: int, cache: Dict[str, str]) -> str:
+    short = cache.get(filename)
+    if short is None:
+        short = cache[filename] = short_filename(filename)
+    return f"{short}:{lineno}"
+
+
+def collapsed_lines(stacks: Counter) -> str:
+    """
+    Stacks in the collapsed format read by flamegraph.pl, speedscope and similar tools: the frames
+    from the outermost one, separated by semicolons, followed by the count.
+    """
+    return "".join(";".join(stack) + " " + str(count) + "\n" for stack, count in stacks.most_common())
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all threads of the process from a background thread, so that the
+    event loop and the executor threads are profiled while they serve requests.
+    """
+
+    def __init__(self, interval_seconds: float = 0.005, include_idle: bool = False):
+        self.interval_seconds = interval_seconds
+        self.include_idle = include_idle
+        self.stacks: Counter = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="agenticdb-profiler", daemon=True)
+        self._labels: Dict[str, str] = {}
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self._sample(names.get(ident, str(ident)), frame)
+            self.samples += 1
+
+    def _sample(self, thread_name: str, frame) -> None:
+        code = frame.f_code
+        if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            return
+        stack: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({source_location(code.co_filename, frame.f_lineno, self._labels)})")
+            frame = frame.f_back
+        stack.append(thread_name)
+        self.stacks[tuple(reversed(stack))] += 1
+
+
+class AllocationDiff:
+    """
+    Compares tracemalloc snapshots taken before and after a period of time, to find the code
+    whose allocations grew. Tracing is started if it is not running already, and stopped again.
+    """
+
+    def __init__(self, frames: int = 25):
+        self.frames = frames
+        self._started = False
+        self._before: Optional[tracemalloc.Snapshot] = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started = True
+        self._before = self.snapshot()
+
+    def stop(self) -> Counter:
+        """
+        Bytes allocated and not freed during the period, by allocation stack.
+        """
+        try:
+            after = self.snapshot()
+        finally:
+            if self._started:
+                tracemalloc.stop()
+        labels: Dict[str, str] = {}
+        stacks: Counter = collections.Counter()
+        for stat in after.compare_to(self._before, "traceback"):
+            if stat.size_diff > 0:
+                # Tracebacks list the outermost frame first, like collapsed stacks
+                stack = tuple(source_location(frame.filename, frame.lineno, labels) for frame in stat.traceback)
+                stacks[stack] += stat.size_diff
+        return stacks
+
+    @staticmethod
+    def snapshot() -> tracemalloc.Snapshot:
+        # Allocations made by tracemalloc itself would drown out the rest
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.ratings_store import RatingsStore, ratings_manifest
+
+
+class PendingRating:
+    """
+    Totals of a rating as last read from the store plus the votes not yet flushed to it.
+    """
+
+    __slots__ = ("parent_key", "parent_id", "score_sum", "samples", "delta_sum", "delta_samples")
+
+    def __init__(self, parent_key: str, parent_id: str, score_sum: float, samples: int):
+        self.parent_key = parent_key
+        self.parent_id = parent_id
+        self.score_sum = score_sum
+        self.samples = samples
+        self.delta_sum = 0.0
+        self.delta_samples = 0
+
+    def manifest(self, ratings_id: str) -> Dict[str, Any]:
+        return ratings_manifest((ratings_id, self.parent_key, self.parent_id,
+                                 self.score_sum + self.delta_sum, self.samples + self.delta_samples))
+
+
+class RatingsAggregator:
+    """
+    Write-behind buffer in front of the ratings store. Votes are summed per ratings ID in memory and
+    flushed to the store as one delta per ID, either periodically or once flush_threshold IDs have
+    pending votes. Reads go through the aggregator so they always include the pending votes.
+    """
+
+    def __init__(self, store: RatingsStore, flush_threshold: int = 1000):
+        self.store = store
+        self.flush_threshold = flush_threshold
+        self._pending: Dict[str, PendingRating] = {}
+        self._lock = threading.Lock()
+
+    def add_vote(self, ratings_id: str, score: float) -> Optional[Dict[str, Any]]:
+        """
+        Record one vote and return the updated manifest, or None if the rating does not exist.
+        """
+        with self._lock:
+            pending = self._pending.get(ratings_id)
+            if pending is None:
+                # Read once per flush window, later votes for the same ID stay in memory
+                row = self.store.totals([ratings_id]).get(ratings_id)
+                if row is None:
+                    return None
+                pending = self._pending[ratings_id] = PendingRating(*row[1:])
+            pending.delta_sum += score
+            pending.delta_samples += 1
+            manifest = pending.manifest(ratings_id)
+            if len(self._pending) >= self.flush_threshold:
+                self._flush()
+        return manifest
+
+    def get(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the ratings manifests for the given IDs including pending votes, keyed by ID. Unknown
+        IDs are left out.
+        """
+        with self._lock:
+            ratings = {ratings_id: self._pending[ratings_id].manifest(ratings_id)
+                       for ratings_id in ids if ratings_id in self._pending}
+            stored_ids = [ratings_id for ratings_id in ids if ratings_id not in ratings]
+            if stored_ids:
+                ratings.update(self.store.get(stored_ids))
+        return ratings
+
+    def flush(self) -> int:
+        """
+        Write all pending votes to the store and return the number of ratings updated.
+        """
+        with self._lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        if not self._pending:
+            return 0
+        self.store.apply_deltas({ratings_id: (pending.delta_sum, pending.delta_samples)
+                                 for ratings_id, pending in self._pending.items()})
+        flushed = len(self._pending)
+        self._pending.clear()
+        logging.debug("Flushed votes for %s ratings", flushed)
+        return flushed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self.store.reset()
+
+
+async def flush_periodically(app_state: Any, interval_seconds: float) -> None:
+    """
+    Flush the ratings aggregator every interval_seconds until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await app_state.run(app_state.ratings_aggregator.flush)
+        except Exception as e:
+            # Pending votes are kept and retried on the next flush
+            logging.error("Failed to flush ratings: %s", e)
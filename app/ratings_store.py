@@ -0,0 +1,176 @@
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.codec import yaml_load
+
+# SQLite limits the number of bound parameters per statement
+MAX_QUERY_PARAMETERS = 900
+
+
+def ratings_manifest(row: tuple) -> Dict[str, Any]:
+    """
+    Build the ratings manifest returned to clients from a (id, parent_key, parent_id, score_sum,
+    samples) row.
+    """
+    ratings_id, parent_key, parent_id, score_sum, samples = row
+    return {
+        "id": ratings_id,
+        parent_key: parent_id,
+        "data": {
+            "score": round(score_sum / samples, 2) if samples else 0,
+            "samples": samples,
+        },
+    }
+
+
+class RatingsStore:
+    """
+    Ratings kept as plain numbers in SQLite. Nothing is embedded, a vote is a single atomic
+    increment of score_sum and samples, and the average is computed when a rating is read.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS ratings ("
+                " id TEXT PRIMARY KEY,"
+                " parent_key TEXT NOT NULL,"
+                " parent_id TEXT NOT NULL,"
+                " score_sum REAL NOT NULL DEFAULT 0,"
+                " samples INTEGER NOT NULL DEFAULT 0,"
+                " timestamp TEXT)"
+            )
+
+    @staticmethod
+    def _chunks(ids: List[str]) -> Iterator[List[str]]:
+        for start in range(0, len(ids), MAX_QUERY_PARAMETERS):
+            yield ids[start:start + MAX_QUERY_PARAMETERS]
+
+    def add(self, ids: List[str], parent_key: str, parent_ids: List[str], timestamp: Optional[str] = None,
+            score_sums: Optional[List[float]] = None, samples: Optional[List[int]] = None) -> None:
+        """
+        Create ratings for new agents or applications. parent_key names the field holding the parent
+        ID in the ratings manifest, e.g. agent_id or applications_id. Ratings that already exist are
+        kept, so concurrent registrations of the same agent do not fail.
+        """
+        score_sums = score_sums or [0] * len(ids)
+        samples = samples or [0] * len(ids)
+        rows = [(ratings_id, parent_key, parent_id, score_sum, sample_count, timestamp)
+                for ratings_id, parent_id, score_sum, sample_count in zip(ids, parent_ids, score_sums, samples)]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO ratings (id, parent_key, parent_id, score_sum, samples, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+
+    def totals(self, ids: List[str]) -> Dict[str, tuple]:
+        """
+        Return the raw (id, parent_key, parent_id, score_sum, samples) rows for the given IDs, keyed
+        by ID. Unknown IDs are left out.
+        """
+        rows_by_id = {}
+        with self._lock:
+            for chunk in self._chunks(list(ids)):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT id, parent_key, parent_id, score_sum, samples FROM ratings WHERE id IN ({placeholders})",
+                    chunk).fetchall()
+                rows_by_id.update((row[0], row) for row in rows)
+        return rows_by_id
+
+    def get(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the ratings manifests for the given IDs, keyed by ID. Unknown IDs are left out.
+        """
+        return {ratings_id: ratings_manifest(row) for ratings_id, row in self.totals(ids).items()}
+
+    def add_vote(self, ratings_id: str, score: float) -> Optional[Dict[str, Any]]:
+        """
+        Add one vote and return the updated manifest, or None if the rating does not exist.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "UPDATE ratings SET score_sum = score_sum + ?, samples = samples + 1 WHERE id = ?"
+                " RETURNING id, parent_key, parent_id, score_sum, samples",
+                (score, ratings_id)).fetchone()
+        return ratings_manifest(row) if row is not None else None
+
+    def apply_deltas(self, deltas: Dict[str, Tuple[float, int]]) -> None:
+        """
+        Add coalesced (score_sum, samples) deltas to existing ratings in a single transaction.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "UPDATE ratings SET score_sum = score_sum + ?, samples = samples + ? WHERE id = ?",
+                    [(score_sum, samples, ratings_id) for ratings_id, (score_sum, samples) in deltas.items()])
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            for chunk in self._chunks(list(ids)):
+                placeholders = ",".join("?" * len(chunk))
+                self._connection.execute(f"DELETE FROM ratings WHERE id IN ({placeholders})", chunk)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM ratings")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM ratings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def migrate_legacy_ratings(db_client: Any, ratings_store: RatingsStore, batch_size: int = 1000) -> int:
+    """
+    Move ratings from the legacy Chroma "ratings" collection, where each rating was an embedded YAML
+    or JSON document, into the ratings store and drop the collection. Returns the number of ratings
+    migrated.
+    """
+    if "ratings" not in [c.name for c in db_client.list_collections()]:
+        return 0
+
+    legacy_collection = db_client.get_collection(name="ratings")
+    total = legacy_collection.count()
+    migrated = 0
+    for offset in range(0, total, batch_size):
+        results = legacy_collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+        existing = ratings_store.get(results["ids"])
+        # Grouped so that each add call shares one parent key and timestamp
+        grouped_rows: Dict[tuple, List[tuple]] = {}
+        for ratings_id, document, metadata in zip(results["ids"], results["documents"], results["metadatas"]):
+            if ratings_id in existing:
+                continue
+            # JSON documents are valid YAML, so one loader handles both ingest formats
+            manifest = yaml_load(document)
+            parent_key = "agent_id" if "agent_id" in manifest else "applications_id"
+            data = manifest.get("data", {})
+            sample_count = int(data.get("samples", 0))
+            # Legacy documents only kept the average, so the sum is rebuilt from it
+            score_sum = float(data.get("score", 0)) * sample_count
+            timestamp = (metadata or {}).get("timestamp")
+            grouped_rows.setdefault((parent_key, timestamp), []).append(
+                (ratings_id, manifest.get(parent_key, ""), score_sum, sample_count))
+        for (parent_key, timestamp), rows in grouped_rows.items():
+            ratings_ids, parent_ids, score_sums, samples = zip(*rows)
+            ratings_store.add(list(ratings_ids), parent_key, list(parent_ids), timestamp,
+                              score_sums=list(score_sums), samples=list(samples))
+            migrated += len(rows)
+
+    db_client.delete_collection(name="ratings")
+    logging.info("Migrated %s ratings from the legacy ratings collection", migrated)
+    return migrated
@@ -3,3 +3,4 @@ from enum import Enum
 class AcceptType(Enum):
     JSON=1
     YAML=2
+    NDJSON=3
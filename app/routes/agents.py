@@ -1,16 +1,25 @@
-import datetime
+from collections import Counter
 from http import HTTPStatus
-import json
 import logging
-import uuid
+import time
+from typing import Any, Dict, Optional
 
-import openai
 import yaml
-from fastapi import Depends, HTTPException, APIRouter
+from fastapi import Depends, HTTPException, APIRouter, Query
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from app.codec import JSONDecodeError, JSONResponse, json_dumps, json_loads, yaml_dump, yaml_load, yaml_load_all
+from app.documents import embedding_text, json_array, ndjson_line, yaml_document, yaml_documents
+from app.embeddings import EmbeddingRateLimitError, retry_after_headers
+from app.filters import SearchFilters, filter_metadata
+from app.ingest import (WRITTEN_STATUSES, IngestRecord, content_hash, effective_batch_size, iter_batches,
+                        registration_ids, utc_timestamp, validate_document, write_batch)
+from app.metrics import PARSE_SECONDS
+from app.pagination import MAX_SEARCH_LIMIT, search_response
 from app.state import AppState, get_app_state
 from app.routes.accept_type import AcceptType
+from app.stream_ingest import iter_lines, iter_ndjson_documents, iter_yaml_documents, stream_add_documents
+from app.streaming import NDJSON_MEDIA_TYPE, streaming_search_response
+from app.tracing import span
 from fastapi.responses import Response
 
 
@@ -18,13 +27,18 @@ router = APIRouter()
 
 
 @router.post("/agents")
-async def add_agent(request: Request, app_state: AppState = Depends(get_app_state)):
+async def add_agent(request: Request, bulk: bool = False, stream: bool = False,
+                    batch_size: Optional[int] = Query(None, gt=0), app_state: AppState = Depends(get_app_state)):
+    start_time = time.perf_counter()
     if app_state.agents_db is None or app_state.ratings_db is None:
         logging.error("Agents DB not initialized")
         raise HTTPException(status_code=500, detail="Agents DB not initialized")
 
+    content_type = request.headers.get('Content-Type')
+    if content_type == NDJSON_MEDIA_TYPE or (stream and content_type in ("application/x-yaml", "text/yaml")):
+        return await stream_add_agents(request, content_type, batch_size, app_state)
+
     try:
-        content_type = request.headers.get('Content-Type')
         accept_header = request.headers.get('Accept')
         raw_body = await request.body()
 
@@ -37,18 +51,20 @@ async def add_agent(request: Request, app_state: AppState = Depends(get_app_stat
         if content_type == "application/json":
             logging.info("JSON content received")
             try:
-                parsed_content = json.loads(content_str)
-            except json.JSONDecodeError as e:
-                logging.error(f"Invalid JSON content: {str(e)}")
+                with PARSE_SECONDS.time():
+                    parsed_content = json_loads(content_str)
+            except JSONDecodeError as e:
+                logging.error("Invalid JSON content: %s", e)
                 raise HTTPException(status_code=400, detail="Invalid JSON content received")
         elif content_type == "application/x-yaml" or content_type == "text/yaml":
             logging.info("YAML content received")
             try:
-                parsed_content = list(yaml.safe_load_all(content_str))
+                with PARSE_SECONDS.time():
+                    parsed_content = list(yaml_load_all(content_str))
                 if not parsed_content:
                     raise ValueError("YAML content is empty after parsing")
             except yaml.YAMLError as e:
-                logging.error(f"Invalid YAML content: {str(e)}")
+                logging.error("Invalid YAML content: %s", e)
                 raise HTTPException(status_code=400, detail="Invalid YAML content received")
         else:
             logging.error("Unsupported Content-Type")
@@ -57,74 +73,174 @@ async def add_agent(request: Request, app_state: AppState = Depends(get_app_stat
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        logging.error(f"Failed to read request body: {str(e)}")
+        logging.error("Failed to read request body: %s", e)
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"Failed to read request body: {str(e)}")
 
-    agents_json_object = []
-    ratings_json_object = []
-    agents_concatenated_yaml = "---\n"
-    ratings_concatenated_yaml = "---\n"
+    if bulk:
+        return await bulk_add_agents(parsed_content, accept_header, batch_size, start_time, app_state)
 
-    for parsed_data in parsed_content:
-        agent_id = str(uuid.uuid4())
-        ratings_id = str(uuid.uuid4())
+    agents_json_object = []
+    agents_yaml_docs = []
+    records = []
+    current_utc_time = utc_timestamp()
 
+    for index, parsed_data in enumerate(parsed_content):
         try:
+            agent_id, ratings_id = registration_ids(parsed_data)
             parsed_data['metadata']['id'] = agent_id
             parsed_data['metadata']['ratings_id'] = ratings_id
         except KeyError as e:
-            logging.error(f"metadata not found in content: {str(e)}")
+            logging.error("metadata not found in content: %s", e)
             raise HTTPException(status_code=400, detail="Metadata not found in content")
 
-        ratings_manifest = {
-            "id": ratings_id,
-            "agent_id": agent_id,
-            "data": {
-                "score": 0,
-                "samples": 0
-            }
-        }
-
+        records.append(new_agent_record(index, parsed_data, current_utc_time, app_state.settings.embedding_text_mode))
         if accept_header == "application/json":
             agents_json_object.append(parsed_data)
-            ratings_json_object.append(ratings_manifest)
-            agent_content_str = json.dumps(parsed_data)
-            ratings_content_str = json.dumps(ratings_manifest)
         else:  # Assume YAML
-            agent_content_str = yaml.dump(parsed_data, sort_keys=False)
-            ratings_content_str = yaml.dump(ratings_manifest, sort_keys=False)
-            agents_concatenated_yaml += agent_content_str + "\n---\n"
-            ratings_concatenated_yaml += ratings_content_str + "\n---\n"
+            agents_yaml_docs.append(yaml_dump(parsed_data, sort_keys=False))
 
-        try:
-            current_utc_time = datetime.datetime.now(datetime.UTC).isoformat(timespec='milliseconds') + 'Z'
-            agent_docs = [agent_content_str]
-            ratings_docs = [ratings_content_str]
-            app_state.agents_db.add(documents=agent_docs, metadatas=[{"id": agent_id, "version": 1, "timestamp": current_utc_time}], 
-                                              ids=[f"{agent_id}"])
-            app_state.ratings_db.add(documents=ratings_docs, metadatas=[{"id": ratings_id, "version": 1, "timestamp": current_utc_time}], 
-                                               ids=[f"{ratings_id}"])
-            logging.info("Documents added to Chroma DBs")
-        except openai.RateLimitError as e:
-            logging.error(f"OpenAI rate limit error: {str(e)}")
-            raise HTTPException(status_code=500, detail="OpenAI rate limit error")
-        except Exception as e:
-            logging.error(f"Failed to add documents to Chroma DB: {str(e)}")
-            raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Failed to add documents to Chroma DB")
+    try:
+        for batch in iter_batches(records, effective_batch_size(app_state.db_client, batch_size or app_state.settings.ingest_batch_size)):
+            with span("write_batch", collection="agents", documents=len(batch)):
+                batch_statuses = await app_state.run(write_batch, app_state.agents_db, app_state.ratings_db, batch,
+                                                     "agent_id", app_state.embedding_function, app_state.text_splitter)
+            if any(status in WRITTEN_STATUSES for status in batch_statuses):
+                await app_state.bump_generation("agents", "ratings")
+        logging.info("Documents added to Chroma DBs")
+    except EmbeddingRateLimitError as e:
+        logging.error("OpenAI rate limit error: %s", e)
+        # The embedding requests were already retried with backoff, so the client should come back later
+        raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail="OpenAI rate limit error",
+                            headers=retry_after_headers(e))
+    except Exception as e:
+        logging.error("Failed to add documents to Chroma DB: %s", e)
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Failed to add documents to Chroma DB")
 
     if accept_header == "application/json":
         return JSONResponse(content=agents_json_object)
     else:
-        # Remove the last separator if it exists
-        if agents_concatenated_yaml.endswith("\n---\n"):
-            agents_concatenated_yaml = agents_concatenated_yaml[:-5]
+        agents_concatenated_yaml = "---\n" + "\n---\n".join(agents_yaml_docs)
         return Response(content=agents_concatenated_yaml.strip(), media_type="application/x-yaml")
 
 
+def new_agent_record(index: int, parsed_data: Dict[str, Any], current_utc_time: str,
+                     embedding_text_mode: str) -> IngestRecord:
+    """
+    Build the record of an agent. The document is stored as canonical JSON whatever the ingest
+    format, so responses never re-parse it, and the embedding is computed from a separate text.
+    """
+    agent_id = parsed_data['metadata']['id']
+    ratings_id = parsed_data['metadata']['ratings_id']
+    return IngestRecord(index=index, id=agent_id, ratings_id=ratings_id, document=json_dumps(parsed_data),
+                        embedding_text=embedding_text(parsed_data, embedding_text_mode),
+                        metadata={"id": agent_id, "ratings_id": ratings_id, "version": 1,
+                                  "timestamp": current_utc_time, "content_hash": content_hash(parsed_data),
+                                  **filter_metadata(parsed_data)})
+
+
+async def bulk_add_agents(parsed_content: Any, accept_header: Optional[str], batch_size: Optional[int], start_time: float,
+                    app_state: AppState) -> Response:
+    """
+    Validate the whole batch up front, then write the valid agents with chunked add calls to both
+    collections. Returns a per-document status report together with the ingest throughput.
+    """
+    if isinstance(parsed_content, dict):
+        parsed_content = [parsed_content]
+
+    statuses = []
+    records = []
+    current_utc_time = utc_timestamp()
+    for index, parsed_data in enumerate(parsed_content):
+        error = validate_document(parsed_data)
+        if error is not None:
+            statuses.append({"index": index, "status": "invalid", "error": error})
+            continue
+        parsed_data['metadata']['id'], parsed_data['metadata']['ratings_id'] = registration_ids(parsed_data)
+        records.append(new_agent_record(index, parsed_data, current_utc_time, app_state.settings.embedding_text_mode))
+        statuses.append({"index": index, "status": "pending", "name": parsed_data['metadata'].get('name'),
+                         "id": parsed_data['metadata']['id'], "ratings_id": parsed_data['metadata']['ratings_id']})
+
+    batch_size = effective_batch_size(app_state.db_client, batch_size or app_state.settings.ingest_batch_size)
+    for batch in iter_batches(records, batch_size):
+        try:
+            with span("write_batch", collection="agents", documents=len(batch)):
+                batch_statuses = await app_state.run(write_batch, app_state.agents_db, app_state.ratings_db, batch,
+                                                     "agent_id", app_state.embedding_function, app_state.text_splitter)
+            if any(status in WRITTEN_STATUSES for status in batch_statuses):
+                await app_state.bump_generation("agents", "ratings")
+            error = None
+        except EmbeddingRateLimitError as e:
+            logging.error("OpenAI rate limit error: %s", e)
+            batch_statuses, error = ["failed"] * len(batch), "OpenAI rate limit error"
+        except Exception as e:
+            logging.error("Failed to add documents to Chroma DB: %s", e)
+            batch_statuses, error = ["failed"] * len(batch), "Failed to add documents to Chroma DB"
+        for record, status in zip(batch, batch_statuses):
+            statuses[record.index]["status"] = status
+            if error is not None:
+                statuses[record.index]["error"] = error
+
+    elapsed = time.perf_counter() - start_time
+    counts = Counter(entry["status"] for entry in statuses)
+    report = {
+        "documents": statuses,
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        "duplicate": counts["duplicate"],
+        "invalid": counts["invalid"],
+        "failed": counts["failed"],
+        "batch_size": batch_size,
+        "elapsed_seconds": round(elapsed, 6),
+        "docs_per_second": round((counts["created"] + counts["updated"]) / elapsed, 2) if elapsed > 0 else None,
+    }
+    logging.info("Bulk ingest stored %s new and %s updated agents at %s docs/s", report["created"],
+                 report["updated"], report["docs_per_second"],
+                 extra={"fields": {**counts, "elapsed_seconds": report["elapsed_seconds"]}})
+
+    if accept_header == "application/json":
+        return JSONResponse(content=report)
+    return Response(content=yaml_dump(report, sort_keys=False), media_type="application/x-yaml")
+
+
+async def stream_add_agents(request: Request, content_type: str, batch_size: Optional[int],
+                            app_state: AppState) -> Response:
+    """
+    Ingest an NDJSON or multi-document YAML body while it is being received, one document at a time,
+    without holding the whole payload in memory. Returns an ingest report with counts and errors.
+    """
+    accept_header = request.headers.get('Accept')
+    current_utc_time = utc_timestamp()
+
+    def build_record(index: int, parsed_data: Dict[str, Any]) -> IngestRecord:
+        parsed_data['metadata']['id'], parsed_data['metadata']['ratings_id'] = registration_ids(parsed_data)
+        return new_agent_record(index, parsed_data, current_utc_time, app_state.settings.embedding_text_mode)
+
+    lines = iter_lines(request.stream())
+    if content_type == NDJSON_MEDIA_TYPE:
+        logging.info("Streaming NDJSON content received")
+        documents, parse = iter_ndjson_documents(lines), json_loads
+    else:
+        logging.info("Streaming YAML content received")
+        documents, parse = iter_yaml_documents(lines), yaml_load
+
+    batch_size = effective_batch_size(app_state.db_client, batch_size or app_state.settings.ingest_batch_size)
+    try:
+        report = await stream_add_documents(app_state, documents, parse, build_record, "agents", "agent_id",
+                                            batch_size)
+    except UnicodeDecodeError as e:
+        logging.error("Invalid UTF-8 content: %s", e)
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Request body is not valid UTF-8")
+
+    if accept_header == "application/json":
+        return JSONResponse(content=report)
+    return Response(content=yaml_dump(report, sort_keys=False), media_type="application/x-yaml")
 
 
 @router.get("/agents")
-async def get_agents(query: str, request: Request, app_state: AppState = Depends(get_app_state)):
+async def get_agents(request: Request, query: Optional[str] = None, limit: int = Query(10, gt=0, le=MAX_SEARCH_LIMIT),
+                     cursor: Optional[str] = None, stream: bool = False, filters: SearchFilters = Depends(),
+                     app_state: AppState = Depends(get_app_state)):
     if app_state.agents_db is None or app_state.ratings_db is None:
         logging.error("Chroma DB not initialized")
         raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Chroma DB not initialized")
@@ -137,7 +253,10 @@ async def get_agents(query: str, request: Request, app_state: AppState = Depends
             logging.info("Request for JSON response received")
         elif accept_header == "application/x-yaml" or accept_header == "text/yaml":
             accept_type = AcceptType.YAML
-            logging.info("Request for JSON response received")
+            logging.info("Request for YAML response received")
+        elif accept_header == NDJSON_MEDIA_TYPE:
+            accept_type = AcceptType.NDJSON
+            logging.info("Request for NDJSON response received")
         else:
             logging.error("Unsupported Content-Type")
             raise HTTPException(status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE, detail="Unsupported Content-Type")
@@ -145,78 +264,21 @@ async def get_agents(query: str, request: Request, app_state: AppState = Depends
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        logging.error(f"Failed to get HTTP headers: {str(e)}")
+        logging.error("Failed to get HTTP headers: %s", e)
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"Failed to get HTTP headers: {str(e)}")    
 
-    try:
-        results = app_state.agents_db.query(query_texts=[query], n_results=10)
-        logging.info("Similarity search query executed successfully for agents")
-    except HTTPException as http_exc:
-        # Handle HTTPException separately
-        logging.error(f"No query string: {str(e)}")
-        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="no query string")
-    except Exception as e:
-        logging.error(f"Failed to execute similarity search query for agents: {str(e)}")
-        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Failed to execute similarity search query for agents")
+    if query is None and cursor is None:
+        logging.error("No query string")
+        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail="query is required unless a cursor is given")
 
-    if accept_type == AcceptType.YAML:
-
-        concatenated_yaml = "---\n"
-        agents = results["documents"][0]
-        for agent in agents:
-            agent_data = yaml.safe_load(agent)
-            ratings_id = agent_data['metadata'].get('ratings_id')
-
-            try:
-                ratings_results = app_state.ratings_db.get(ids=[f"{ratings_id}"])
-                if len(ratings_results["documents"]) == 0:
-                    logging.error(f"Ratings ID not found in Chroma DB: {ratings_id}")
-                    raise HTTPException(status_code=404, detail="Ratings ID not found in Chroma DB")
-                logging.info(f"Similarity search query executed successfully for ratings with ID: {ratings_id}")
-            except HTTPException as http_exc:
-                # Catch explicitly raised HTTPException and re-raise
-                raise http_exc
-            except Exception as e:
-                logging.error(f"Failed to execute search query for ratings: {str(e)}")
-                raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Failed to execute search query for ratings")
-
-            if ratings_results:
-                ratings_str = ratings_results["documents"][0] 
-                agent_data['ratings'] = yaml.safe_load(ratings_str)
-
-            agent_yaml_content_str = yaml.dump(agent_data, sort_keys=False)
-            concatenated_yaml += agent_yaml_content_str + "\n---\n"
-
-        # Remove the last separator if it exists
-        if concatenated_yaml.endswith("\n---\n"):
-            concatenated_yaml = concatenated_yaml[:-5]
-
-        return Response(content=concatenated_yaml.strip(), media_type="application/x-yaml")
-
-    if accept_type == AcceptType.JSON:
-        json_object = []
-        agents = results["documents"][0]
-        for agent in agents:
-            agent_data = json.loads(agent)
-            ratings_id = agent_data['metadata'].get('ratings_id')
-            try:
-                ratings_results = app_state.ratings_db.get(ids=[f"{ratings_id}"])
-                if len(ratings_results["documents"]) == 0:
-                    logging.error(f"Ratings ID not found in Chroma DB: {ratings_id}")
-                    raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Ratings ID not found in Chroma DB")
-                logging.info(f"Similarity search query executed successfully for ratings with ID: {ratings_id}")
-            except HTTPException as http_exc:
-                # Catch explicitly raised HTTPException and re-raise
-                raise http_exc
-            except Exception as e:
-                logging.error(f"Failed to execute search query for ratings: {str(e)}")
-                raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Failed to execute search query for ratings")
-
-            if ratings_results:
-                ratings_str = ratings_results["documents"][0]
-                agent_data['ratings'] = json.loads(ratings_str)
-
-            json_object.append(agent_data)
-
-        return JSONResponse(content=json_object)
+    if accept_type == AcceptType.NDJSON:
+        return await streaming_search_response(app_state, "agents", query, filters, limit, cursor, ndjson_line,
+                                               NDJSON_MEDIA_TYPE)
+    if accept_type == AcceptType.YAML and stream:
+        return await streaming_search_response(app_state, "agents", query, filters, limit, cursor, yaml_document,
+                                               "application/x-yaml")
 
+    if accept_type == AcceptType.YAML:
+        return await search_response(app_state, "agents", query, filters, limit, cursor, yaml_documents,
+                                     "application/x-yaml")
+    return await search_response(app_state, "agents", query, filters, limit, cursor, json_array, "application/json")
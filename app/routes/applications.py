@@ -1,17 +1,22 @@
-import datetime
 from http import HTTPStatus
 from http.client import BAD_REQUEST
-import json
 import logging
 import uuid
+from typing import Optional
 
-import openai
-import yaml
-from fastapi import Depends, HTTPException, APIRouter
+from fastapi import Depends, HTTPException, APIRouter, Query
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from app.codec import JSONDecodeError, JSONResponse, json_dumps, json_loads
+from app.documents import embedding_text, json_array, ndjson_line
+from app.embeddings import EmbeddingRateLimitError, retry_after_headers
+from app.filters import SearchFilters, filter_metadata
+from app.ingest import IngestRecord, effective_batch_size, iter_batches, utc_timestamp, write_batch
+from app.metrics import PARSE_SECONDS
+from app.pagination import MAX_SEARCH_LIMIT, search_response
 from app.state import AppState, get_app_state
 from app.routes.accept_type import AcceptType
+from app.streaming import NDJSON_MEDIA_TYPE, streaming_search_response
+from app.tracing import span
 from fastapi.responses import Response
 
 
@@ -38,9 +43,10 @@ async def add_application(request: Request, app_state: AppState = Depends(get_ap
         if content_type == "application/json":
             logging.info("JSON content received")
             try:
-                parsed_content = json.loads(content_str)
-            except json.JSONDecodeError as e:
-                logging.error(f"Invalid JSON content: {str(e)}")
+                with PARSE_SECONDS.time():
+                    parsed_content = json_loads(content_str)
+            except JSONDecodeError as e:
+                logging.error("Invalid JSON content: %s", e)
                 raise HTTPException(status_code=400, detail="Invalid JSON content received")
         else:
             logging.error("Unsupported Content-Type")
@@ -49,13 +55,14 @@ async def add_application(request: Request, app_state: AppState = Depends(get_ap
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        logging.error(f"Failed to read request body: {str(e)}")
+        logging.error("Failed to read request body: %s", e)
         raise HTTPException(status_code=400, detail=f"Failed to read request body: {str(e)}")
 
     applications_json_object = []
-    ratings_json_object = []
+    records = []
+    current_utc_time = utc_timestamp()
 
-    for parsed_data in parsed_content:
+    for index, parsed_data in enumerate(parsed_content):
         application_id = str(uuid.uuid4())
         ratings_id = str(uuid.uuid4())
 
@@ -63,41 +70,34 @@ async def add_application(request: Request, app_state: AppState = Depends(get_ap
             parsed_data['metadata']['id'] = application_id
             parsed_data['metadata']['ratings_id'] = ratings_id
         except KeyError as e:
-            logging.error(f"metadata not found in content: {str(e)}")
+            logging.error("metadata not found in content: %s", e)
             raise HTTPException(status_code=400, detail="Metadata not found in content")
 
-        ratings_manifest = {
-            "id": ratings_id,
-            "applications_id": application_id,
-            "data": {
-                "score": 0,
-                "samples": 0
-            }
-        }
-
         if accept_header == "application/json":
             applications_json_object.append(parsed_data)
-            ratings_json_object.append(ratings_manifest)
-            agent_content_str = json.dumps(parsed_data)
-            ratings_content_str = json.dumps(ratings_manifest)
         else:
             raise HTTPException(status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE, detail="Unsupported Content-Type")
 
-        try:
-            current_utc_time = datetime.datetime.now(datetime.UTC).isoformat(timespec='milliseconds') + 'Z'
-            agent_docs = [agent_content_str]
-            ratings_docs = [ratings_content_str]
-            app_state.applications_db.add(documents=agent_docs, metadatas=[{"id": application_id, "version": 1, "timestamp": current_utc_time}], 
-                                              ids=[f"{application_id}"])
-            app_state.ratings_db.add(documents=ratings_docs, metadatas=[{"id": ratings_id, "version": 1, "timestamp": current_utc_time}], 
-                                               ids=[f"{ratings_id}"])
-            logging.info("Applications added to DBs")
-        except openai.RateLimitError as e:
-            logging.error(f"OpenAI rate limit error: {str(e)}")
-            raise HTTPException(status_code=500, detail="OpenAI rate limit error")
-        except Exception as e:
-            logging.error(f"Failed to add applications to DB: {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to add applications to DB")
+        records.append(IngestRecord(index=index, id=application_id, ratings_id=ratings_id, document=json_dumps(parsed_data),
+                                    embedding_text=embedding_text(parsed_data, app_state.settings.embedding_text_mode),
+                                    metadata={"id": application_id, "ratings_id": ratings_id, "version": 1,
+                                              "timestamp": current_utc_time, **filter_metadata(parsed_data)}))
+
+    try:
+        for batch in iter_batches(records, effective_batch_size(app_state.db_client, app_state.settings.ingest_batch_size)):
+            with span("write_batch", collection="applications", documents=len(batch)):
+                await app_state.run(write_batch, app_state.applications_db, app_state.ratings_db, batch,
+                                    "applications_id", app_state.embedding_function, app_state.text_splitter)
+            await app_state.bump_generation("applications", "ratings")
+        logging.info("Applications added to DBs")
+    except EmbeddingRateLimitError as e:
+        logging.error("OpenAI rate limit error: %s", e)
+        # The embedding requests were already retried with backoff, so the client should come back later
+        raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail="OpenAI rate limit error",
+                            headers=retry_after_headers(e))
+    except Exception as e:
+        logging.error("Failed to add applications to DB: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to add applications to DB")
 
     if accept_header == "application/json":
         return JSONResponse(content=applications_json_object)
@@ -106,7 +106,9 @@ async def add_application(request: Request, app_state: AppState = Depends(get_ap
 
 
 @router.get("/applications")
-async def get_applications(query: str, request: Request, app_state: AppState = Depends(get_app_state)):
+async def get_applications(request: Request, query: Optional[str] = None,
+                           limit: int = Query(10, gt=0, le=MAX_SEARCH_LIMIT), cursor: Optional[str] = None,
+                           filters: SearchFilters = Depends(), app_state: AppState = Depends(get_app_state)):
     if app_state.applications_db is None or app_state.ratings_db is None:
         logging.error("Appications DB not initialized")
         raise HTTPException(status_code=500, detail="Appications DB not initialized")
@@ -117,6 +119,9 @@ async def get_applications(query: str, request: Request, app_state: AppState = D
         if accept_header == "application/json":
             accept_type = AcceptType.JSON
             logging.info("Request for JSON response received")
+        elif accept_header == NDJSON_MEDIA_TYPE:
+            accept_type = AcceptType.NDJSON
+            logging.info("Request for NDJSON response received")
         else:
             logging.error("Unsupported Content-Type")
             raise HTTPException(status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE, detail="Unsupported Content-Type")
@@ -124,44 +129,16 @@ async def get_applications(query: str, request: Request, app_state: AppState = D
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        logging.error(f"Failed to get HTTP headers: {str(e)}")
+        logging.error("Failed to get HTTP headers: %s", e)
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"Failed to get HTTP headers: {str(e)}")    
 
-    try:
-        results = app_state.applications_db.query(query_texts=[query], n_results=10)
-        logging.info("Similarity search query executed successfully for agents")
-    except HTTPException as http_exc:
-        # Handle HTTPException separately
-        raise http_exc
-    except Exception as e:
-        logging.error(f"Failed to execute similarity search query for agents: {str(e)}")
-        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Failed to execute similarity search query for agents")
+    if query is None and cursor is None:
+        logging.error("No query string")
+        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail="query is required unless a cursor is given")
 
+    if accept_type == AcceptType.NDJSON:
+        return await streaming_search_response(app_state, "applications", query, filters, limit, cursor, ndjson_line,
+                                               NDJSON_MEDIA_TYPE)
 
-    if accept_type == AcceptType.JSON:
-        json_object = []
-        applications = results["documents"][0]
-        for application in applications:
-            app_data = json.loads(application)
-            ratings_id = app_data['metadata'].get('ratings_id')
-            try:
-                ratings_results = app_state.ratings_db.get(ids=[f"{ratings_id}"])
-                if len(ratings_results["documents"]) == 0:
-                    logging.error(f"Ratings ID not found in DB: {ratings_id}")
-                    raise HTTPException(status_code=404, detail="Ratings ID not found in DB")
-                logging.info(f"Similarity search query executed successfully for ratings with ID: {ratings_id}")
-            except HTTPException as http_exc:
-                # Catch explicitly raised HTTPException and re-raise
-                raise http_exc
-            except Exception as e:
-                logging.error(f"Failed to execute search query for ratings: {str(e)}")
-                raise HTTPException(status_code=500, detail="Failed to execute search query for ratings")
-
-            if ratings_results:
-                ratings_str = ratings_results["documents"][0]
-                app_data['ratings'] = json.loads(ratings_str)
-
-            json_object.append(app_data)
-
-        return JSONResponse(content=json_object)
-
+    return await search_response(app_state, "applications", query, filters, limit, cursor, json_array,
+                                 "application/json")
@@ -1,11 +1,16 @@
+import asyncio
+import hmac
 from http import HTTPStatus
-import json
 import logging
+from typing import Literal
 
-from fastapi import Depends, HTTPException, APIRouter
+from fastapi import Depends, HTTPException, APIRouter, Query
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from app.codec import JSONResponse
+from app.metrics import PROMETHEUS_MEDIA_TYPE, REGISTRY, state_metric_lines
+from app.profiler import PROFILE_LOCK, AllocationDiff, StackSampler, collapsed_lines
 from app.state import AppState, get_app_state
+from app.storage import reset_collection
 from app.routes.accept_type import AcceptType
 from fastapi.responses import Response
 
@@ -21,33 +26,85 @@ async def delete_all_collections(app_state: AppState = Depends(get_app_state)):
     
     # Attempt to delete the agents collection
     try:
-        ret = app_state.db_client.delete_collection(name="agents")
-        app_state.agents_db = app_state.db_client.create_collection(name="agents", metadata={"hnsw:space": "cosine"})
+        await app_state.run(reset_collection, app_state, "agents")
         results['agents'] = 0
     except Exception as e:
         results['agents'] = f"Failed to delete agents collection: {str(e)}"
 
     # Attempt to delete the applications collection
     try:
-        ret = app_state.db_client.delete_collection(name="applications")
-        app_state.applications_db = app_state.db_client.create_collection(name="applications", metadata={"hnsw:space": "cosine"})
+        await app_state.run(reset_collection, app_state, "applications")
         results['applications'] = 0
     except Exception as e:
         results['applications'] = f"Failed to delete applications collection: {str(e)}"
 
-    # Attempt to delete the ratings collection
+    # Attempt to clear the ratings store
     try:
-        ret = app_state.db_client.delete_collection(name="ratings")
-        app_state.ratings_db = app_state.db_client.create_collection(name="ratings", metadata={"hnsw:space": "cosine"})
+        await app_state.run(app_state.ratings_aggregator.reset)
         results['ratings'] = 0
     except Exception as e:
-        results['ratings'] = f"Failed to delete ratings collection: {str(e)}"  
+        results['ratings'] = f"Failed to delete ratings: {str(e)}"  
+
+    await app_state.bump_generation("agents", "applications", "ratings")
 
     # Return the result of each deletion attempt
     return JSONResponse(content=results)
 
 
+@database.get("/cache")
+async def get_cache_stats(app_state: AppState = Depends(get_app_state)):
+    results = {}
+    if app_state.query_embedding_cache is not None:
+        results['query_embeddings'] = app_state.query_embedding_cache.stats()
+    if app_state.result_cache is not None:
+        results['results'] = app_state.result_cache.stats()
+    if app_state.embedding_cache is not None:
+        results['embeddings'] = app_state.embedding_cache.stats()
+    return JSONResponse(content=results)
+
+
+@database.get("/metrics")
+async def get_metrics(app_state: AppState = Depends(get_app_state)):
+    # Counting the collection records queries Chroma, so it runs on the executor
+    state_lines = await app_state.run(state_metric_lines, app_state)
+    return Response(content=REGISTRY.expose() + "\n".join(state_lines) + "\n", media_type=PROMETHEUS_MEDIA_TYPE)
 
 
+def require_admin(request: Request, app_state: AppState = Depends(get_app_state)) -> None:
+    token = app_state.settings.admin_token
+    if not token:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Admin endpoints are disabled")
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(credentials.encode(), token.encode()):
+        raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED, detail="Invalid admin token",
+                            headers={"WWW-Authenticate": "Bearer"})
 
 
+@database.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile(mode: Literal["cpu", "memory"] = "cpu", seconds: float = Query(10, gt=0, le=300),
+                      interval_ms: float = Query(5, ge=1, le=1000), idle: bool = False,
+                      app_state: AppState = Depends(get_app_state)):
+    """
+    Profile this server process while it keeps serving requests, and return collapsed stacks for
+    a flamegraph. The cpu mode samples the stacks of the event loop and executor threads every
+    interval_ms, the memory mode returns the bytes allocated and not freed by each allocation stack.
+    """
+    # Profiles of overlapping periods would measure each other
+    if not PROFILE_LOCK.acquire(blocking=False):
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="A profile is already being taken")
+    try:
+        logging.info("Taking a %s profile for %ss", mode, seconds)
+        if mode == "cpu":
+            profiler = StackSampler(interval_ms / 1000, include_idle=idle)
+        else:
+            profiler = AllocationDiff()
+        # Starting and stopping tracemalloc snapshots the heap, which is slow for large heaps
+        await app_state.run(profiler.start)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stacks = await app_state.run(profiler.stop)
+    finally:
+        PROFILE_LOCK.release()
+    return Response(content=collapsed_lines(stacks), media_type="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": f'attachment; filename="profile-{mode}.folded"'})
@@ -1,18 +1,42 @@
 import logging
+from typing import Any, Dict, List
 
-import openai
 import yaml
 from fastapi import Depends, HTTPException, APIRouter
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from app.codec import JSONResponse, yaml_load
+from app.metrics import PARSE_SECONDS
 from app.state import AppState, get_app_state
+from app.tracing import span
 
 router = APIRouter()
 
 
+def fetch_ratings(app_state: AppState, ratings_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the ratings for all search hits in a single round trip and return them keyed by ratings ID.
+    Votes that have not been flushed to the store yet are included.
+    """
+    unique_ids = list(dict.fromkeys(str(ratings_id) for ratings_id in ratings_ids))
+    if not unique_ids:
+        return {}
+    try:
+        ratings_by_id = app_state.ratings_aggregator.get(unique_ids)
+    except Exception as e:
+        logging.error("Failed to execute search query for ratings: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to execute search query for ratings")
+
+    missing_ids = [ratings_id for ratings_id in unique_ids if ratings_id not in ratings_by_id]
+    if missing_ids:
+        logging.error("Ratings ID not found: %s", missing_ids)
+        raise HTTPException(status_code=404, detail="Ratings ID not found")
+    logging.debug("Search query executed successfully for %s ratings", len(unique_ids))
+    return ratings_by_id
+
+
 @router.post("/ratings")
 async def add_ratings(request: Request, app_state: AppState = Depends(get_app_state)):
-    if app_state.agents_db is None or app_state.ratings_db is None:
+    if app_state.agents_db is None or app_state.ratings_aggregator is None:
         logging.error("Chroma DB not initialized")
         raise HTTPException(status_code=500, detail="Chroma DB not initialized")
     try:
@@ -27,83 +51,51 @@ async def add_ratings(request: Request, app_state: AppState = Depends(get_app_st
 
         # Attempt to parse the YAML content to check for validity
         try:
-            parsed_yaml = yaml.safe_load(yaml_content_str)
+            with PARSE_SECONDS.time():
+                parsed_yaml = yaml_load(yaml_content_str)
             if parsed_yaml is None:
                 raise ValueError("YAML content is empty after parsing")
         except yaml.YAMLError as e:
-            logging.error(f"Invalid YAML content: {str(e)}")
+            logging.error("Invalid YAML content: %s", e)
             raise HTTPException(status_code=400, detail="Invalid YAML content received")
 
     except HTTPException as http_exc:
         # Catch explicitly raised HTTPException and re-raise
         raise http_exc
     except Exception as e:
-        logging.error(f"Failed to read request body: {str(e)}")
+        logging.error("Failed to read request body: %s", e)
         raise HTTPException(status_code=400, detail=f"Failed to read request body: {str(e)}")
 
     try:
-        updated_ratings = parsed_yaml.get("ratings")
-        ratings_id = updated_ratings.get("id")
-    except KeyError as e:
-        logging.error(f"Ratings ID not found in YAML content: {str(e)}")
-        raise HTTPException(status_code=400, detail="Ratings ID not found in YAML content")
+        updated_ratings = parsed_yaml["ratings"]
+        ratings_id = updated_ratings["id"]
+        score = float(updated_ratings["data"]["score"])
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error("Ratings ID or score not found in YAML content: %s", e)
+        raise HTTPException(status_code=400, detail="Ratings ID or score not found in YAML content")
 
-    # Get existing document from Chroma DB
+    # The vote is buffered and flushed to the store together with other votes for the same rating
     try:
-        results = app_state.ratings_db.get(ratings_id)
-        if len(results["documents"]) == 0:
-            logging.error(f"Ratings ID not found in Chroma DB: {ratings_id}")
-            raise HTTPException(status_code=404, detail="Ratings ID not found in Chroma DB")
-        ratings_str = results["documents"][0]
-        ratings_dict = yaml.safe_load(ratings_str)
-        logging.info(f"Search query executed successfully for ratings ID: {ratings_id}")
-    except HTTPException as http_exc:
-        # Handle HTTPException separately
-        raise http_exc
+        with span("add_vote", ratings_id=ratings_id):
+            ratings_dict = await app_state.run(app_state.ratings_aggregator.add_vote, ratings_id, score)
+        logging.info("Ratings updated for ratings ID: %s", ratings_id)
     except Exception as e:
-        logging.error(f"Failed to execute search query for ratings: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to execute search query for ratings")
-
-    # Update the ratings
-    ratings_dict["data"]["samples"] = ratings_dict.get("data").get("samples") + 1
-    ratings_dict["data"]["score"] = round(
-        (ratings_dict.get("data").get("score") +
-         updated_ratings.get("data").get("score")) / ratings_dict["data"]["samples"],
-        2
-    )
-    # convert back to YAML
-    ratings_yaml_content_str = yaml.dump(ratings_dict, sort_keys=False)
-
-    try:
-        # Update document
-        ratings_docs = [ratings_yaml_content_str]
-        app_state.ratings_db.update(ids=[ratings_id], documents=ratings_docs)
-        logging.info("Update document in Chroma DBs")
-    except openai.RateLimitError as e:
-        logging.error(f"OpenAI rate limit error: {str(e)}")
-        raise HTTPException(status_code=500, detail="OpenAI rate limit error")
-    except Exception as e:
-        logging.error(f"Failed to update documents in Chroma DB: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to add documents to Chroma DB")
+        logging.error("Failed to update ratings: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to update ratings")
+    if ratings_dict is None:
+        logging.error("Ratings ID not found: %s", ratings_id)
+        raise HTTPException(status_code=404, detail="Ratings ID not found")
+    await app_state.bump_generation("ratings")
 
     return JSONResponse(content={"ratings": ratings_dict})
 
 
 @router.get("/ratings")
 async def get_ratings(ratings_id: str, app_state: AppState = Depends(get_app_state)):
-    if app_state.agents_db is None or app_state.ratings_db is None:
+    if app_state.agents_db is None or app_state.ratings_aggregator is None:
         logging.error("Chroma DB not initialized")
         raise HTTPException(status_code=500, detail="Chroma DB not initialized")
-    try:
-        results = app_state.ratings_db.get(ratings_id)
-        ratings_str = results["documents"][0]
-        ratings_dict = yaml.safe_load(ratings_str)
-        logging.info(f"Search query executed successfully for ratings ID: {ratings_id}")
-    except HTTPException as http_exc:
-        # Handle HTTPException separately
-        raise http_exc
-    except Exception as e:
-        logging.error(f"Failed to execute similarity search query for ratings: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to execute similarity search query for ratings")
+    ratings_dict = (await app_state.run(fetch_ratings, app_state, [ratings_id]))[ratings_id]
+    logging.info("Search query executed successfully for ratings ID: %s", ratings_id)
 
     return JSONResponse(content=ratings_dict)
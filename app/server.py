@@ -1,8 +1,10 @@
+import asyncio
 import logging
 import os
 import uvicorn
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import yaml
 from dotenv import load_dotenv, find_dotenv
@@ -12,19 +14,22 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pydantic import BaseModel, field_validator
 
-import chromadb
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableLambda
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import ChatOpenAI
-from langserve import add_routes
-
 from app.routes.agents import router as agents_router
 from app.routes.ratings import router as ratings_router
 from app.routes.applications import router as applications_router
 from app.routes.database import database as database_router
+from app.cache import LRUCache
+from app.config import Settings, load_settings, settings_environment
+from app.embedding_cache import CachedEmbeddingFunction, EmbeddingCache, embedding_cache_directory
+from app.embeddings import create_embedding_function
+from app.logs import RequestLogContextMiddleware, configure_logging, shutdown_logging
+from app.metrics import MetricsMiddleware
+from app.ratings_aggregator import RatingsAggregator, flush_periodically
 from app.state import AppState
+from app.shared_state import SharedCursorCache
+from app.tracing import TracingMiddleware, create_tracer
+from app.storage import (create_client, create_shared_collections, create_shared_state, open_collections,
+                         start_chroma_server)
 
 
 def load_env_file():
@@ -35,19 +40,20 @@ def load_env_file():
     env_path = find_dotenv()
     if env_path != "":
         load_dotenv(dotenv_path=env_path, override=True)
-        logging.info(f"Loaded environment variables from {env_path}")
+        logging.info("Loaded environment variables from %s", env_path)
     else:
         # If the default .env file is not found, try to find and load .env.azure
         env_azure_path = find_dotenv(".env.azure")
         if env_azure_path:
             load_dotenv(dotenv_path=env_azure_path, override=True)
-            logging.info(f"Loaded environment variables from {env_azure_path}")
+            logging.info("Loaded environment variables from %s", env_azure_path)
         else:
             logging.error("Neither .env nor .env.azure files were found")
             raise FileNotFoundError("Neither .env nor .env.azure files were found")
 
 
 def get_text_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     return RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=0,
@@ -60,10 +66,6 @@ def get_text_splitter():
     )
 
 
-def get_embedding_function():
-    return OpenAIEmbeddingFunction(api_key=os.environ.get('OPENAI_API_KEY'), model_name="text-embedding-3-small")
-
-
 class YAMLContent(BaseModel):
     original_content: str
     parsed_content: Dict[str, Any]
@@ -73,11 +75,14 @@ class YAMLContent(BaseModel):
         try:
             return yaml.safe_load(values['original_content'])
         except yaml.YAMLError as e:
-            logging.error(f"Failed to parse YAML content: {str(e)}")
+            logging.error("Failed to parse YAML content: %s", e)
             raise ValueError(f"Invalid YAML content: {str(e)}")
 
 
 def add_joke_agent_route(fast_app: FastAPI):
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_openai import ChatOpenAI
+    from langserve import add_routes
     chat_model = ChatOpenAI(model=os.getenv("OPENAI_MODEL_NAME")),
     chat_prompt = ChatPromptTemplate.from_template("tell me a joke about {topic}")
     add_routes(
@@ -100,6 +105,8 @@ def cascade_invoke(input_data: Any = "what is 3 + 4?") -> Any:
 
 
 def add_cascade_agent_route(fast_app: FastAPI):
+    from langchain_core.runnables import RunnableLambda
+    from langserve import add_routes
     add_routes(
         app=fast_app,
         runnable=RunnableLambda(cascade_invoke),
@@ -107,47 +114,103 @@ def add_cascade_agent_route(fast_app: FastAPI):
     )
 
 
+# Optional LangServe routes, each importing LangChain and its provider only when it is enabled
+INTEGRATIONS = {
+    "joke": add_joke_agent_route,
+    "cascade": add_cascade_agent_route,
+}
+
+
+def add_integrations(fast_app: FastAPI, integrations: str):
+    for name in [name.strip() for name in integrations.split(",") if name.strip()]:
+        if name not in INTEGRATIONS:
+            raise ValueError(f"Unknown integration: {name}")
+        logging.info("Adding integration %s", name)
+        INTEGRATIONS[name](fast_app)
+
+
 @asynccontextmanager
 async def lifespan(fast_app: FastAPI):
+    flush_task = None
+    settings = getattr(fast_app.state, "settings", None) or load_settings()
+    owns_logging = configure_logging(settings)
     try:
-        # load_env_file()
-        # add_joke_agent_route(fast_app)
-        # add_cascade_agent_route(fast_app)
         routes = [route.path for route in fast_app.router.routes]
-        logging.info(f"Available routes: {routes}")
+        logging.info("Available routes: %s", routes)
 
-        fast_app.state.app_state = AppState()
+        fast_app.state.app_state = AppState(settings=settings)
+        fast_app.state.app_state.executor = ThreadPoolExecutor(max_workers=settings.executor_workers,
+                                                               thread_name_prefix="agenticdb-storage")
         fast_app.state.app_state.text_splitter = get_text_splitter()
-        # Only when using OpenAI embeddings, not needed at this point. 
-        # fast_app.state.app_state.embedding_function = get_embedding_function()
-
-        chroma_client = chromadb.Client()
-
-        # Initialize ChromaDB for agents
-        if "agents" in [c.name for c in chroma_client.list_collections()]:
-            chroma_client.delete_collection(name="agents")
-        if "applications" in [c.name for c in chroma_client.list_collections()]:
-            chroma_client.delete_collection(name="applications")
-        if "ratings" in [c.name for c in chroma_client.list_collections()]:
-            chroma_client.delete_collection(name="ratings")
-        fast_app.state.app_state.agents_db = chroma_client.create_collection(name="agents", metadata={"hnsw:space": "cosine"})
-        fast_app.state.app_state.applications_db = chroma_client.create_collection(name="applications", metadata={"hnsw:space": "cosine"})
-        fast_app.state.app_state.ratings_db = chroma_client.create_collection(name="ratings", metadata={"hnsw:space": "cosine"})
-        fast_app.state.app_state.db_client = chroma_client
-
+        if fast_app.state.app_state.embedding_function is None:
+            embedding_function = create_embedding_function(settings)
+            cache_directory = embedding_cache_directory(settings)
+            if cache_directory is not None:
+                # Embeddings survive restarts and collection resets, so unchanged texts are never re-embedded
+                fast_app.state.app_state.embedding_cache = EmbeddingCache(cache_directory,
+                                                                          settings.embedding_cache_size)
+                embedding_function = CachedEmbeddingFunction(embedding_function,
+                                                             fast_app.state.app_state.embedding_cache)
+            fast_app.state.app_state.embedding_function = embedding_function
+        fast_app.state.app_state.query_embedding_cache = LRUCache(max_size=settings.query_cache_size,
+                                                                  ttl_seconds=settings.query_cache_ttl_seconds)
+        fast_app.state.app_state.result_cache = LRUCache(max_size=settings.result_cache_size,
+                                                         ttl_seconds=settings.result_cache_ttl_seconds)
+        fast_app.state.app_state.tracer = create_tracer(settings)
+        fast_app.state.app_state.shared_state = create_shared_state(settings)
+        if fast_app.state.app_state.shared_state is not None:
+            # The next page of a search may be requested from any worker
+            fast_app.state.app_state.cursor_cache = SharedCursorCache(fast_app.state.app_state.shared_state,
+                                                                      max_size=settings.cursor_cache_size,
+                                                                      ttl_seconds=settings.cursor_ttl_seconds)
+        else:
+            fast_app.state.app_state.cursor_cache = LRUCache(max_size=settings.cursor_cache_size,
+                                                             ttl_seconds=settings.cursor_ttl_seconds)
+
+        fast_app.state.app_state.db_client = create_client(settings)
+        open_collections(fast_app.state.app_state)
+        # Votes buffered in one worker would be invisible to the others, so shared stores write them through
+        flush_threshold = 1 if fast_app.state.app_state.shared_state is not None else settings.ratings_flush_threshold
+        fast_app.state.app_state.ratings_aggregator = RatingsAggregator(fast_app.state.app_state.ratings_db,
+                                                                        flush_threshold=flush_threshold)
+        flush_task = asyncio.create_task(flush_periodically(fast_app.state.app_state,
+                                                            settings.ratings_flush_interval_seconds))
 
         logging.info("App state initialized successfully")
         yield
     except Exception as e:
-        logging.error(f"Error during app initialization: {str(e)}")
+        logging.error("Error during app initialization: %s", e)
         raise
     finally:
+        app_state = getattr(fast_app.state, "app_state", None)
+        if flush_task is not None:
+            flush_task.cancel()
+            try:
+                await flush_task
+            except asyncio.CancelledError:
+                pass
+        if app_state is not None and app_state.executor is not None:
+            app_state.executor.shutdown(wait=True)
+        if app_state is not None and hasattr(app_state.embedding_function, "close"):
+            app_state.embedding_function.close()
+        if app_state is not None and app_state.ratings_aggregator is not None:
+            # Votes still buffered in memory are written before the store is closed
+            app_state.ratings_aggregator.flush()
+        if app_state is not None and app_state.ratings_db is not None:
+            app_state.ratings_db.close()
+        if app_state is not None and app_state.shared_state is not None:
+            app_state.shared_state.close()
+        if app_state is not None and app_state.tracer is not None:
+            # Spans still queued are exported before shutting down
+            app_state.tracer.close()
+        if app_state is not None and app_state.db_client is not None:
+            # Stop the shared Chroma system so the next client starts from a clean state
+            app_state.db_client.clear_system_cache()
         logging.info("App shutdown")
+        if owns_logging:
+            shutdown_logging()
 
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-
 # Determine the absolute path to the 'static' directory
 current_file_path = os.path.abspath(__file__)
 current_dir = os.path.dirname(current_file_path)
@@ -163,9 +226,11 @@ def add_handlers(app: FastAPI):
         return os.path.join(static_directory, "index.html")
 
 
-def create_app():
+def create_app(settings: Optional[Settings] = None):
     app = FastAPI(lifespan=lifespan, title="Agentic DB API", description="API for managing Agentic DB",
                   version="0.1.0")
+    # Explicit settings take precedence over the environment, mainly for tests
+    app.state.settings = settings
 
     # Set all CORS enabled origins
     app.add_middleware(
@@ -177,18 +242,59 @@ def create_app():
         expose_headers=["*"],
     )
 
+    # Log records of a request are sampled by its route
+    app.add_middleware(RequestLogContextMiddleware)
+
+    # Traced requests get a root span, and a Server-Timing header when they ask for it
+    app.add_middleware(TracingMiddleware)
+
+    # Outermost, so that the latency of a request includes the other middleware
+    app.add_middleware(MetricsMiddleware)
+
     app.mount("/static", StaticFiles(directory=static_directory), name="static")
     add_handlers(app)
     app.include_router(ratings_router)
     app.include_router(agents_router)
     app.include_router(applications_router)
     app.include_router(database_router)
+    add_integrations(app, (settings or load_settings()).integrations)
 
     return app
 
 
+def serve(settings: Settings) -> None:
+    """
+    Run the API server. Several workers share one store: a Chroma server given in server mode, or
+    one started on the data directory in persistent mode. In-memory collections cannot be shared.
+    """
+    if settings.workers == 1:
+        uvicorn.run(create_app(settings), host=settings.host, port=settings.port)
+        return
+    if settings.storage_mode == "memory":
+        raise ValueError("Multiple workers need the persistent or server storage mode")
+
+    chroma_server = None
+    if settings.storage_mode == "persistent":
+        chroma_server = start_chroma_server(settings)
+        settings = settings.model_copy(update={"storage_mode": "server"})
+    create_shared_collections(settings)
+    # Workers are separate processes that load their settings from the environment
+    os.environ.update(settings_environment(settings))
+    try:
+        uvicorn.run("app.server:create_app", factory=True, host=settings.host, port=settings.port,
+                    workers=settings.workers)
+    finally:
+        if chroma_server is not None:
+            chroma_server.terminate()
+            chroma_server.wait()
+
+
 if __name__ == "__main__":
-    app = create_app()
+    main_settings = load_settings()
+    configure_logging(main_settings)
     logging.info("Starting Agentic DB API...")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-    logging.info("Application shutdown")
+    try:
+        serve(main_settings)
+        logging.info("Application shutdown")
+    finally:
+        shutdown_logging()
@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.codec import json_dumps, json_loads
+
+
+class SharedState:
+    """
+    Write generations and search cursors kept in a SQLite file, so that every worker process
+    serving the same store sees the writes and cursors of the others. A worker caches search
+    results by generation, so a write through one worker invalidates the cached results of all.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS generations (collection TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cursors ("
+                " search_id TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS cursors_created_at ON cursors (created_at)")
+
+    def generations(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._connection.execute("SELECT collection, generation FROM generations"))
+
+    def bump_generation(self, *collections: str) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "INSERT INTO generations (collection, generation) VALUES (?, 1)"
+                " ON CONFLICT (collection) DO UPDATE SET generation = generation + 1",
+                [(collection,) for collection in collections])
+
+    def get_cursor(self, search_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM cursors WHERE search_id = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (search_id, time.time())).fetchone()
+        return row[0] if row is not None else None
+
+    def put_cursor(self, search_id: str, value: str, ttl_seconds: float, max_cursors: int) -> None:
+        """
+        Store a cursor and drop the oldest ones beyond max_cursors.
+        """
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds > 0 else None
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO cursors (search_id, value, expires_at, created_at)"
+                                     " VALUES (?, ?, ?, ?)", (search_id, value, expires_at, now))
+            self._connection.execute("DELETE FROM cursors WHERE search_id IN (SELECT search_id FROM cursors"
+                                     " ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (max_cursors,))
+
+    def clear_cursors(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cursors")
+
+    def cursor_count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cursors").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class SharedCursorCache:
+    """
+    Drop-in replacement for the cursor LRUCache that keeps the ranked IDs of each search in the
+    shared state, so that any worker can serve the next page. Values must be JSON serializable and
+    come back as lists.
+    """
+
+    def __init__(self, shared_state: SharedState, max_size: int, ttl_seconds: float = 0):
+        self.shared_state = shared_state
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.shared_state.get_cursor(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json_loads(value)
+
+    def put(self, key: str, value: Any) -> None:
+        if self.max_size > 0:
+            self.shared_state.put_cursor(key, json_dumps(value), self.ttl_seconds, self.max_size)
+
+    def clear(self) -> None:
+        self.shared_state.clear_cursors()
+
+    def __len__(self) -> int:
+        return self.shared_state.cursor_count()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self),
+            "max_size": self.max_size,
+        }
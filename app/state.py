@@ -1,15 +1,83 @@
-from pydantic import BaseModel, Field
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import Executor
+
+from pydantic import BaseModel, ConfigDict, Field
 from fastapi import Request
 from chromadb.types import Collection
-from typing import Any, Optional, Callable
+from typing import Any, Dict, Optional, Callable
+
+from app.cache import LRUCache
+from app.config import Settings
+from app.embedding_cache import EmbeddingCache
+from app.ratings_aggregator import RatingsAggregator
+from app.ratings_store import RatingsStore
+from app.shared_state import SharedState
+from app.tracing import Tracer
 
 class AppState(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    settings: Settings = Field(default_factory=Settings, description="Runtime configuration")
     db_client: Optional[Any] = Field(None, description="Chroma DB client")
     applications_db: Optional[Collection] = Field(None, description="Chroma DB for applications")
     agents_db: Optional[Collection] = Field(None, description="Chroma DB for agents")
-    ratings_db: Optional[Collection] = Field(None, description="Chroma DB for ratings")
+    ratings_db: Optional[RatingsStore] = Field(None, description="Numeric store for agent and application ratings")
+    ratings_aggregator: Optional[RatingsAggregator] = Field(None, description="Write-behind buffer for votes")
     text_splitter: Optional[Callable] = Field(None, description="Function or callable for text splitting")
     embedding_function: Optional[Callable] = Field(None, description="Function or callable for embedding")
+    embedding_cache: Optional[EmbeddingCache] = Field(None, description="On-disk embeddings keyed by model and text")
+    executor: Optional[Executor] = Field(None, description="Bounded pool for blocking storage and embedding calls")
+    query_embedding_cache: Optional[LRUCache] = Field(None, description="Embeddings of recent search queries")
+    result_cache: Optional[LRUCache] = Field(None, description="Serialized responses of recent searches")
+    cursor_cache: Optional[LRUCache] = Field(None, description="Ranked result IDs of recent searches, keyed by cursor")
+    generations: Dict[str, int] = Field(default_factory=dict, description="Write generation of each collection")
+    shared_state: Optional[SharedState] = Field(None, description="Generations and cursors shared with other workers")
+    tracer: Optional[Tracer] = Field(None, description="Decides which requests are traced and exports their spans")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking Chroma or embedding call on the bounded executor so that the event loop keeps
+        serving other requests while it completes. The call runs in a copy of the current context,
+        so that its spans belong to the request.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, func, *args, **kwargs))
+
+    async def current_generations(self) -> Dict[str, int]:
+        # Writes through other workers count as well when the store is shared. The shared state is a
+        # SQLite file that other workers may hold locked, so it is only read on the executor.
+        if self.shared_state is not None:
+            return await self.run(self.shared_state.generations)
+        return self.generations
+
+    async def bump_generation(self, *collections: str) -> None:
+        """
+        Record a write to the given collections, invalidating every cached result built from them.
+        """
+        if self.shared_state is not None:
+            await self.run(self.shared_state.bump_generation, *collections)
+            return
+        for collection in collections:
+            self.generations[collection] = self.generations.get(collection, 0) + 1
+
+    async def result_cache_key(self, collection: str, *parts: Any) -> tuple:
+        # Search results embed the ratings documents, so they depend on both generations
+        generations = await self.current_generations()
+        return (collection, generations.get(collection, 0), generations.get("ratings", 0)) + parts
+
+    async def get_cursor(self, search_id: str) -> Optional[Any]:
+        if self.shared_state is not None:
+            return await self.run(self.cursor_cache.get, search_id)
+        return self.cursor_cache.get(search_id)
+
+    async def put_cursor(self, search_id: str, value: Any) -> None:
+        if self.shared_state is not None:
+            await self.run(self.cursor_cache.put, search_id, value)
+        else:
+            self.cursor_cache.put(search_id, value)
 
     # def __init__(self):
     #     self.agents_db = None  # Initialize your Chroma DB here
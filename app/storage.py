@@ -0,0 +1,166 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Any, Optional
+
+import chromadb
+from chromadb.config import Settings as ChromaSettings
+from chromadb.telemetry.product import ProductTelemetryClient, ProductTelemetryEvent
+from overrides import override
+
+from app.config import Settings
+from app.ratings_store import RatingsStore, migrate_legacy_ratings
+from app.shared_state import SharedState
+
+COLLECTION_METADATA = {"hnsw:space": "cosine"}
+
+# Chroma's default telemetry client batches events in a dict shared by request threads without a
+# lock, which fails concurrent queries, so clients and the Chroma server use this one instead
+PRODUCT_TELEMETRY_IMPL = "app.storage.NoProductTelemetry"
+
+# Chroma collection name -> AppState attribute holding it
+COLLECTIONS = {
+    "agents": "agents_db",
+    "applications": "applications_db",
+}
+
+
+class NoProductTelemetry(ProductTelemetryClient):
+
+    # Chroma's components reject overriding methods that are not decorated
+    @override
+    def capture(self, event: ProductTelemetryEvent) -> None:
+        pass
+
+
+def chroma_settings() -> ChromaSettings:
+    return ChromaSettings(anonymized_telemetry=False, chroma_product_telemetry_impl=PRODUCT_TELEMETRY_IMPL)
+
+
+def create_client(settings: Settings) -> Any:
+    """
+    Create the Chroma client for the configured storage mode. In persistent mode collections and
+    their HNSW indexes are kept in the data directory and survive restarts. In server mode they are
+    kept by a Chroma server, which several worker processes can share.
+    """
+    if settings.storage_mode == "server":
+        logging.info("Connecting to Chroma server at %s:%s", settings.chroma_host, settings.chroma_port)
+        return chromadb.HttpClient(host=settings.chroma_host, port=settings.chroma_port, settings=chroma_settings())
+    if settings.storage_mode == "persistent":
+        data_dir = os.path.abspath(settings.data_dir)
+        os.makedirs(data_dir, exist_ok=True)
+        logging.info("Opening persistent Chroma store in %s", data_dir)
+        return chromadb.PersistentClient(path=data_dir, settings=chroma_settings())
+    return chromadb.Client(chroma_settings())
+
+
+def data_path(settings: Settings, name: str) -> str:
+    data_dir = os.path.abspath(settings.data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    return os.path.join(data_dir, name)
+
+
+def start_chroma_server(settings: Settings, timeout_seconds: float = 60) -> subprocess.Popen:
+    """
+    Start a Chroma server process serving the persistent store in the data directory, so that
+    several worker processes can share it, and wait until it answers.
+    """
+    data_dir = os.path.abspath(settings.data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    logging.info("Starting Chroma server for %s on %s:%s", data_dir, settings.chroma_host, settings.chroma_port)
+    # The server imports the telemetry client from this package
+    python_path = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] + \
+        [path for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path]
+    process = subprocess.Popen([sys.executable, "-m", "chromadb.cli.cli", "run", "--path", data_dir,
+                                "--host", settings.chroma_host, "--port", str(settings.chroma_port),
+                                "--log-path", os.path.join(data_dir, "chroma.log")],
+                               env={**os.environ, "PYTHONPATH": os.pathsep.join(python_path),
+                                    "ANONYMIZED_TELEMETRY": "False",
+                                    "CHROMA_PRODUCT_TELEMETRY_IMPL": PRODUCT_TELEMETRY_IMPL},
+                               stdout=subprocess.DEVNULL)
+    heartbeat_url = f"http://{settings.chroma_host}:{settings.chroma_port}/api/v1/heartbeat"
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"Chroma server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(heartbeat_url, timeout=1):
+                return process
+        except OSError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f"Chroma server did not answer within {timeout_seconds} seconds")
+            time.sleep(0.1)
+
+
+def create_shared_collections(settings: Settings) -> None:
+    """
+    Create the collections before the workers start, since Chroma fails concurrent creations of
+    the same collection, while opening an existing one concurrently is safe.
+    """
+    db_client = create_client(settings)
+    try:
+        for name in COLLECTIONS:
+            db_client.get_or_create_collection(name=name, metadata=COLLECTION_METADATA, embedding_function=None)
+    finally:
+        db_client.clear_system_cache()
+
+
+def create_ratings_store(settings: Settings) -> RatingsStore:
+    if settings.storage_mode != "memory":
+        return RatingsStore(data_path(settings, "ratings.sqlite3"))
+    return RatingsStore()
+
+
+def create_shared_state(settings: Settings) -> Optional[SharedState]:
+    """
+    Workers sharing a Chroma server share their generations and cursors as well, so every worker
+    reads its own and the others' writes.
+    """
+    if settings.storage_mode == "server":
+        return SharedState(data_path(settings, "shared-state.sqlite3"))
+    return None
+
+
+def open_collections(app_state: Any) -> None:
+    """
+    Attach the agents and applications collections and the ratings store to the app state. The
+    in-memory store starts empty on every boot, while the persistent store reopens the existing
+    collections without re-embedding anything.
+    """
+    app_state.ratings_db = create_ratings_store(app_state.settings)
+    migrate_legacy_ratings(app_state.db_client, app_state.ratings_db)
+
+    db_client = app_state.db_client
+    for name, attribute in COLLECTIONS.items():
+        if app_state.settings.storage_mode != "memory":
+            collection = db_client.get_or_create_collection(name=name, metadata=COLLECTION_METADATA,
+                                                            embedding_function=app_state.embedding_function)
+            logging.info("Opened collection %s with %s records", name, collection.count())
+        else:
+            if name in [c.name for c in db_client.list_collections()]:
+                db_client.delete_collection(name=name)
+            collection = db_client.create_collection(name=name, metadata=COLLECTION_METADATA,
+                                                     embedding_function=app_state.embedding_function)
+        setattr(app_state, attribute, collection)
+
+
+def reset_collection(app_state: Any, name: str) -> Any:
+    """
+    Drop a collection and recreate it empty. In server mode other workers hold the collection by
+    its ID, so it is emptied in place instead.
+    """
+    if app_state.settings.storage_mode == "server":
+        collection = getattr(app_state, COLLECTIONS[name])
+        ids = collection.get(include=[])["ids"]
+        for start in range(0, len(ids), app_state.settings.ingest_batch_size):
+            collection.delete(ids=ids[start:start + app_state.settings.ingest_batch_size])
+        return collection
+    app_state.db_client.delete_collection(name=name)
+    collection = app_state.db_client.create_collection(name=name, metadata=COLLECTION_METADATA,
+                                                       embedding_function=app_state.embedding_function)
+    setattr(app_state, COLLECTIONS[name], collection)
+    return collection
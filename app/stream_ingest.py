@@ -0,0 +1,166 @@
+import asyncio
+import codecs
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from app.ingest import WRITTEN_STATUSES, IngestRecord, validate_document, write_batch
+from app.metrics import PARSE_SECONDS
+from app.storage import COLLECTIONS
+
+# Batches parsed ahead of the storage writes. Together with the batch being parsed this bounds
+# the number of documents held in memory to (MAX_QUEUED_BATCHES + 2) * batch_size.
+MAX_QUEUED_BATCHES = 2
+MAX_REPORTED_ERRORS = 100
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Decode a byte stream as UTF-8 and yield it line by line without the line endings. Multi-byte
+    characters split across chunks are decoded correctly.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts: List[str] = []
+    async for chunk in chunks:
+        lines = decoder.decode(chunk).split("\n")
+        if len(lines) == 1:
+            parts.append(lines[0])
+            continue
+        parts.append(lines[0])
+        yield "".join(parts).rstrip("\r")
+        for line in lines[1:-1]:
+            yield line.rstrip("\r")
+        parts = [lines[-1]]
+    parts.append(decoder.decode(b"", final=True))
+    tail = "".join(parts)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def iter_ndjson_documents(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for line in lines:
+        if line.strip():
+            yield line
+
+
+async def iter_yaml_documents(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Split a multi-document YAML stream on its "---" and "..." markers. Markers only count at the
+    start of a line, so indented block scalars containing "---" stay intact.
+    """
+    document: List[str] = []
+    async for line in lines:
+        if line.startswith("---") and (len(line) == 3 or line[3] in " \t"):
+            if any(part.strip() for part in document):
+                yield "\n".join(document)
+            remainder = line[3:].strip()
+            document = [remainder] if remainder else []
+        elif line == "...":
+            if any(part.strip() for part in document):
+                yield "\n".join(document)
+            document = []
+        else:
+            document.append(line)
+    if any(part.strip() for part in document):
+        yield "\n".join(document)
+
+
+def prepare_batch(documents: List[Tuple[int, str]], parse: Callable[[str], Any],
+                  build_record: Callable[[int, Dict[str, Any]], IngestRecord]) -> Tuple[List[IngestRecord], List[Dict[str, Any]]]:
+    """
+    Parse and validate a batch of raw documents. Returns the records to write and an error entry for
+    every document that could not be parsed or is invalid.
+    """
+    records, errors = [], []
+    for index, text in documents:
+        try:
+            with PARSE_SECONDS.time():
+                parsed_data = parse(text)
+        except (ValueError, yaml.YAMLError) as e:
+            errors.append({"index": index, "status": "invalid", "error": f"Invalid document: {str(e)}"})
+            continue
+        error = validate_document(parsed_data)
+        if error is not None:
+            errors.append({"index": index, "status": "invalid", "error": error})
+            continue
+        records.append(build_record(index, parsed_data))
+    return records, errors
+
+
+async def stream_add_documents(app_state: Any, documents: AsyncIterator[str], parse: Callable[[str], Any],
+                               build_record: Callable[[int, Dict[str, Any]], IngestRecord], collection_name: str,
+                               parent_key: str, batch_size: int) -> Dict[str, Any]:
+    """
+    Ingest documents as they arrive. Raw documents are grouped into batches, each batch is parsed on
+    the executor and handed to a writer task through a bounded queue, so receiving and parsing the
+    next batch overlaps with storing the previous one and memory use depends on the batch size
+    rather than the payload size. Returns an ingest report with counts and the first errors.
+    """
+    start_time = time.perf_counter()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_BATCHES)
+    counts = {"created": 0, "updated": 0, "unchanged": 0, "duplicate": 0, "invalid": 0, "failed": 0}
+    errors: List[Dict[str, Any]] = []
+
+    def record_errors(entries: List[Dict[str, Any]]) -> None:
+        errors.extend(entries[:MAX_REPORTED_ERRORS - len(errors)])
+
+    async def writer() -> None:
+        while True:
+            records: Optional[List[IngestRecord]] = await queue.get()
+            if records is None:
+                return
+            try:
+                statuses = await app_state.run(write_batch, getattr(app_state, COLLECTIONS[collection_name]),
+                                               app_state.ratings_db, records, parent_key, app_state.embedding_function,
+                                               app_state.text_splitter)
+                if any(status in WRITTEN_STATUSES for status in statuses):
+                    await app_state.bump_generation(collection_name, "ratings")
+                for status in statuses:
+                    counts[status] += 1
+            except Exception as e:
+                logging.error("Failed to add documents to Chroma DB: %s", e)
+                counts["failed"] += len(records)
+                record_errors([{"index": record.index, "status": "failed",
+                                "error": "Failed to add documents to Chroma DB"} for record in records])
+
+    async def submit(batch: List[Tuple[int, str]]) -> None:
+        records, batch_errors = await app_state.run(prepare_batch, batch, parse, build_record)
+        counts["invalid"] += len(batch_errors)
+        record_errors(batch_errors)
+        if records:
+            await queue.put(records)
+
+    writer_task = asyncio.create_task(writer())
+    try:
+        batch: List[Tuple[int, str]] = []
+        index = 0
+        async for text in documents:
+            batch.append((index, text))
+            index += 1
+            if len(batch) >= batch_size:
+                await submit(batch)
+                batch = []
+        if batch:
+            await submit(batch)
+        await queue.put(None)
+        await writer_task
+    except BaseException:
+        # The client went away or parsing failed, batches already written are kept
+        writer_task.cancel()
+        raise
+
+    elapsed = time.perf_counter() - start_time
+    report = {
+        "received": index,
+        **counts,
+        "errors": errors,
+        "batch_size": batch_size,
+        "elapsed_seconds": round(elapsed, 6),
+        "docs_per_second": round((counts["created"] + counts["updated"]) / elapsed, 2) if elapsed > 0 else None,
+    }
+    logging.info("Streaming ingest stored %s new and %s updated %s at %s docs/s", report["created"], report["updated"],
+                 collection_name, report["docs_per_second"],
+                 extra={"fields": {**counts, "errors": len(errors), "elapsed_seconds": report["elapsed_seconds"]}})
+    return report
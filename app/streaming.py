@@ -0,0 +1,60 @@
+import logging
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.filters import SearchFilters
+from app.metrics import SERIALIZE_SECONDS
+from app.pagination import NEXT_CURSOR_HEADER, attach_ratings, fetch_documents, rank_page
+from app.storage import COLLECTIONS
+
+# Number of results whose documents and ratings are loaded together while streaming
+STREAM_CHUNK_SIZE = 100
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def stream_search_results(app_state: Any, collection: Any, page_ids: List[str],
+                                serialize: Callable[[str, Dict[str, Any]], str]) -> AsyncIterator[str]:
+    """
+    Yield the search results one serialized manifest at a time. Documents and ratings are loaded
+    in chunks of STREAM_CHUNK_SIZE, so only one chunk is held in memory and the first results are
+    sent before the later ones are loaded.
+    """
+    for start in range(0, len(page_ids), STREAM_CHUNK_SIZE):
+        chunk_ids = page_ids[start:start + STREAM_CHUNK_SIZE]
+        try:
+            results = await app_state.run(fetch_documents, collection, chunk_ids)
+            results = await attach_ratings(app_state, results)
+        except Exception as e:
+            # The status line has already been sent, so the stream can only be cut short
+            logging.error("Failed to stream search results: %s", e)
+            return
+        with SERIALIZE_SECONDS.time():
+            lines = [serialize(document, ratings) for document, ratings in results]
+        for line in lines:
+            yield line
+
+
+async def streaming_search_response(app_state: Any, collection_name: str, query: Optional[str], filters: SearchFilters,
+                                    limit: int, cursor: Optional[str], serialize: Callable[[str, Dict[str, Any]], str],
+                                    media_type: str) -> StreamingResponse:
+    """
+    Rank one page of search results and stream it. Streamed responses bypass the result cache.
+    """
+    try:
+        page_ids, next_cursor = await rank_page(app_state, collection_name, query, filters, limit, cursor)
+        logging.info("Similarity search query executed successfully for %s", collection_name)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        logging.error("Failed to execute similarity search query for %s: %s", collection_name, e)
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                            detail=f"Failed to execute similarity search query for {collection_name}")
+
+    collection = getattr(app_state, COLLECTIONS[collection_name])
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor is not None else None
+    return StreamingResponse(stream_search_results(app_state, collection, page_ids, serialize),
+                             media_type=media_type, headers=headers)
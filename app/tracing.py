@@ -0,0 +1,350 @@
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.codec import json_dumps, json_dumps_bytes
+
+SERVICE_NAME = "agenticdb"
+
+# Request header opting a request into the Server-Timing response header
+TIMING_REQUEST_HEADER = b"x-timing"
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# The innermost open span of the current request, None when the request is not traced
+CURRENT_SPAN: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    The finished spans of one request.
+    """
+
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans: List["Span"] = []
+
+
+class Span:
+    """
+    A timed block of a traced request, used as a context manager. Entering it makes it the parent
+    of the spans opened inside it, also in executor threads started from it.
+    """
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "kind", "attributes", "start_ns", "end_ns", "status",
+                 "_token")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = 0
+        self.end_ns = 0
+        self.status = STATUS_OK
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._token = CURRENT_SPAN.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, *exc_info: Any) -> None:
+        self.end_ns = time.time_ns()
+        CURRENT_SPAN.reset(self._token)
+        if exc_type is not None:
+            self.status = STATUS_ERROR
+        self.trace.spans.append(self)
+
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class _NoSpan:
+    """
+    Stands in for a span when the request is not traced, so that tracing costs one context
+    variable lookup.
+    """
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """
+    Open a child span of the current span, or a no-op when the request is not traced.
+    """
+    parent = CURRENT_SPAN.get()
+    if parent is None:
+        return NO_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes=attributes)
+
+
+def server_timing(trace: Trace, root: Span) -> str:
+    """
+    Server-Timing header value with the milliseconds spent per span name, and in total.
+    """
+    durations: Dict[str, float] = {}
+    for finished in list(trace.spans):
+        if finished is not root:
+            durations[finished.name] = durations.get(finished.name, 0.0) + finished.duration_ms()
+    metrics = [f"{name};dur={duration:.3f}" for name, duration in durations.items()]
+    metrics.append(f"total;dur={root.duration_ms():.3f}")
+    return ", ".join(metrics)
+
+
+def parse_traceparent(value: str) -> Optional[tuple]:
+    """
+    Trace ID and parent span ID of a W3C traceparent header, None when it is malformed.
+    """
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": otlp_value(value)} for key, value in attributes.items()]
+
+
+def otlp_request(spans: Iterable[Span]) -> Dict[str, Any]:
+    """
+    An OTLP ExportTraceServiceRequest in its JSON encoding.
+    """
+    encoded = []
+    for finished in spans:
+        entry = {
+            "traceId": finished.trace.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": finished.kind,
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns),
+            "attributes": otlp_attributes(finished.attributes),
+            "status": {"code": finished.status},
+        }
+        if finished.parent_id is not None:
+            entry["parentSpanId"] = finished.parent_id
+        encoded.append(entry)
+    return {"resourceSpans": [{
+        "resource": {"attributes": otlp_attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": encoded}],
+    }]}
+
+
+class FileSpanExporter:
+    """
+    Appends every batch of spans to a file as one OTLP JSON line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json_dumps(otlp_request(spans)) + "\n")
+
+
+class OTLPHttpSpanExporter:
+    """
+    Posts every batch of spans to the /v1/traces endpoint of an OTLP/HTTP collector as JSON.
+    """
+
+    def __init__(self, endpoint: str, timeout_seconds: float = 10):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout_seconds = timeout_seconds
+
+    def export(self, spans: List[Span]) -> None:
+        request = urllib.request.Request(self.url, data=json_dumps_bytes(otlp_request(spans)),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout_seconds):
+            pass
+
+
+class BatchSpanProcessor:
+    """
+    Queues finished traces and exports them in batches from a background thread, so that requests
+    never wait for the exporter.
+    """
+
+    def __init__(self, exporter: Any, max_batch_size: int = 512, interval_seconds: float = 1.0):
+        self.exporter = exporter
+        self.max_batch_size = max_batch_size
+        self.interval_seconds = interval_seconds
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="agenticdb-span-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: List[Span]) -> None:
+        self._queue.put(spans)
+
+    def _run(self) -> None:
+        closing = False
+        while not closing:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval_seconds
+            while len(batch) < self.max_batch_size:
+                try:
+                    spans = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if spans is None:
+                    closing = True
+                    break
+                batch.extend(spans)
+            if batch:
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    logging.warning("Failed to export %s spans: %s", len(batch), e)
+
+    def close(self) -> None:
+        """
+        Export the queued spans and stop the background thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+
+class Tracer:
+    """
+    Decides which requests are traced: a sampled share of all requests when spans are exported, and
+    requests asking for the Server-Timing header when it is enabled.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, timing_header: bool = False,
+                 processor: Optional[BatchSpanProcessor] = None):
+        self.sample_rate = sample_rate if processor is not None else 0.0
+        self.timing_header = timing_header
+        self.processor = processor
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.timing_header
+
+    def wants_timing(self, headers: Iterable[tuple]) -> bool:
+        return self.timing_header and any(name == TIMING_REQUEST_HEADER and value not in (b"", b"0")
+                                          for name, value in headers)
+
+    def is_sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def start_request(self, scope: Dict[str, Any]) -> Span:
+        """
+        Root span of a request, continuing the trace of a W3C traceparent header when there is one.
+        """
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+        trace = Trace(parent[0] if parent is not None else None)
+        return Span(trace, scope["method"] + " " + scope["path"], parent[1] if parent is not None else None,
+                    kind=SPAN_KIND_SERVER, attributes={"http.method": scope["method"], "http.target": scope["path"]})
+
+    def finish_request(self, root: Span) -> None:
+        if self.processor is not None:
+            self.processor.submit(root.trace.spans)
+
+    def close(self) -> None:
+        if self.processor is not None:
+            self.processor.close()
+
+
+def create_tracer(settings: Any) -> Tracer:
+    exporter = None
+    if settings.trace_otlp_endpoint:
+        exporter = OTLPHttpSpanExporter(settings.trace_otlp_endpoint)
+    elif settings.trace_export_path:
+        exporter = FileSpanExporter(settings.trace_export_path)
+    processor = BatchSpanProcessor(exporter) if exporter is not None else None
+    return Tracer(settings.trace_sample_rate, settings.timing_header, processor)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of traced requests and adding the Server-Timing header
+    to the responses of requests sent with X-Timing: 1. The header covers the spans finished
+    before the response starts, so the chunks of a streamed response are not included.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        app_state = getattr(scope["app"].state, "app_state", None) if scope["type"] == "http" else None
+        tracer = app_state.tracer if app_state is not None else None
+        if tracer is None or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        timing = tracer.wants_timing(scope["headers"])
+        if not timing and not tracer.is_sampled():
+            await self.app(scope, receive, send)
+            return
+
+        root = tracer.start_request(scope)
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = STATUS_ERROR
+                if timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(root.trace, root).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                root.name = scope["method"] + " " + route.path
+                root.set_attribute("http.route", route.path)
+            tracer.finish_request(root)
@@ -0,0 +1,16 @@
+def travel_agent(i, name_prefix="travel-agent", **spec):
+    """
+    Manifest of the i-th travel booking agent, with the given fields added to its spec.
+    """
+    return {
+        "metadata": {
+            "name": f"{name_prefix}-{i}",
+            "namespace": "production",
+            "description": f"Books hotels and flights for business travellers in region {i}"
+        },
+        "spec": {"type": "agent", "category": "Travel", **spec}
+    }
+
+
+def travel_agents(count, start=0, **kwargs):
+    return [travel_agent(i, **kwargs) for i in range(start, start + count)]
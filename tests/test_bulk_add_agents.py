@@ -0,0 +1,110 @@
+from http import HTTPStatus
+import math
+import unittest
+import warnings
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+
+import yaml
+from fastapi.testclient import TestClient
+
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class CountingCollection:
+    """
+    Wraps a Chroma collection and counts the add() and upsert() calls made against it.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.add_calls = 0
+        self.upsert_calls = 0
+
+    def add(self, *args, **kwargs):
+        self.add_calls += 1
+        return self.collection.add(*args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        self.upsert_calls += 1
+        return self.collection.upsert(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class TestBulkAddAgents(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.post_headers = {'Content-Type': 'application/x-yaml', 'Accept': 'application/json'}
+        script_dir = Path(__file__).resolve().parent
+        cls.agent_test_file = script_dir / 'data' / 'agents.yaml'
+
+    def test_bulk_post_yaml(self):
+        with open(self.agent_test_file, "r") as file:
+            agents = list(yaml.safe_load_all(file.read()))
+        # A document without metadata must be reported without failing the rest of the batch
+        documents = agents + [{"spec": {"type": "agent"}}]
+        batch_size = 20
+
+        with TestClient(create_app()) as c:
+            app_state = c.app.state.app_state
+            agents_db = CountingCollection(app_state.agents_db)
+            ratings_db = CountingCollection(app_state.ratings_db)
+            app_state.agents_db, app_state.ratings_db = agents_db, ratings_db
+
+            response = c.post("/agents", params={"bulk": "true", "batch_size": batch_size},
+                              content=yaml.dump_all(documents), headers=self.post_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            report = response.json()
+            print({key: value for key, value in report.items() if key != "documents"})
+
+            self.assertEqual(len(agents), report["created"])
+            self.assertEqual(1, report["invalid"])
+            self.assertEqual(0, report["failed"])
+            self.assertGreater(report["docs_per_second"], 0)
+            self.assertEqual(len(documents), len(report["documents"]))
+            for index, status in enumerate(report["documents"]):
+                self.assertEqual(index, status["index"])
+            self.assertEqual("invalid", report["documents"][-1]["status"])
+            self.assertTrue(all(status["status"] == "created" for status in report["documents"][:-1]))
+
+            expected_calls = math.ceil(len(agents) / batch_size)
+            self.assertEqual(expected_calls, agents_db.upsert_calls)
+            self.assertEqual(expected_calls, ratings_db.add_calls)
+            self.assertEqual(len(agents), agents_db.count())
+            self.assertEqual(len(agents), ratings_db.count())
+
+    def test_bulk_post_malformed_spec(self):
+        documents = [{"metadata": {"name": "bad-spec"}, "spec": "oops"},
+                     {"metadata": {"name": "list-spec"}, "spec": ["oops"]},
+                     {"metadata": {"name": "good"}, "spec": {"type": "agent"}}]
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", params={"bulk": "true"}, content=yaml.dump_all(documents),
+                              headers=self.post_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            report = response.json()
+            self.assertEqual(1, report["created"])
+            self.assertEqual(["invalid", "invalid", "created"], [status["status"] for status in report["documents"]])
+
+    def test_bulk_post_repeated_name(self):
+        documents = [{"metadata": {"name": "travel", "description": "First"}, "spec": {"type": "agent"}},
+                     {"metadata": {"name": "hotels"}, "spec": {"type": "agent"}},
+                     {"metadata": {"name": "travel", "description": "Second"}, "spec": {"type": "agent"}}]
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", params={"bulk": "true"}, content=yaml.dump_all(documents),
+                              headers=self.post_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            report = response.json()
+            # Only the last manifest with a name is stored
+            self.assertEqual(["duplicate", "created", "created"], [status["status"] for status in report["documents"]])
+            self.assertEqual([2, 1], [report["created"], report["duplicate"]])
+            self.assertEqual(2, c.app.state.app_state.agents_db.count())
+
+
+if __name__ == "__main__":
+    unittest.main()
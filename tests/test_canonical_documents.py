@@ -0,0 +1,78 @@
+from http import HTTPStatus
+import json
+import unittest
+import uuid
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import yaml
+from fastapi.testclient import TestClient
+
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class TestCanonicalDocuments(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.json_headers = {'Accept': 'application/json'}
+        cls.yaml_headers = {'Accept': 'application/x-yaml'}
+        cls.query = "Which agents can book travel?"
+
+    def setUp(self):
+        self.manifest = {
+            "metadata": {
+                "name": "travel-agent",
+                "namespace": "production",
+                "description": "Books hotels and flights for business travellers"
+            },
+            "spec": {
+                "type": "agent",
+                "lifecycle": "stable",
+                "owner": "alice@business.com",
+                "url": "https://api.business.com/travel"
+            }
+        }
+
+    def search(self, client, headers):
+        response = client.get("/agents", params={"query": self.query}, headers=headers)
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        return response
+
+    def test_yaml_ingest_served_as_json_and_yaml(self):
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", content=yaml.dump(self.manifest),
+                              headers={'Content-Type': 'application/x-yaml', 'Accept': 'application/x-yaml'})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            agent_id = yaml.safe_load(response.content)["metadata"]["id"]
+
+            stored = c.app.state.app_state.agents_db.get(ids=[agent_id], include=["documents", "metadatas"])
+            document = json.loads(stored["documents"][0])
+            self.assertEqual(document["metadata"]["ratings_id"], stored["metadatas"][0]["ratings_id"])
+
+            json_agents = self.search(c, self.json_headers).json()
+            yaml_agents = list(yaml.safe_load_all(self.search(c, self.yaml_headers).content))
+            self.assertEqual(json_agents, yaml_agents)
+            self.assertEqual(document["metadata"]["ratings_id"], json_agents[0]["ratings"]["id"])
+            self.assertEqual(self.manifest["spec"], json_agents[0]["spec"])
+
+    def test_legacy_yaml_document(self):
+        with TestClient(create_app()) as c:
+            app_state = c.app.state.app_state
+            agent_id, ratings_id = str(uuid.uuid4()), str(uuid.uuid4())
+            self.manifest["metadata"].update({"id": agent_id, "ratings_id": ratings_id})
+            app_state.agents_db.add(ids=[agent_id], documents=[yaml.dump(self.manifest)],
+                                    metadatas=[{"id": agent_id, "version": 1}])
+            app_state.ratings_db.add(ids=[ratings_id], parent_key="agent_id", parent_ids=[agent_id])
+
+            json_agents = self.search(c, self.json_headers).json()
+            yaml_agents = list(yaml.safe_load_all(self.search(c, self.yaml_headers).content))
+            self.assertEqual(json_agents, yaml_agents)
+            self.assertEqual(ratings_id, json_agents[0]["ratings"]["id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
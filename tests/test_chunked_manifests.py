@@ -0,0 +1,88 @@
+from http import HTTPStatus
+import copy
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def manifest(name, description, parameters):
+    return {
+        "metadata": {"name": name, "namespace": "production", "description": description},
+        "spec": {
+            "type": "agent",
+            "lifecycle": "stable",
+            "owner": "alice@business.com",
+            "access_level": "PUBLIC",
+            "category": "Science",
+            "url": f"https://api.business.com/{name}",
+            "parameters": {"type": "object", "properties": parameters, "required": [],
+                           "additionalProperties": False}
+        }
+    }
+
+
+class TestChunkedManifests(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        cls.query = "Which agent converts Martian sols into Earth days?"
+
+    def setUp(self):
+        parameters = {f"reading_{i}": {"type": "number", "description": f"Laboratory sensor reading number {i}"}
+                      for i in range(80)}
+        # Far beyond the first chunk of the embedding text
+        parameters["sol"] = {"type": "number", "description": "Martian sols to convert into Earth days"}
+        self.large = manifest("lab-assistant", "Records laboratory sensor readings", parameters)
+        self.small = [manifest(f"helper-{i}", f"Answers questions about topic {i}",
+                               {"question": {"type": "string", "description": "The question"}})
+                      for i in range(5)]
+
+    def register(self, client, manifests):
+        response = client.post("/agents", params={"bulk": "true"}, json=copy.deepcopy(manifests), headers=self.headers)
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        return response.json()
+
+    def search(self, client):
+        response = client.get("/agents", params={"query": self.query, "limit": 10}, headers=self.headers)
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        return [agent["metadata"]["name"] for agent in response.json()]
+
+    def test_large_manifest_is_chunked(self):
+        for scoring in ("max", "mean"):
+            with self.subTest(scoring=scoring), TestClient(create_app(Settings(chunk_scoring=scoring))) as c:
+                agents_db = c.app.state.app_state.agents_db
+                large = copy.deepcopy(self.large)
+                report = self.register(c, [large] + self.small)
+                self.assertEqual(6, report["created"])
+                large_id = report["documents"][0]["id"]
+
+                chunks = agents_db.get(ids=[large_id], include=["metadatas"])["metadatas"][0]["chunks"]
+                self.assertGreater(chunks, 1)
+                self.assertEqual(6 + chunks - 1, agents_db.count())
+
+                # Chunk hits are collapsed into unique agents, ranked by the chunk that matches
+                names = self.search(c)
+                self.assertEqual(6, len(names))
+                self.assertEqual(6, len(set(names)))
+                self.assertEqual("lab-assistant", names[0])
+
+                # Fewer chunks after an update leave no stale chunk records behind
+                large["spec"]["parameters"]["properties"] = {
+                    "sol": {"type": "number", "description": "Martian sols to convert into Earth days"}}
+                report = self.register(c, [large])
+                self.assertEqual(1, report["updated"])
+                self.assertEqual(6, agents_db.count())
+                self.assertEqual("lab-assistant", self.search(c)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
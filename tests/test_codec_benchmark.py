@@ -0,0 +1,65 @@
+import json
+import os
+from pathlib import Path
+import time
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import yaml
+
+from app import codec
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def ops_per_second(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - start)
+
+
+class TestCodecBenchmark(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        data_dir = Path(__file__).resolve().parent / 'data'
+        cls.agents_yaml = (data_dir / 'agents.yaml').read_text()
+        cls.agents_json = (data_dir / 'agents.json').read_text()
+        cls.agents = list(yaml.safe_load_all(cls.agents_yaml))
+
+    def compare(self, name, baseline, candidate, accelerated, iterations):
+        baseline_rate = ops_per_second(baseline, iterations)
+        candidate_rate = ops_per_second(candidate, iterations)
+        print(f"{name}: baseline {baseline_rate:.1f} ops/s, codec {candidate_rate:.1f} ops/s "
+              f"({candidate_rate / baseline_rate:.1f}x)")
+        if accelerated:
+            self.assertGreater(candidate_rate, baseline_rate)
+
+    def test_round_trips(self):
+        self.assertEqual(self.agents, list(codec.yaml_load_all(self.agents_yaml)))
+        self.assertEqual(self.agents, [codec.yaml_load(codec.yaml_dump(agent)) for agent in self.agents])
+        self.assertEqual(json.loads(self.agents_json), codec.json_loads(self.agents_json))
+        self.assertEqual(self.agents, codec.json_loads(codec.json_dumps(self.agents)))
+        # Values orjson cannot encode fall back to the standard library
+        self.assertEqual({"1": 2 ** 70}, json.loads(codec.json_dumps({1: 2 ** 70})))
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_yaml_benchmark(self):
+        self.compare("yaml load", lambda: list(yaml.safe_load_all(self.agents_yaml)),
+                     lambda: list(codec.yaml_load_all(self.agents_yaml)), codec.YAML_ACCELERATED, 20)
+        self.compare("yaml dump", lambda: [yaml.dump(agent, sort_keys=False) for agent in self.agents],
+                     lambda: [codec.yaml_dump(agent) for agent in self.agents], codec.YAML_ACCELERATED, 20)
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_json_benchmark(self):
+        self.compare("json loads", lambda: json.loads(self.agents_json),
+                     lambda: codec.json_loads(self.agents_json), codec.JSON_ACCELERATED, 200)
+        self.compare("json dumps", lambda: json.dumps(self.agents),
+                     lambda: codec.json_dumps(self.agents), codec.JSON_ACCELERATED, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
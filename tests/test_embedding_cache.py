@@ -0,0 +1,137 @@
+from http import HTTPStatus
+import copy
+import tempfile
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.embedding_cache import EmbeddingCache
+from app.server import create_app
+from tests.helpers import travel_agents
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class CountingEmbeddingFunction:
+    """
+    Wraps an embedding function and counts the texts it embeds.
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.texts = 0
+
+    def __call__(self, input):
+        self.texts += len(input)
+        return self.embedding_function(input)
+
+
+class TestEmbeddingCache(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manifests = travel_agents(20)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def client(self):
+        return TestClient(create_app(Settings(embedding_cache_dir=self.directory.name)))
+
+    def count_model_calls(self, client):
+        # Count the texts that reach the model behind the cache
+        cached = client.app.state.app_state.embedding_function
+        cached.embedding_function = CountingEmbeddingFunction(cached.embedding_function)
+        return cached.embedding_function
+
+    def register(self, client):
+        response = client.post("/agents", params={"bulk": "true"}, json=copy.deepcopy(self.manifests),
+                               headers=self.headers)
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        self.assertEqual(20, response.json()["created"])
+
+    def search(self, client):
+        response = client.get("/agents", params={"query": "hotels in region 7", "limit": 1}, headers=self.headers)
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        return response.json()[0]["metadata"]["name"]
+
+    def test_reindex_needs_no_model_calls(self):
+        with self.client() as c:
+            model = self.count_model_calls(c)
+            self.register(c)
+            self.assertEqual(20, model.texts)
+            name = self.search(c)
+            self.assertEqual(21, model.texts)
+
+            # The cache outlives the collections
+            response = c.delete("/collections")
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.register(c)
+            self.assertEqual(21, model.texts)
+            stats = c.get("/cache").json()["embeddings"]
+            self.assertEqual(21, stats["size"])
+            self.assertEqual(20, stats["hits"])
+
+        # And restarts
+        with self.client() as c:
+            model = self.count_model_calls(c)
+            self.register(c)
+            c.app.state.app_state.query_embedding_cache.clear()
+            self.assertEqual(name, self.search(c))
+            self.assertEqual(0, model.texts)
+
+    def test_eviction(self):
+        cache = EmbeddingCache(self.directory.name, max_entries=4)
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((6, 8)).astype(np.float32)
+        hashes = [cache.text_hash(f"text {i}") for i in range(6)]
+
+        cache.put_many("model", hashes[:4], vectors[:4])
+        # Reading the first entry leaves the second and third as the least recently used
+        self.assertIsNotNone(cache.get_many("model", hashes[:1])[0])
+        cache.put_many("model", hashes[4:], vectors[4:])
+        self.assertEqual(4, len(cache))
+
+        found = cache.get_many("model", hashes)
+        self.assertEqual([True, False, False, True, True, True], [vector is not None for vector in found])
+        for i in (0, 3, 4, 5):
+            np.testing.assert_array_equal(vectors[i], found[i])
+        # Other models do not share entries
+        self.assertEqual([None], cache.get_many("other-model", hashes[:1]))
+        cache.close()
+
+        # Entries are read back from disk after a restart
+        cache = EmbeddingCache(self.directory.name, max_entries=4)
+        np.testing.assert_array_equal(vectors[5], cache.get_many("model", hashes[5:])[0])
+        cache.close()
+
+    def test_lookups_do_not_write(self):
+        cache = EmbeddingCache(self.directory.name, max_entries=2)
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((3, 8)).astype(np.float32)
+        hashes = [cache.text_hash(f"text {i}") for i in range(3)]
+        cache.put_many("model", hashes[:2], vectors[:2])
+
+        changes = cache._connection.total_changes
+        self.assertIsNotNone(cache.get_many("model", hashes[:1])[0])
+        self.assertEqual(changes, cache._connection.total_changes)
+        cache.close()
+
+        # The read is remembered across restarts, so the second entry is evicted
+        cache = EmbeddingCache(self.directory.name, max_entries=2)
+        cache.put_many("model", hashes[2:], vectors[2:])
+        self.assertEqual([True, False, True], [vector is not None for vector in cache.get_many("model", hashes)])
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
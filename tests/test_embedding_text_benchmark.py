@@ -0,0 +1,109 @@
+from http import HTTPStatus
+import os
+import time
+import unittest
+import uuid
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.documents import embedding_text
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+SUBJECTS = ["hotel", "flight", "invoice", "payroll", "weather", "stock", "recipe", "shipment", "ticket", "contract",
+            "insurance", "mortgage", "vaccine", "playlist", "warehouse", "tax", "lease", "parking", "exam", "sensor"]
+ACTIONS = ["books", "cancels", "summarizes", "forecasts", "audits", "translates", "tracks", "validates", "compares",
+           "schedules", "prices", "archives", "reconciles", "recommends", "monitors"]
+
+
+def synthetic_agent(index, subject, action):
+    return {
+        "metadata": {
+            "name": f"{subject}-{action}-agent-{index}",
+            "namespace": "production",
+            "description": f"{action.capitalize()} {subject} records on request"
+        },
+        "spec": {
+            "type": "agent",
+            "lifecycle": "stable",
+            "owner": f"owner{index}@business.com",
+            "access_level": "PUBLIC",
+            "category": subject.capitalize(),
+            "url": f"https://api.business.com/{uuid.uuid4()}/agent",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    f"{subject}_id": {"type": "string", "description": f"Identifier of the {subject}"},
+                    "request_id": {"type": "string", "description": str(uuid.uuid4())},
+                    "thread": {"type": "string", "description": "The id to separate parallel message threads."}
+                },
+                "required": [f"{subject}_id", "thread"],
+                "additionalProperties": False
+            },
+            "output": {"type": "string", "description": "The result of the request."}
+        }
+    }
+
+
+class TestEmbeddingTextBenchmark(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        cls.top_k = 5
+        cls.agents = [synthetic_agent(index, subject, action)
+                      for index, (subject, action) in enumerate((subject, action) for subject in SUBJECTS
+                                                                for action in ACTIONS)]
+        cls.queries = [(f"Which agent {action} {subject} records?", f"{subject}-{action}-agent-{index}")
+                       for index, (subject, action) in enumerate((subject, action) for subject in SUBJECTS
+                                                                 for action in ACTIONS)][::10]
+
+    def measure(self, mode):
+        with TestClient(create_app(Settings(embedding_text_mode=mode, query_cache_size=0,
+                                            result_cache_size=0))) as c:
+            start_time = time.perf_counter()
+            response = c.post("/agents", params={"bulk": "true"}, json=self.agents, headers=self.headers)
+            docs_per_second = len(self.agents) / (time.perf_counter() - start_time)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual(len(self.agents), response.json()["created"])
+
+            hits = 0
+            for query, expected_name in self.queries:
+                response = c.get("/agents", params={"query": query, "limit": self.top_k}, headers=self.headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                hits += expected_name in [agent["metadata"]["name"] for agent in response.json()]
+            return docs_per_second, hits / len(self.queries)
+
+    def test_compact_embedding_text(self):
+        agent = self.agents[0]
+        text = embedding_text(agent, "compact")
+        self.assertEqual("hotel-books-agent-0\nBooks hotel records on request\nCategory: Hotel\n"
+                         "hotel_id: Identifier of the hotel\n"
+                         f"request_id: {agent['spec']['parameters']['properties']['request_id']['description']}\n"
+                         "thread: The id to separate parallel message threads.", text)
+        for left_out in (agent["spec"]["url"], agent["spec"]["owner"], "PUBLIC", "additionalProperties"):
+            self.assertNotIn(left_out, text)
+        self.assertIn(agent["spec"]["url"], embedding_text(agent, "full"))
+        self.assertLess(sum(len(embedding_text(agent, "compact")) for agent in self.agents),
+                        sum(len(embedding_text(agent, "full")) for agent in self.agents) / 2)
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_compact_and_full_embedding_text(self):
+        full_chars = sum(len(embedding_text(agent, "full")) for agent in self.agents)
+        compact_chars = sum(len(embedding_text(agent, "compact")) for agent in self.agents)
+        full_rate, full_recall = self.measure("full")
+        compact_rate, compact_recall = self.measure("compact")
+        print(f"full: {full_chars} chars embedded, {full_rate:.1f} docs/s, recall@{self.top_k} {full_recall:.2f}")
+        print(f"compact: {compact_chars} chars embedded, {compact_rate:.1f} docs/s, "
+              f"recall@{self.top_k} {compact_recall:.2f}")
+
+        self.assertGreaterEqual(compact_recall, full_recall)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+from http import HTTPStatus
+import os
+import threading
+import time
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+
+from app.config import Settings
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class SlowCollection:
+    """
+    Wraps a Chroma collection and makes every query block for a fixed time, standing in for a
+    slow local embedding or storage call. Counts the most queries that were in flight at once.
+    """
+
+    def __init__(self, collection, delay):
+        self.collection = collection
+        self.delay = delay
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def query(self, *args, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            return self.collection.query(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class TestExecutorConcurrency(IsolatedAsyncioTestCase):
+
+    concurrent_searches = 32
+    query_delay = 0.05
+
+    async def run_searches(self, executor_workers):
+        """
+        Run concurrent searches against a slow collection, and return the searches per second and
+        the most queries in flight at once.
+        """
+        app = create_app(Settings(executor_workers=executor_workers))
+        async with app.router.lifespan_context(app):
+            app_state = app.state.app_state
+            collection = app_state.agents_db = SlowCollection(app_state.agents_db, self.query_delay)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                start = time.perf_counter()
+                responses = await asyncio.gather(*[
+                    client.get("/agents", params={"query": f"Which agents can book travel? {i}"},
+                               headers={"Accept": "application/json"})
+                    for i in range(self.concurrent_searches)
+                ])
+                elapsed = time.perf_counter() - start
+        for response in responses:
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+        return self.concurrent_searches / elapsed, collection.peak_in_flight
+
+    async def test_queries_run_in_parallel_up_to_pool_size(self):
+        for executor_workers in (1, 4, 8):
+            _, peak_in_flight = await self.run_searches(executor_workers)
+            self.assertEqual(executor_workers, peak_in_flight)
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    async def test_throughput_scales_with_pool_size(self):
+        throughput = {}
+        for executor_workers in (1, 4, 8):
+            throughput[executor_workers], _ = await self.run_searches(executor_workers)
+            print(f"executor_workers={executor_workers}: {throughput[executor_workers]:.1f} searches/s")
+
+        self.assertGreater(throughput[4], 2.5 * throughput[1])
+        self.assertGreater(throughput[8], 1.2 * throughput[4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+from http import HTTPStatus
+import copy
+import tempfile
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.server import create_app
+from tests.helpers import travel_agent
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class CountingEmbeddingFunction:
+    """
+    Wraps an embedding function and counts the texts it embeds.
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.texts = 0
+
+    def __call__(self, input):
+        self.texts += len(input)
+        return self.embedding_function(input)
+
+
+class TestIdempotentRegistration(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def setUp(self):
+        self.manifests = [travel_agent(i, lifecycle="stable", owner="alice@business.com", access_level="PUBLIC",
+                                       url=f"https://api.business.com/travel-agent-{i}") for i in range(3)]
+
+    def register(self, client, manifests):
+        response = client.post("/agents", params={"bulk": "true"}, json=copy.deepcopy(manifests), headers=self.headers)
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        return response.json()
+
+    def stored(self, client):
+        results = client.app.state.app_state.agents_db.get(include=["metadatas"])
+        return {metadata["id"]: metadata for metadata in results["metadatas"]}
+
+    def test_reregistration_is_idempotent(self):
+        with TestClient(create_app()) as c:
+            app_state = c.app.state.app_state
+            embedding_function = CountingEmbeddingFunction(app_state.embedding_function)
+            app_state.embedding_function = embedding_function
+
+            report = self.register(c, self.manifests)
+            self.assertEqual(3, report["created"])
+            self.assertEqual(3, embedding_function.texts)
+            first = self.stored(c)
+            ids = [document["id"] for document in report["documents"]]
+            self.assertEqual(set(ids), set(first))
+
+            # Unchanged manifests are neither embedded nor written again
+            report = self.register(c, self.manifests)
+            self.assertEqual(3, report["unchanged"])
+            self.assertEqual(3, embedding_function.texts)
+            self.assertEqual(ids, [document["id"] for document in report["documents"]])
+            self.assertEqual(first, self.stored(c))
+            self.assertEqual(3, app_state.ratings_db.count())
+
+            # A changed manifest is updated in place and keeps its ratings
+            response = c.post("/ratings", json={"ratings": {"id": report["documents"][0]["ratings_id"],
+                                                            "data": {"score": 5}}})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.manifests[0]["metadata"]["description"] = "Books trains and ferries for business travellers"
+            report = self.register(c, self.manifests)
+            self.assertEqual([1, 2], [report["updated"], report["unchanged"]])
+            self.assertEqual(4, embedding_function.texts)
+            stored = self.stored(c)
+            self.assertEqual(3, len(stored))
+            self.assertEqual(2, stored[ids[0]]["version"])
+            self.assertEqual(1, stored[ids[1]]["version"])
+
+            response = c.get("/agents", params={"query": "trains and ferries", "limit": 1}, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            agent = response.json()[0]
+            self.assertEqual(ids[0], agent["metadata"]["id"])
+            self.assertEqual(self.manifests[0]["metadata"]["description"], agent["metadata"]["description"])
+            self.assertEqual(1, agent["ratings"]["data"]["samples"])
+
+    def test_switching_embedding_text_mode_reembeds(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            settings = Settings(storage_mode="persistent", data_dir=data_dir, embedding_cache_size=0)
+            with TestClient(create_app(settings)) as c:
+                self.assertEqual(3, self.register(c, self.manifests)["created"])
+                self.assertEqual(3, self.register(c, self.manifests)["unchanged"])
+
+            settings = settings.model_copy(update={"embedding_text_mode": "full"})
+            with TestClient(create_app(settings)) as c:
+                embedding_function = CountingEmbeddingFunction(c.app.state.app_state.embedding_function)
+                c.app.state.app_state.embedding_function = embedding_function
+                report = self.register(c, self.manifests)
+                self.assertEqual([0, 3, 0], [report["created"], report["updated"], report["unchanged"]])
+                self.assertEqual(3, embedding_function.texts)
+                self.assertEqual({2}, {metadata["version"] for metadata in self.stored(c).values()})
+                self.assertEqual(3, self.register(c, self.manifests)["unchanged"])
+
+    def test_same_name_in_other_namespace_is_another_agent(self):
+        with TestClient(create_app()) as c:
+            sandbox = copy.deepcopy(self.manifests[0])
+            sandbox["metadata"]["namespace"] = "sandbox"
+            report = self.register(c, [self.manifests[0], sandbox, self.manifests[0]])
+            self.assertEqual(["duplicate", "created", "created"],
+                             [document["status"] for document in report["documents"]])
+            self.assertEqual(2, report["created"])
+            self.assertEqual(2, len(self.stored(c)))
+
+
+if __name__ == '__main__':
+    unittest.main()
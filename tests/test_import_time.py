@@ -0,0 +1,60 @@
+import os
+import re
+import subprocess
+import sys
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from app.config import Settings
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time of app.server, about 1s on a development machine against 2s with
+# LangChain, LangServe and OpenAI imported eagerly
+IMPORT_TIME_BUDGET_SECONDS = 1.5
+
+# Integrations that are only imported when enabled
+OPTIONAL_MODULES = ["langserve", "langchain_openai", "langchain_core", "langchain_text_splitters", "openai",
+                    "requests"]
+
+
+def import_app_server():
+    """
+    Import app.server in a fresh interpreter and return its cumulative import time in seconds and
+    the names of the modules it imported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             "import sys, app.server; print('\\n'.join(sys.modules))"],
+                            cwd=REPOSITORY_DIR, capture_output=True, text=True, check=True)
+    match = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| app\.server$", result.stderr, re.MULTILINE)
+    return int(match.group(1)) / 1e6, set(result.stdout.split())
+
+
+class TestImportTime(IsolatedAsyncioTestCase):
+
+    def test_optional_integrations_are_not_imported(self):
+        _, modules = import_app_server()
+        self.assertEqual([], [name for name in OPTIONAL_MODULES if name in modules])
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_import_time_budget(self):
+        # The best of a few runs, so that a busy machine does not fail the budget
+        seconds = min(import_app_server()[0] for _ in range(3))
+        print(f"app.server imports in {seconds:.3f}s, budget {IMPORT_TIME_BUDGET_SECONDS}s")
+        self.assertLess(seconds, IMPORT_TIME_BUDGET_SECONDS)
+
+    def test_enabled_integration_is_mounted(self):
+        paths = [route.path for route in create_app(Settings(integrations="cascade")).router.routes]
+        self.assertIn("/cascade/invoke", paths)
+        self.assertNotIn("/joke/invoke", paths)
+        with self.assertRaises(ValueError):
+            create_app(Settings(integrations="unknown"))
+
+
+if __name__ == '__main__':
+    unittest.main()
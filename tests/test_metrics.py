@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import os
+import re
+import time
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.metrics import Histogram, LATENCY_BUCKETS
+from app.server import create_app
+from tests.helpers import travel_agents
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+SAMPLE = re.compile(r"^([a-z_]+)(\{.*\})? (\S+)$")
+
+
+def parse_metrics(text):
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            samples[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+class TestMetrics(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def setUp(self):
+        self.manifests = travel_agents(5)
+
+    def scrape(self, client):
+        response = client.get("/metrics")
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        return parse_metrics(response.text)
+
+    def test_route_and_stage_metrics(self):
+        with TestClient(create_app()) as c:
+            before = self.scrape(c)
+            response = c.post("/agents", json=self.manifests, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            for accept in ("application/json", "application/x-yaml"):
+                response = c.get("/agents", params={"query": "hotels", "limit": 5}, headers={"Accept": accept})
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+            after = self.scrape(c)
+
+            def delta(name):
+                return after.get(name, 0) - before.get(name, 0)
+
+            for stage in ("parse", "embed", "vector_query", "ratings_join", "serialize", "storage_write"):
+                self.assertGreater(delta(f'agenticdb_stage_duration_seconds_count{{stage="{stage}"}}'), 0, stage)
+            self.assertEqual(2, delta('agenticdb_request_duration_seconds_count{method="GET",route="/agents"}'))
+            self.assertEqual(1, delta('agenticdb_requests_total{method="POST",route="/agents",status="200"}'))
+            self.assertEqual(5, delta('agenticdb_documents_ingested_total{collection="agents",status="created"}'))
+            self.assertEqual(5, after['agenticdb_collection_records{collection="agents"}'])
+            self.assertEqual(5, after['agenticdb_collection_records{collection="ratings"}'])
+            # The YAML search reused the embedding of the JSON search
+            self.assertEqual(1, after['agenticdb_cache_hits_total{cache="query_embeddings"}'])
+
+    def test_histogram_from_many_threads(self):
+        histogram = Histogram()
+
+        def observe(_):
+            for value in (0.0001, 0.003, 0.2, 60.0):
+                histogram.observe(value)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(observe, range(1000)))
+        totals = histogram.totals()
+        self.assertEqual(4000, sum(totals[:-1]))
+        self.assertEqual(1000, totals[0])
+        self.assertEqual(1000, totals[len(LATENCY_BUCKETS)])
+        self.assertAlmostEqual(1000 * 60.2031, totals[-1], places=3)
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_recording_overhead(self):
+        histogram = Histogram()
+        iterations = 100000
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            with histogram.time():
+                pass
+        microseconds = (time.perf_counter() - start_time) / iterations * 1e6
+        self.assertLess(microseconds, 10, f"Timing a block costs {microseconds:.2f}us")
+
+
+if __name__ == '__main__':
+    unittest.main()
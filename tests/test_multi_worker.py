@@ -0,0 +1,177 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+
+from app.config import Settings, settings_environment
+from app.shared_state import SharedState
+from app.state import AppState
+from tests.helpers import travel_agent, travel_agents
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """
+    The API server started with `python -m app.server` and the given settings, stopped with SIGTERM.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.base_url = f"http://127.0.0.1:{settings.port}"
+        self.process = None
+
+    def __enter__(self):
+        env = {**os.environ, **settings_environment(self.settings)}
+        self.process = subprocess.Popen([sys.executable, "-m", "app.server"], cwd=REPOSITORY_DIR, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 180
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.base_url}/cache").status_code == HTTPStatus.OK:
+                    return self
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("Server did not start")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait(timeout=60)
+
+
+class TestMultiWorker(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.data_dir.cleanup()
+
+    def settings(self, workers, **overrides):
+        return Settings(workers=workers, storage_mode="persistent", data_dir=self.data_dir.name, host="127.0.0.1",
+                        port=free_port(), chroma_port=free_port(), **overrides)
+
+    def client(self, server):
+        # A new connection per request, so requests are spread over the workers
+        return httpx.Client(base_url=server.base_url, headers=self.headers, timeout=60,
+                            limits=httpx.Limits(max_keepalive_connections=0))
+
+    def search(self, c, **params):
+        response = c.get("/agents", params={"query": "hotels and flights", "limit": 100, **params})
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        return response
+
+    def concurrently(self, request, times=16):
+        # Requests in flight at the same time are accepted by different workers
+        with ThreadPoolExecutor(max_workers=times) as pool:
+            return list(pool.map(lambda _: request(), range(times)))
+
+    def test_reads_after_writes_across_workers(self):
+        with ServerProcess(self.settings(workers=2)) as server, self.client(server) as c:
+            for i in range(4):
+                response = c.post("/agents", json=[travel_agent(i)])
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                # Whichever worker answers, it sees the write and drops its cached results
+                for response in self.concurrently(lambda: self.search(c)):
+                    self.assertEqual(i + 1, len(response.json()))
+
+            ratings_id = self.search(c).json()[0]["ratings"]["id"]
+            response = c.post("/ratings", json={"ratings": {"id": ratings_id, "data": {"score": 4}}})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            for response in self.concurrently(lambda: c.get("/ratings", params={"ratings_id": ratings_id})):
+                self.assertEqual(1, response.json()["data"]["samples"])
+
+            # Cursors are valid on every worker
+            next_cursor = self.search(c, limit=3).headers["x-next-cursor"]
+            for response in self.concurrently(lambda: self.search(c, limit=3, cursor=next_cursor)):
+                self.assertEqual(1, len(response.json()))
+
+            response = c.delete("/collections")
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            for response in self.concurrently(lambda: self.search(c)):
+                self.assertEqual([], response.json())
+            response = c.post("/agents", json=[travel_agent(0)])
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            for response in self.concurrently(lambda: self.search(c)):
+                self.assertEqual(1, len(response.json()))
+
+    async def test_locked_shared_state_does_not_block_the_event_loop(self):
+        path = os.path.join(self.data_dir.name, "shared-state.sqlite3")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            app_state = AppState(executor=executor, shared_state=SharedState(path))
+            # Another worker holding the write lock
+            other_worker = sqlite3.connect(path, isolation_level=None)
+            other_worker.execute("BEGIN IMMEDIATE")
+            try:
+                bump = asyncio.create_task(app_state.bump_generation("agents"))
+                start_time = time.perf_counter()
+                await asyncio.sleep(0.2)
+                self.assertLess(time.perf_counter() - start_time, 1)
+                self.assertFalse(bump.done())
+            finally:
+                other_worker.execute("COMMIT")
+                other_worker.close()
+            await bump
+            self.assertEqual({"agents": 1}, await app_state.current_generations())
+            app_state.shared_state.close()
+
+    def measure(self, workers, clients=16, requests_per_client=25):
+        settings = self.settings(workers=workers, query_cache_size=0, result_cache_size=0)
+        with ServerProcess(settings) as server, self.client(server) as c:
+            response = c.post("/agents", params={"bulk": "true"}, json=travel_agents(200))
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+
+            def run_client(client_index):
+                with self.client(server) as client:
+                    for request_index in range(requests_per_client):
+                        # Distinct queries, so every request embeds and serializes
+                        response = client.get("/agents", params={
+                            "query": f"hotels in region {client_index} {request_index}", "limit": 20})
+                        self.assertEqual(HTTPStatus.OK, response.status_code)
+
+            start_time = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                list(pool.map(run_client, range(clients)))
+            return clients * requests_per_client / (time.perf_counter() - start_time)
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    @unittest.skipIf((os.cpu_count() or 1) < 2, "Scaling with worker count needs more than one CPU")
+    def test_throughput_scales_with_workers(self):
+        workers = min(os.cpu_count(), 4)
+        single_rate = self.measure(1)
+        self.data_dir.cleanup()
+        self.data_dir = tempfile.TemporaryDirectory()
+        multi_rate = self.measure(workers)
+        self.assertGreater(multi_rate, 1.3 * single_rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+from http import HTTPStatus
+import os
+import tempfile
+import time
+import unittest
+import uuid
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import numpy as np
+import yaml
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class TestPersistentStore(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.post_headers = {'Content-Type': 'application/x-yaml'}
+        cls.get_headers = {'Accept': 'application/x-yaml'}
+
+    def setUp(self):
+        self.test_yaml = """
+metadata:
+  name: financial-data-oracle
+  namespace: sandbox
+  description: |
+    Retrieves financial price data for a variety of tickers and timeframes.
+spec:
+  type: agent
+  lifecycle: experimental
+  owner: buddy@example.com
+  access_level: PRIVATE
+  category: Natural Language
+  url: https://api.example.com/financial-data-oracle
+  parameters:
+    type: object
+    properties:
+      symbol:
+        type: string
+        description: ticker symbol
+    required:
+      - symbol
+    additionalProperties: false
+  output:
+    type: float
+    description: Output description for financial-data-oracle
+        """
+
+    def test_warm_restart_keeps_agents(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            settings = Settings(storage_mode="persistent", data_dir=data_dir)
+            with TestClient(create_app(settings)) as c:
+                response = c.post("/agents", content=self.test_yaml, headers=self.post_headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                agent_id = yaml.safe_load(response.content)["metadata"]["id"]
+
+            with TestClient(create_app(settings)) as c:
+                self.assertEqual(1, c.app.state.app_state.agents_db.count())
+                self.assertEqual(1, c.app.state.app_state.ratings_db.count())
+                query = "Which agents have a category of Natural Language?"
+                response = c.get("/agents", params={"query": query}, headers=self.get_headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                agents = list(yaml.safe_load_all(response.content))
+                self.assertEqual(1, len(agents))
+                self.assertEqual(agent_id, agents[0]["metadata"]["id"])
+                self.assertIn("score", agents[0]["ratings"]["data"])
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_startup_time(self):
+        store_size = int(os.getenv("AGENTICDB_BENCHMARK_AGENTS", 100_000))
+        batch_size = 5_000
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as data_dir:
+            settings = Settings(storage_mode="persistent", data_dir=data_dir)
+            with TestClient(create_app(settings)) as c:
+                agents_db = c.app.state.app_state.agents_db
+                for start in range(0, store_size, batch_size):
+                    count = min(batch_size, store_size - start)
+                    embeddings = rng.standard_normal((count, 384)).astype(np.float32)
+                    agents_db.add(ids=[str(uuid.uuid4()) for _ in range(count)],
+                                  embeddings=embeddings.tolist(),
+                                  documents=[yaml.dump({"metadata": {"name": f"agent-{start + i}"}})
+                                             for i in range(count)])
+
+            timings = {}
+            for run in ("cold", "warm"):
+                start = time.perf_counter()
+                with TestClient(create_app(settings)) as c:
+                    app_state = c.app.state.app_state
+                    # The first query forces the HNSW index to be loaded from disk
+                    app_state.agents_db.query(query_embeddings=[[0.0] * 383 + [1.0]], n_results=1)
+                    timings[run] = time.perf_counter() - start
+                    self.assertEqual(store_size, app_state.agents_db.count())
+            print(f"{store_size} agents: cold open {timings['cold']:.2f}s, warm open {timings['warm']:.2f}s")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import re
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.profiler import PROFILE_LOCK
+from app.server import create_app
+from tests.helpers import travel_agents
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+ADMIN_TOKEN = "test-admin-token"
+
+COLLAPSED_LINE = re.compile(r"^\S.* \d+$")
+
+
+def parse_collapsed(text):
+    lines = text.splitlines()
+    for line in lines:
+        assert COLLAPSED_LINE.match(line), line
+    return [(line.rsplit(" ", 1)[0].split(";"), int(line.rsplit(" ", 1)[1])) for line in lines]
+
+
+class TestProfiler(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        cls.admin_headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+    def manifests(self, start, count):
+        return travel_agents(count, start)
+
+    def profile_under_load(self, c, **params):
+        """
+        Take a profile while agents are added and searched, and return its stacks.
+        """
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(c.get, "/admin/profile", params={"seconds": 1, **params}, headers=self.admin_headers)
+            start = 0
+            while not future.done():
+                response = c.post("/agents", json=self.manifests(start, 10), headers=self.headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                response = c.get("/agents", params={"query": f"hotels in region {start}"}, headers=self.headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                start += 10
+            response = future.result()
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        return parse_collapsed(response.text)
+
+    def test_admin_token_required(self):
+        with TestClient(create_app()) as c:
+            response = c.get("/admin/profile", params={"seconds": 0.1}, headers=self.admin_headers)
+            self.assertEqual(HTTPStatus.NOT_FOUND, response.status_code)
+        with TestClient(create_app(Settings(admin_token=ADMIN_TOKEN))) as c:
+            response = c.get("/admin/profile", params={"seconds": 0.1})
+            self.assertEqual(HTTPStatus.UNAUTHORIZED, response.status_code)
+            response = c.get("/admin/profile", params={"seconds": 0.1}, headers={"Authorization": "Bearer wrong"})
+            self.assertEqual(HTTPStatus.UNAUTHORIZED, response.status_code)
+            with PROFILE_LOCK:
+                response = c.get("/admin/profile", params={"seconds": 0.1}, headers=self.admin_headers)
+            self.assertEqual(HTTPStatus.CONFLICT, response.status_code)
+
+    def test_cpu_profile(self):
+        with TestClient(create_app(Settings(admin_token=ADMIN_TOKEN))) as c:
+            stacks = self.profile_under_load(c, mode="cpu", interval_ms=2)
+        threads = {frames[0] for frames, _ in stacks}
+        # Storage and embedding calls are sampled on the executor threads
+        self.assertTrue(any(thread.startswith("agenticdb-storage") for thread in threads), threads)
+        self.assertTrue(any("app/ingest.py" in frame for frames, _ in stacks for frame in frames))
+        self.assertNotIn("agenticdb-profiler", threads)
+
+    def test_memory_profile(self):
+        with TestClient(create_app(Settings(admin_token=ADMIN_TOKEN))) as c:
+            stacks = self.profile_under_load(c, mode="memory")
+        self.assertGreater(sum(size for _, size in stacks), 0)
+        self.assertTrue(any(frame.startswith("app/") for frames, _ in stacks for frame in frames))
+
+
+if __name__ == '__main__':
+    unittest.main()
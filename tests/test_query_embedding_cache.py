@@ -0,0 +1,108 @@
+from http import HTTPStatus
+import json
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class CountingEmbeddingFunction:
+    """
+    Wraps an embedding function and counts the texts it embeds.
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.MODEL_NAME = getattr(embedding_function, "MODEL_NAME", "counting")
+        self.embedded_texts = 0
+
+    def __call__(self, input):
+        self.embedded_texts += len(input)
+        return self.embedding_function(input)
+
+
+class TestQueryEmbeddingCache(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.post_headers = {'Content-Type': 'application/json'}
+        cls.get_headers = {'Accept': 'application/json'}
+
+    def setUp(self):
+        self.test_json = """[
+    {
+        "metadata": {
+            "name": "agent-50",
+            "namespace": "production",
+            "description": "Books hotels and flights for business travellers"
+        },
+        "spec": {
+            "type": "agent",
+            "lifecycle": "stable",
+            "owner": "owner50@business.com",
+            "access_level": "PUBLIC",
+            "category": "Travel",
+            "url": "https://api.business.com/agent-50",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "destination": {
+                        "type": "string",
+                        "description": "City to travel to"
+                    }
+                },
+                "required": [
+                    "destination"
+                ],
+                "additionalProperties": false
+            },
+            "output": {
+                "type": "object",
+                "description": "Boolean flag indicating success or failure"
+            }
+        }
+    }
+]
+        """
+
+    def test_repeated_queries_skip_embedding(self):
+        # Disable the result cache so that every search reaches the embedding step
+        with TestClient(create_app(Settings(result_cache_size=0))) as c:
+            merged_headers = {**self.post_headers, **self.get_headers}
+            response = c.post("/agents", json=json.loads(self.test_json), headers=merged_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            response = c.post("/applications", json=json.loads(self.test_json), headers=merged_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+
+            app_state = c.app.state.app_state
+            counting_function = CountingEmbeddingFunction(app_state.embedding_function)
+            app_state.embedding_function = counting_function
+
+            # Whitespace differences normalize to the same cache key
+            for query in ("Which agents can book travel?", "  Which agents can  book travel? "):
+                response = c.get("/agents", params={"query": query}, headers=self.get_headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                self.assertEqual("agent-50", response.json()[0]["metadata"]["name"])
+            # The cache is shared with the applications route
+            response = c.get("/applications", params={"query": "Which agents can book travel?"},
+                             headers=self.get_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual("agent-50", response.json()[0]["metadata"]["name"])
+
+            self.assertEqual(1, counting_function.embedded_texts)
+            stats = c.get("/cache").json()["query_embeddings"]
+            print(stats)
+            self.assertEqual(2, stats["hits"])
+            self.assertEqual(1, stats["misses"])
+            self.assertEqual(1, stats["size"])
+
+
+if __name__ == "__main__":
+    unittest.main()
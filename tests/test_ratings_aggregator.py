@@ -0,0 +1,110 @@
+import asyncio
+from http import HTTPStatus
+import os
+import tempfile
+import time
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+import yaml
+
+from app.config import Settings
+from app.ratings_store import RatingsStore
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class TestRatingsAggregator(IsolatedAsyncioTestCase):
+
+    agents = 5
+    votes = 10_000
+
+    def setUp(self):
+        self.test_yaml = """
+metadata:
+  name: financial-data-oracle
+  namespace: sandbox
+  description: |
+    Retrieves financial price data for a variety of tickers and timeframes.
+spec:
+  type: agent
+  lifecycle: experimental
+  owner: buddy@example.com
+  access_level: PRIVATE
+  category: Natural Language
+  url: https://api.example.com/financial-data-oracle
+        """
+
+    def agent_yaml(self, i):
+        # Agents are identified by namespace and name, so every agent needs its own name
+        return self.test_yaml.replace("name: financial-data-oracle", f"name: financial-data-oracle-{i}")
+
+    async def test_concurrent_votes_are_exact(self):
+        # IsolatedAsyncioTestCase runs the loop in debug mode, which records a traceback for every callback
+        asyncio.get_running_loop().set_debug(False)
+        with tempfile.TemporaryDirectory() as data_dir:
+            # Nothing is flushed while the votes come in, so the shutdown flush has to write them all
+            settings = Settings(storage_mode="persistent", data_dir=data_dir,
+                                ratings_flush_interval_seconds=3600)
+            app = create_app(settings)
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                    ratings_ids = []
+                    for i in range(self.agents):
+                        response = await client.post("/agents", content=self.agent_yaml(i),
+                                                     headers={"Content-Type": "application/x-yaml"})
+                        self.assertEqual(HTTPStatus.OK, response.status_code)
+                        ratings_ids.append(yaml.safe_load(response.content)["metadata"]["ratings_id"])
+
+                    start = time.perf_counter()
+                    responses = await asyncio.gather(*[
+                        client.post("/ratings", json={"ratings": {"id": ratings_ids[i % self.agents],
+                                                                  "data": {"score": i // self.agents % 5 + 1}}})
+                        for i in range(self.votes)
+                    ])
+                    elapsed = time.perf_counter() - start
+                    print(f"{self.votes} concurrent votes in {elapsed:.2f}s ({self.votes / elapsed:.0f} votes/s)")
+                    for response in responses:
+                        self.assertEqual(HTTPStatus.OK, response.status_code)
+
+                    # Reads see the buffered votes before they reach the store
+                    expected = {"score": 3.0, "samples": self.votes // self.agents}
+                    for ratings_id in ratings_ids:
+                        response = await client.get("/ratings", params={"ratings_id": ratings_id})
+                        self.assertEqual(expected, response.json()["data"])
+                    self.assertEqual(0, app.state.app_state.ratings_db.get(ratings_ids[:1])[ratings_ids[0]]["data"]["samples"])
+
+            store = RatingsStore(os.path.join(data_dir, "ratings.sqlite3"))
+            try:
+                for ratings_id, ratings in store.get(ratings_ids).items():
+                    self.assertEqual(expected, ratings["data"])
+            finally:
+                store.close()
+
+    async def test_votes_flush_at_threshold(self):
+        app = create_app(Settings(ratings_flush_interval_seconds=3600, ratings_flush_threshold=2))
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                ratings_ids = []
+                for i in range(2):
+                    response = await client.post("/agents", content=self.agent_yaml(i),
+                                                 headers={"Content-Type": "application/x-yaml"})
+                    ratings_ids.append(yaml.safe_load(response.content)["metadata"]["ratings_id"])
+                for ratings_id in ratings_ids:
+                    response = await client.post("/ratings", json={"ratings": {"id": ratings_id, "data": {"score": 4}}})
+                    self.assertEqual(HTTPStatus.OK, response.status_code)
+                stored = app.state.app_state.ratings_db.get(ratings_ids)
+                self.assertEqual([1, 1], [stored[ratings_id]["data"]["samples"] for ratings_id in ratings_ids])
+
+                response = await client.post("/ratings", json={"ratings": {"id": "missing", "data": {"score": 4}}})
+                self.assertEqual(HTTPStatus.NOT_FOUND, response.status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
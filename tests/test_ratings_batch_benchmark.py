@@ -0,0 +1,95 @@
+import os
+import statistics
+import time
+import unittest
+import uuid
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.routes.ratings import fetch_ratings
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class CountingCollection:
+    """
+    Wraps the ratings store and counts the round trips made through get().
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.round_trips = 0
+
+    def get(self, *args, **kwargs):
+        self.round_trips += 1
+        return self.collection.get(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def percentiles(samples):
+    cut_points = statistics.quantiles(samples, n=100, method="inclusive")
+    return cut_points[49], cut_points[98]
+
+
+class TestRatingsBatchBenchmark(IsolatedAsyncioTestCase):
+
+    iterations = 30
+
+    @staticmethod
+    def per_hit_lookup(app_state, ratings_ids):
+        ratings_by_id = {}
+        for ratings_id in ratings_ids:
+            ratings_by_id[ratings_id] = app_state.ratings_db.get([ratings_id])[ratings_id]
+        return ratings_by_id
+
+    def measure(self, app_state, lookup, ratings_ids):
+        counting_db = CountingCollection(app_state.ratings_db)
+        app_state.ratings_db = app_state.ratings_aggregator.store = counting_db
+        latencies = []
+        try:
+            for _ in range(self.iterations):
+                start = time.perf_counter()
+                ratings_by_id = lookup(app_state, ratings_ids)
+                latencies.append(time.perf_counter() - start)
+                self.assertEqual(len(ratings_ids), len(ratings_by_id))
+        finally:
+            app_state.ratings_db = app_state.ratings_aggregator.store = counting_db.collection
+        return counting_db.round_trips / self.iterations, percentiles(latencies)
+
+    def compare_lookups(self):
+        """
+        Round trips and latency percentiles of the per-hit and batched lookups, by number of hits.
+        """
+        results = []
+        with TestClient(create_app()) as c:
+            app_state = c.app.state.app_state
+            for hits in (10, 50, 200):
+                ratings_ids = [str(uuid.uuid4()) for _ in range(hits)]
+                app_state.ratings_db.add(ids=ratings_ids, parent_key="agent_id",
+                                         parent_ids=[str(uuid.uuid4()) for _ in ratings_ids])
+                results.append((hits, self.measure(app_state, self.per_hit_lookup, ratings_ids),
+                                self.measure(app_state, fetch_ratings, ratings_ids)))
+        return results
+
+    def test_batched_ratings_lookup(self):
+        for hits, (naive_trips, _), (batched_trips, _) in self.compare_lookups():
+            self.assertEqual(hits, naive_trips)
+            self.assertEqual(1, batched_trips)
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_batched_ratings_latency(self):
+        for hits, (_, (naive_p50, naive_p99)), (_, (batched_p50, batched_p99)) in self.compare_lookups():
+            print(f"{hits} hits: per-hit p50={naive_p50 * 1000:.2f}ms p99={naive_p99 * 1000:.2f}ms | "
+                  f"batched p50={batched_p50 * 1000:.2f}ms p99={batched_p99 * 1000:.2f}ms")
+            self.assertLess(batched_p50, naive_p50)
+            self.assertLess(batched_p99, naive_p99)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+from http import HTTPStatus
+import tempfile
+import unittest
+import uuid
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import chromadb
+import yaml
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class TestRatingsMigration(IsolatedAsyncioTestCase):
+
+    def test_legacy_ratings_are_migrated(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            ratings_id = str(uuid.uuid4())
+            agent_id = str(uuid.uuid4())
+            legacy_client = chromadb.PersistentClient(path=data_dir)
+            legacy_collection = legacy_client.create_collection(name="ratings")
+            legacy_collection.add(
+                ids=[ratings_id],
+                documents=[yaml.dump({"id": ratings_id, "agent_id": agent_id,
+                                      "data": {"score": 3.5, "samples": 4}}, sort_keys=False)],
+                metadatas=[{"timestamp": "2024-01-01T00:00:00.000Z"}])
+            legacy_client.clear_system_cache()
+
+            settings = Settings(storage_mode="persistent", data_dir=data_dir)
+            with TestClient(create_app(settings)) as c:
+                app_state = c.app.state.app_state
+                self.assertNotIn("ratings", [collection.name for collection in app_state.db_client.list_collections()])
+
+                response = c.get("/ratings", params={"ratings_id": ratings_id})
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                ratings = yaml.safe_load(response.content)
+                self.assertEqual(agent_id, ratings["agent_id"])
+                self.assertEqual({"score": 3.5, "samples": 4}, ratings["data"])
+
+                # New votes add to the migrated totals
+                vote = {"ratings": {"id": ratings_id, "data": {"score": 1}}}
+                response = c.post("/ratings", content=yaml.dump(vote), headers={'Content-Type': 'application/x-yaml'})
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                self.assertEqual({"score": 3.0, "samples": 5}, yaml.safe_load(response.content)["ratings"]["data"])
+
+            # The store survives a restart without migrating again
+            with TestClient(create_app(settings)) as c:
+                self.assertEqual(1, c.app.state.app_state.ratings_db.count())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+from http import HTTPStatus
+import hashlib
+import socket
+import threading
+import time
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.server import create_app
+from tests.helpers import travel_agents
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class StubEmbeddingServer:
+    """
+    OpenAI-compatible embeddings endpoint served by uvicorn on a local port. It records the size
+    of every request and the largest number of requests in flight, and answers the first
+    rate_limited requests with 429.
+    """
+
+    dimensions = 16
+
+    def __init__(self, rate_limited=0, delay_seconds=0.05):
+        self.rate_limited = rate_limited
+        self.delay_seconds = delay_seconds
+        self.batch_sizes = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        app = FastAPI()
+        app.post("/v1/embeddings")(self.embeddings)
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def embed(self, text):
+        digest = hashlib.sha256(text.encode()).digest()
+        return [byte / 255 for byte in digest[:self.dimensions]]
+
+    async def embeddings(self, request: Request):
+        body = await request.json()
+        if self.rate_limited > 0:
+            self.rate_limited -= 1
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests"}},
+                                status_code=HTTPStatus.TOO_MANY_REQUESTS, headers={"retry-after": "1"})
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_seconds)
+        finally:
+            self.in_flight -= 1
+        self.batch_sizes.append(len(body["input"]))
+        return JSONResponse({
+            "object": "list",
+            "model": body["model"],
+            "data": [{"object": "embedding", "index": index, "embedding": self.embed(text)}
+                     for index, text in enumerate(body["input"])],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+class TestRemoteEmbeddings(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def setUp(self):
+        self.manifests = travel_agents(50)
+
+    def settings(self, server, **overrides):
+        return Settings(embedding_backend="openai", embedding_api_base=server.api_base, embedding_api_key="test",
+                        embedding_batch_size=8, embedding_concurrency=2, embedding_retry_base_seconds=0.01,
+                        **overrides)
+
+    def test_batched_with_bounded_concurrency(self):
+        with StubEmbeddingServer() as server, TestClient(create_app(self.settings(server))) as c:
+            response = c.post("/agents", params={"bulk": "true"}, json=self.manifests, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual(50, response.json()["created"])
+            self.assertEqual(50, sum(server.batch_sizes))
+            self.assertTrue(all(size <= 8 for size in server.batch_sizes))
+            self.assertEqual(2, server.max_in_flight)
+
+            response = c.get("/agents", params={"query": "Books hotels and flights for business travellers "
+                                                         "in region 7", "limit": 1}, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual(1, len(response.json()))
+
+    def test_rate_limited_requests_are_retried(self):
+        with StubEmbeddingServer(rate_limited=3) as server, TestClient(create_app(self.settings(server))) as c:
+            response = c.post("/agents", json=self.manifests[:5], headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual(5, c.app.state.app_state.agents_db.count())
+            self.assertEqual(0, server.rate_limited)
+
+    def test_rate_limit_beyond_retries(self):
+        with StubEmbeddingServer(rate_limited=100) as server, \
+                TestClient(create_app(self.settings(server, embedding_max_retries=2))) as c:
+            response = c.post("/agents", json=self.manifests[:5], headers=self.headers)
+            self.assertEqual(HTTPStatus.SERVICE_UNAVAILABLE, response.status_code)
+            self.assertEqual("1", response.headers["retry-after"])
+            # One attempt and two retries
+            self.assertEqual(97, server.rate_limited)
+            self.assertEqual(0, c.app.state.app_state.agents_db.count())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+from http import HTTPStatus
+import time
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import yaml
+from fastapi.testclient import TestClient
+
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class CountingCollection:
+    """
+    Wraps a Chroma collection and counts the similarity searches run against it.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.queries = 0
+
+    def query(self, *args, **kwargs):
+        self.queries += 1
+        return self.collection.query(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class TestResultCache(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.post_headers = {'Content-Type': 'application/x-yaml'}
+        cls.get_headers = {'Accept': 'application/x-yaml'}
+
+    def setUp(self):
+        self.test_yaml = """
+metadata:
+  name: financial-data-oracle
+  namespace: sandbox
+  description: |
+    Retrieves financial price data for a variety of tickers and timeframes.
+spec:
+  type: agent
+  lifecycle: experimental
+  owner: buddy@example.com
+  access_level: PRIVATE
+  category: Natural Language
+  url: https://api.example.com/financial-data-oracle
+  parameters:
+    type: object
+    properties:
+      symbol:
+        type: string
+        description: ticker symbol
+    required:
+      - symbol
+    additionalProperties: false
+  output:
+    type: float
+    description: Output description for financial-data-oracle
+        """
+        self.query = "Which agents have a category of Natural Language?"
+
+    def search(self, client):
+        start = time.perf_counter()
+        response = client.get("/agents", params={"query": self.query}, headers=self.get_headers)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        # An empty result is a lone document separator
+        return [agent for agent in yaml.safe_load_all(response.content) if agent is not None], elapsed
+
+    def test_result_cache_invalidation(self):
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", content=self.test_yaml, headers=self.post_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            agent = yaml.safe_load(response.content)
+
+            app_state = c.app.state.app_state
+            agents_db = CountingCollection(app_state.agents_db)
+            app_state.agents_db = agents_db
+
+            agents, cold_latency = self.search(c)
+            cached_agents, hot_latency = self.search(c)
+            print(f"cold search {cold_latency * 1000:.2f}ms, cached search {hot_latency * 1000:.2f}ms")
+            self.assertEqual(agents, cached_agents)
+            self.assertEqual(1, agents_db.queries)
+
+            # Rating an agent invalidates the cached results that embed its ratings
+            ratings = {"ratings": {"id": agent["metadata"]["ratings_id"], "data": {"score": 4}}}
+            response = c.post("/ratings", content=yaml.dump(ratings), headers=self.post_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            agents, _ = self.search(c)
+            self.assertEqual(2, agents_db.queries)
+            self.assertEqual(1, agents[0]["ratings"]["data"]["samples"])
+
+            # Adding an agent invalidates the cache
+            response = c.post("/agents", content=self.test_yaml.replace("name: financial-data-oracle",
+                                                                        "name: financial-data-oracle-2"),
+                              headers=self.post_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            app_state.agents_db = agents_db = CountingCollection(app_state.agents_db)
+            agents, _ = self.search(c)
+            self.assertEqual(1, agents_db.queries)
+            self.assertEqual(2, len(agents))
+
+            # Resetting the collections invalidates the cache
+            response = c.delete("/collections")
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            agents, _ = self.search(c)
+            self.assertEqual([], agents)
+
+            stats = c.get("/cache").json()["results"]
+            self.assertEqual(1, stats["hits"])
+            self.assertEqual(4, stats["misses"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+from http import HTTPStatus
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def manifest(name, namespace, category, lifecycle, access_level, owner, kind="agent"):
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "description": f"Books hotels and flights for business travellers, {name}"
+        },
+        "spec": {
+            "type": kind,
+            "lifecycle": lifecycle,
+            "owner": owner,
+            "access_level": access_level,
+            "category": category,
+            "url": f"https://api.business.com/{name}"
+        }
+    }
+
+
+class TestSearchFilters(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        cls.query = "Which agents can book travel?"
+
+    def setUp(self):
+        self.manifests = [
+            manifest("travel-prod", "production", "Travel", "stable", "PUBLIC", "alice@business.com"),
+            manifest("travel-sandbox", "sandbox", "Travel", "experimental", "PRIVATE", "bob@business.com"),
+            manifest("finance-prod", "production", "Finance", "stable", "PRIVATE", "alice@business.com"),
+        ]
+
+    def search(self, client, path, **filters):
+        response = client.get(path, params={"query": self.query, **filters}, headers=self.headers)
+        self.assertEqual(HTTPStatus.OK, response.status_code)
+        return sorted(agent["metadata"]["name"] for agent in response.json())
+
+    def test_filtered_search(self):
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", json=self.manifests, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+
+            self.assertEqual(["finance-prod", "travel-prod", "travel-sandbox"], self.search(c, "/agents"))
+            self.assertEqual(["finance-prod", "travel-prod"], self.search(c, "/agents", namespace="production"))
+            self.assertEqual(["travel-prod", "travel-sandbox"], self.search(c, "/agents", category="Travel"))
+            self.assertEqual(["travel-sandbox"], self.search(c, "/agents", lifecycle="experimental"))
+            self.assertEqual(["finance-prod", "travel-prod"], self.search(c, "/agents", owner="alice@business.com"))
+            self.assertEqual(["finance-prod"],
+                             self.search(c, "/agents", namespace="production", access_level="PRIVATE"))
+            self.assertEqual([], self.search(c, "/agents", category="Weather"))
+
+            response = c.post("/applications", json=[manifest("charts", "production", "Finance", "dev", "PUBLIC",
+                                                              "admin@company.com", kind="application")],
+                              headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual(["charts"], self.search(c, "/applications", category="Finance"))
+            self.assertEqual([], self.search(c, "/applications", category="Travel"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+from http import HTTPStatus
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.pagination import NEXT_CURSOR_HEADER
+from app.server import create_app
+from tests.helpers import travel_agent
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class CountingCollection:
+    """
+    Wraps a Chroma collection and counts the similarity searches run against it.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.queries = 0
+
+    def query(self, *args, **kwargs):
+        self.queries += 1
+        return self.collection.query(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class TestSearchPagination(IsolatedAsyncioTestCase):
+
+    agents = 25
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        cls.query = "Which agents can book travel?"
+
+    def setUp(self):
+        self.manifests = [travel_agent(i, "agent", lifecycle="stable", owner=f"owner{i}@business.com",
+                                       access_level="PUBLIC", url=f"https://api.business.com/agent-{i}")
+                          for i in range(self.agents)]
+
+    def test_cursor_pagination(self):
+        with TestClient(create_app(Settings(result_cache_size=0))) as c:
+            response = c.post("/agents", json=self.manifests, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+
+            response = c.get("/agents", params={"query": self.query, "limit": self.agents}, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            ranked_names = [agent["metadata"]["name"] for agent in response.json()]
+            self.assertEqual(self.agents, len(ranked_names))
+            self.assertNotIn(NEXT_CURSOR_HEADER, response.headers)
+
+            app_state = c.app.state.app_state
+            agents_db = CountingCollection(app_state.agents_db)
+            app_state.agents_db = agents_db
+
+            paged_names = []
+            params = {"query": self.query, "limit": 10}
+            while True:
+                response = c.get("/agents", params=params, headers=self.headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                agents = response.json()
+                paged_names.extend(agent["metadata"]["name"] for agent in agents)
+                self.assertTrue(all("ratings" in agent for agent in agents))
+                if NEXT_CURSOR_HEADER not in response.headers:
+                    break
+                params = {"cursor": response.headers[NEXT_CURSOR_HEADER], "limit": 10}
+
+            # Later pages reuse the ranking of the first page
+            self.assertEqual(ranked_names, paged_names)
+            self.assertEqual(1, agents_db.queries)
+
+            response = c.get("/agents", params={"query": self.query, "limit": 1}, headers=self.headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual(ranked_names[:1], [agent["metadata"]["name"] for agent in response.json()])
+
+            response = c.get("/agents", params={"cursor": "unknown.10"}, headers=self.headers)
+            self.assertEqual(HTTPStatus.BAD_REQUEST, response.status_code)
+            response = c.get("/agents", params={"query": self.query, "limit": 0}, headers=self.headers)
+            self.assertEqual(HTTPStatus.UNPROCESSABLE_ENTITY, response.status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+from http import HTTPStatus
+import json
+import logging
+from pathlib import Path
+import tracemalloc
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+import yaml
+from fastapi.testclient import TestClient
+
+from app.server import create_app
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def agent_manifest(i):
+    return {
+        "metadata": {
+            "name": f"agent-{i}",
+            "namespace": "production",
+            "description": f"Réserve des hôtels et des vols pour les voyageurs d'affaires, région {i}"
+        },
+        "spec": {
+            "type": "agent",
+            "lifecycle": "stable",
+            "owner": f"owner{i}@business.com",
+            "access_level": "PUBLIC",
+            "category": "Travel",
+            "url": f"https://api.business.com/agent-{i}"
+        }
+    }
+
+
+def chunked(payload, chunk_size):
+    # Odd chunk sizes split lines and multi-byte characters across chunks
+    for start in range(0, len(payload), chunk_size):
+        yield payload[start:start + chunk_size]
+
+
+class TestStreamIngest(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ndjson_headers = {'Content-Type': 'application/x-ndjson', 'Accept': 'application/json'}
+        cls.agent_test_file = Path(__file__).resolve().parent / 'data' / 'agents.yaml'
+
+    def ndjson_payload(self, count):
+        lines = [json.dumps(agent_manifest(i), ensure_ascii=False) for i in range(count)]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def test_ndjson_stream(self):
+        payload = self.ndjson_payload(1000)
+        payload += b'{"metadata": \n[1, 2, 3]\n'
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", params={"batch_size": 100}, content=chunked(payload, 997),
+                              headers=self.ndjson_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            report = response.json()
+            print({key: value for key, value in report.items() if key != "errors"})
+            self.assertEqual(1002, report["received"])
+            self.assertEqual(1000, report["created"])
+            self.assertEqual(2, report["invalid"])
+            self.assertEqual([1000, 1001], [error["index"] for error in report["errors"]])
+
+            app_state = c.app.state.app_state
+            self.assertEqual(1000, app_state.agents_db.count())
+            self.assertEqual(1000, app_state.ratings_db.count())
+
+            response = c.get("/agents", params={"query": "Réserve des hôtels région 7"},
+                             headers={'Accept': 'application/json'})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertIn("région", response.json()[0]["metadata"]["description"])
+
+    def test_malformed_spec(self):
+        payload = self.ndjson_payload(3) + b'{"metadata": {"name": "bad-spec"}, "spec": "oops"}\n'
+        payload += b'{"metadata": {"name": "list-spec"}, "spec": ["oops"]}\n'
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", content=payload, headers=self.ndjson_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            report = response.json()
+            self.assertEqual(3, report["created"])
+            self.assertEqual(2, report["invalid"])
+            self.assertEqual([3, 4], [error["index"] for error in report["errors"]])
+
+    def test_yaml_stream(self):
+        agents_yaml = self.agent_test_file.read_bytes()
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", params={"stream": True, "batch_size": 7}, content=chunked(agents_yaml, 101),
+                              headers={'Content-Type': 'application/x-yaml', 'Accept': 'application/x-yaml'})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            report = yaml.safe_load(response.content)
+            expected = len(list(yaml.safe_load_all(agents_yaml)))
+            self.assertEqual(expected, report["created"])
+            self.assertEqual(0, report["invalid"])
+            self.assertEqual(expected, c.app.state.app_state.agents_db.count())
+
+    async def test_memory_depends_on_batch_size(self):
+        # Debug mode and the log records and warnings captured by the test runner would keep growing
+        # with the payload on their own
+        asyncio.get_running_loop().set_debug(False)
+        logging.disable(logging.INFO)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.enterContext(warnings.catch_warnings())
+        warnings.simplefilter("ignore")
+        peaks = {}
+        for count in (500, 4000):
+            payload = self.ndjson_payload(count)
+
+            async def body():
+                for chunk in chunked(payload, 64 * 1024):
+                    yield chunk
+
+            # Unlike TestClient, the ASGI transport hands the body to the app chunk by chunk
+            app = create_app()
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                    tracemalloc.start()
+                    response = await client.post("/agents", params={"batch_size": 100}, content=body(),
+                                                 headers=self.ndjson_headers)
+                    _, peaks[count] = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+            self.assertEqual(count, response.json()["created"])
+            print(f"{count} agents ({len(payload) / 1e6:.1f} MB): peak {peaks[count] / 1e6:.1f} MB")
+        # Eight times the payload, about the same peak
+        self.assertLess(peaks[4000], 1.5 * peaks[500])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+from http import HTTPStatus
+import json
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+import yaml
+from fastapi.testclient import TestClient
+
+from app.pagination import NEXT_CURSOR_HEADER
+from app.server import create_app
+from app.streaming import STREAM_CHUNK_SIZE
+from tests.helpers import travel_agent
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class TestStreamingSearch(IsolatedAsyncioTestCase):
+
+    # More than one chunk, so results are joined with their ratings chunk by chunk
+    agents = STREAM_CHUNK_SIZE + 20
+
+    @classmethod
+    def setUpClass(cls):
+        cls.post_headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        cls.query = "Which agents can book travel?"
+
+    def setUp(self):
+        self.manifests = [travel_agent(i, "agent", lifecycle="stable", owner=f"owner{i}@business.com",
+                                       access_level="PUBLIC", url=f"https://api.business.com/agent-{i}")
+                          for i in range(self.agents)]
+
+    def test_streamed_results_match_buffered_results(self):
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", json=self.manifests, headers=self.post_headers)
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            params = {"query": self.query, "limit": self.agents}
+
+            response = c.get("/agents", params=params, headers={'Accept': 'application/json'})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            buffered = response.json()
+            self.assertEqual(self.agents, len(buffered))
+
+            response = c.get("/agents", params=params, headers={'Accept': 'application/x-ndjson'})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+            self.assertNotIn("content-length", response.headers)
+            streamed = [json.loads(line) for line in response.text.splitlines()]
+            self.assertEqual(buffered, streamed)
+
+            response = c.get("/agents", params={**params, "stream": True}, headers={'Accept': 'application/x-yaml'})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertNotIn("content-length", response.headers)
+            self.assertEqual(buffered, list(yaml.safe_load_all(response.text)))
+
+            # The non-streamed YAML response carries the same documents
+            response = c.get("/agents", params=params, headers={'Accept': 'application/x-yaml'})
+            self.assertEqual(buffered, list(yaml.safe_load_all(response.text)))
+
+            # Streamed pages hand out cursors like buffered ones, paging through the first page's ranking
+            candidates = c.app.state.app_state.settings.search_candidates
+            response = c.get("/agents", params={"query": self.query, "limit": candidates},
+                             headers={'Accept': 'application/json'})
+            ranked = response.json()
+            response = c.get("/agents", params={"query": self.query, "limit": 50},
+                             headers={'Accept': 'application/x-ndjson'})
+            paged = [json.loads(line) for line in response.text.splitlines()]
+            self.assertEqual(50, len(paged))
+            response = c.get("/agents", params={"cursor": response.headers[NEXT_CURSOR_HEADER], "limit": candidates},
+                             headers={'Accept': 'application/x-ndjson'})
+            paged.extend(json.loads(line) for line in response.text.splitlines())
+            self.assertEqual(ranked, paged)
+
+
+if __name__ == "__main__":
+    unittest.main()
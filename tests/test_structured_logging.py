@@ -0,0 +1,117 @@
+import io
+import json
+import logging
+import threading
+import time
+import unittest
+import warnings
+from http import HTTPStatus
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.logs import configure_logging, parse_sample_rates, shutdown_logging
+from app.server import create_app
+from tests.helpers import travel_agents
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+class SlowStream(io.StringIO):
+
+    def write(self, text):
+        time.sleep(0.05)
+        return super().write(text)
+
+
+class ThreadRecorder:
+    """
+    Log argument remembering the threads it was formatted on.
+    """
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return "recorded"
+
+
+class TestStructuredLogging(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def setUp(self):
+        self.manifests = travel_agents(3)
+
+    def serve(self, settings):
+        """
+        Add and search agents and applications, and return what was logged.
+        """
+        stream = io.StringIO()
+        with patch("sys.stderr", stream), TestClient(create_app(settings)) as c:
+            for path in ("/agents", "/applications"):
+                response = c.post(path, json=self.manifests, headers=self.headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                response = c.get(path, params={"query": "hotels"}, headers=self.headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+            response = c.get("/agents", params={"query": "hotels"}, headers={"Accept": "application/x-yaml"})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            response = c.get("/agents", params={"query": "hotels"}, headers={"Accept": "text/html"})
+            self.assertEqual(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, response.status_code)
+        return stream.getvalue()
+
+    def test_text_lines_carry_route(self):
+        output = self.serve(Settings())
+        self.assertIn("Request for YAML response received route=/agents", output)
+        self.assertIn("Similarity search query executed successfully for applications route=/applications", output)
+        self.assertRegex(output, r"Similarity search query executed successfully for agents route=/agents "
+                                 r"results=3 limit=10")
+
+    def test_sampled_route(self):
+        output = self.serve(Settings(log_sample_rates="/agents=0"))
+        self.assertNotIn("for agents", output)
+        self.assertIn("Similarity search query executed successfully for applications", output)
+        # Errors and records outside requests are always kept
+        self.assertIn("ERROR - Unsupported Content-Type route=/agents", output)
+        self.assertIn("App state initialized successfully", output)
+
+    def test_json_format(self):
+        output = self.serve(Settings(log_format="json", log_sample_default=0))
+        entries = [json.loads(line) for line in output.splitlines()]
+        self.assertIn({"route": "/agents", "level": "ERROR", "message": "Unsupported Content-Type"},
+                      [{key: entry.get(key) for key in ("route", "level", "message")} for entry in entries])
+        self.assertEqual([], [entry for entry in entries if entry["level"] == "INFO" and "route" in entry])
+
+    def test_parse_sample_rates(self):
+        self.assertEqual({"/agents": 0.01, "/ratings": 1.0}, parse_sample_rates(" /agents=0.01, /ratings=1 "))
+        with self.assertRaises(ValueError):
+            parse_sample_rates("/agents=2")
+
+    def test_formatting_and_io_leave_the_caller(self):
+        stream = SlowStream()
+        recorder = ThreadRecorder()
+        # Without the capturing handlers of the test runner, which format on the calling thread
+        with patch("sys.stderr", stream), patch.object(logging.getLogger(), "handlers", []):
+            self.assertTrue(configure_logging(Settings()))
+            try:
+                self.assertFalse(configure_logging(Settings()))
+                start_time = time.perf_counter()
+                for _ in range(20):
+                    logging.info("Value: %s", recorder)
+                elapsed = time.perf_counter() - start_time
+            finally:
+                shutdown_logging()
+        # Writing the lines takes a second, logging them does not wait for it
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(20, stream.getvalue().count("Value: recorded"))
+        self.assertNotIn(threading.current_thread().name, recorder.threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import warnings
+from http import HTTPStatus
+from unittest import IsolatedAsyncioTestCase
+
+import yaml
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.metrics import StageHistogram
+from app.server import create_app
+from tests.helpers import travel_agents
+
+# Suppress DeprecationWarnings
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_SPAN_ID = "00f067aa0ba902b7"
+
+
+def timing_names(response):
+    return {metric.split(";")[0] for metric in response.headers["server-timing"].split(", ")}
+
+
+class TestTracing(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+
+    def setUp(self):
+        self.manifests = travel_agents(3)
+
+    def test_timing_header_is_opt_in(self):
+        with TestClient(create_app()) as c:
+            response = c.post("/agents", json=self.manifests, headers={**self.headers, "X-Timing": "1"})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertNotIn("server-timing", response.headers)
+
+        with TestClient(create_app(Settings(timing_header=True))) as c:
+            response = c.post("/agents", json=self.manifests, headers={**self.headers, "X-Timing": "1"})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual({"parse", "write_batch", "embed", "storage_write", "total"}, timing_names(response))
+
+            response = c.post("/agents", json=self.manifests, headers=self.headers)
+            self.assertNotIn("server-timing", response.headers)
+
+            response = c.get("/agents", params={"query": "hotels"}, headers={**self.headers, "X-Timing": "1"})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual({"search", "embed", "vector_query", "ratings_join", "serialize", "total"},
+                             timing_names(response))
+
+            ratings_id = response.json()[0]["ratings"]["id"]
+            response = c.post("/ratings", content=yaml.dump({"ratings": {"id": ratings_id, "data": {"score": 5}}}),
+                              headers={"Content-Type": "application/x-yaml", "X-Timing": "1"})
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual({"parse", "add_vote", "total"}, timing_names(response))
+
+    def test_spans_exported_to_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spans.jsonl")
+            with TestClient(create_app(Settings(trace_sample_rate=1.0, trace_export_path=path))) as c:
+                response = c.post("/agents", json=self.manifests, headers=self.headers)
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                response = c.get("/agents", params={"query": "hotels"},
+                                 headers={**self.headers, "traceparent": f"00-{TRACE_ID}-{PARENT_SPAN_ID}-01"})
+                self.assertEqual(HTTPStatus.OK, response.status_code)
+                self.assertNotIn("server-timing", response.headers)
+            # Spans still queued are exported when the app shuts down
+            with open(path) as file:
+                spans = [span for line in file for resource_spans in json.loads(line)["resourceSpans"]
+                         for scope_spans in resource_spans["scopeSpans"] for span in scope_spans["spans"]]
+
+        search_spans = {span["name"]: span for span in spans if span["traceId"] == TRACE_ID}
+        root = search_spans["GET /agents"]
+        self.assertEqual(PARENT_SPAN_ID, root["parentSpanId"])
+        self.assertEqual(2, root["kind"])
+        attributes = {attribute["key"]: attribute["value"] for attribute in root["attributes"]}
+        self.assertEqual({"stringValue": "/agents"}, attributes["http.route"])
+        self.assertEqual({"intValue": "200"}, attributes["http.status_code"])
+        # Stages run on executor threads are children of the span that started them
+        self.assertEqual(root["spanId"], search_spans["search"]["parentSpanId"])
+        self.assertEqual(search_spans["search"]["spanId"], search_spans["embed"]["parentSpanId"])
+        self.assertEqual(search_spans["search"]["spanId"], search_spans["vector_query"]["parentSpanId"])
+        for span in search_spans.values():
+            self.assertLessEqual(int(root["startTimeUnixNano"]), int(span["startTimeUnixNano"]))
+            self.assertLessEqual(int(span["endTimeUnixNano"]), int(root["endTimeUnixNano"]))
+        self.assertIn("POST /agents", [span["name"] for span in spans if span["traceId"] != TRACE_ID])
+
+    @unittest.skipUnless(os.getenv("AGENTICDB_RUN_BENCHMARKS"), "set AGENTICDB_RUN_BENCHMARKS=1 to run")
+    def test_untraced_stage_overhead(self):
+        histogram = StageHistogram("parse")
+        iterations = 100000
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            with histogram.time():
+                pass
+        microseconds = (time.perf_counter() - start_time) / iterations * 1e6
+        self.assertLess(microseconds, 10, f"Timing an untraced stage costs {microseconds:.2f}us")
+
+
+if __name__ == '__main__':
+    unittest.main()